@@ -0,0 +1,154 @@
+"""
+This module evaluates the classifiers with stratified k-fold cross validation.
+All the instances of a data set (training and validation) are split in folds with the same proportion of each class,
+shuffled with a seed, so the folds are reproducible. Each fold is classified with a model trained with the other folds,
+and the confusion matrix of each fold is returned, to be evaluated with Evaluator.evaluate_cross_validation.
+
+The folds run concurrently in a pool of processes. The instances are parsed only once, and the worker processes
+receive them when they start: with the 'fork' start method (the default in Linux) they share the memory of the
+parent process, without copying it.
+"""
+
+import multiprocessing
+import kdtree
+import numpy
+import Evaluator
+import KNN
+import KNNBallTree
+import KNNForest
+import KNNIndex
+import KNNPacked
+import KNNParser
+import NaiveBayes
+import NBParser
+
+
+# Default number of folds.
+cross_validation_folds = 10
+
+# Default seed used for shuffling the instances of each class before splitting them in folds.
+cross_validation_seed = 0
+
+
+# Splits the instances in stratified folds: the instances of each class are shuffled and dealt to the folds in turn,
+# continuing with the next fold when the class changes, so all the folds have almost the same size.
+# - 'labels' is a sequence with the class label of each instance.
+# Returns an array with the fold number (from 0 to folds_number - 1) of each instance.
+def cross_validation_stratified_folds(labels, folds_number, seed=cross_validation_seed):
+    labels = numpy.asarray(labels)
+    generator = numpy.random.default_rng(seed)
+    folds = numpy.empty(len(labels), dtype=numpy.int64)
+    dealt = 0
+    for label in numpy.unique(labels):
+        rows = generator.permutation(numpy.flatnonzero(labels == label))
+        folds[rows] = (dealt + numpy.arange(len(rows))) % folds_number
+        dealt += len(rows)
+    return folds
+
+
+# Classifies one fold with KNN, trained with the other folds.
+# Returns a dictionary: k -> confusion matrix of the fold.
+def __cross_validation_knn_fold(fold, features, labels, folds, k_values, classes, engine, trees, distance, weights,
+                                binary_columns):
+    training, test = folds != fold, folds == fold
+    training_features, training_labels = features[training], labels[training]
+    if engine == 'kdtree':
+        k_d_tree = kdtree.create([KNNParser.KNNPoint(instance, row_id)
+                                  for row_id, instance in enumerate(training_features.tolist())])
+        class_label = training_labels
+    elif engine == 'index':
+        k_d_tree = KNNIndex.knn_index_build(training_features, training_labels)
+        class_label = k_d_tree['labels']
+    elif engine == 'balltree':
+        k_d_tree = KNNBallTree.knn_ball_tree_build(training_features, training_labels, distance, weights)
+        class_label = k_d_tree['labels']
+    elif engine == 'forest':
+        k_d_tree = KNNForest.knn_forest_build(training_features, training_labels, trees)
+        class_label = k_d_tree['labels']
+    elif engine == 'packed':
+        k_d_tree = KNNPacked.knn_packed_build(training_features, training_labels, binary_columns)
+        class_label = k_d_tree['labels']
+    else:
+        k_d_tree, class_label = training_features, training_labels
+    instances = list(zip(map(tuple, features[test].tolist()), labels[test].tolist()))
+    classifications = KNN.knn_classify_instance_set_sweep(instances, k_values, k_d_tree, class_label, classes, engine)
+    return {k: Evaluator.evaluate_confusion_matrix(classifications[k], classes) for k in k_values}
+
+
+# Classifies one fold with Naive Bayes, trained with the other folds. The probability of each class is its proportion
+# in the training folds.
+# Returns the confusion matrix of the fold.
+def __cross_validation_naive_bayes_fold(fold, matrix, labels, folds, classes_labels, schema):
+    training, test = folds != fold, folds == fold
+    distributions = NBParser.naive_bayes_train_matrix(matrix[training], labels[training], schema)
+    counts = numpy.bincount(labels[training], minlength=len(classes_labels))
+    classes_distributions = {label: count / counts.sum() for label, count in zip(classes_labels, counts.tolist())}
+    model = NaiveBayes.naive_bayes_compile_model(classes_distributions, distributions, classes_labels)
+    guesses = NaiveBayes.naive_bayes_classify_matrix(model, matrix[test])
+    classification = [(classes_labels[label], classes_labels[guess])
+                      for label, guess in zip(labels[test].tolist(), guesses.tolist())]
+    return Evaluator.evaluate_confusion_matrix(classification, classes_labels)
+
+
+# Function that classifies a fold and its parameters (other than the fold number), in the worker processes:
+# (fold function, parameters). It is set once per worker when the pool is created, so the instances aren't sent with
+# every fold.
+__cross_validation_worker_state = None
+
+
+def __cross_validation_initialize_worker(fold_function, parameters):
+    global __cross_validation_worker_state
+    __cross_validation_worker_state = (fold_function, parameters)
+
+
+def __cross_validation_run_fold(fold):
+    fold_function, parameters = __cross_validation_worker_state
+    return fold_function(fold, *parameters)
+
+
+# Runs 'fold_function' for each fold, in 'workers' processes. Returns the list of results, in fold order.
+def __cross_validation_run_folds(fold_function, parameters, folds_number, workers):
+    if workers <= 1 or folds_number < 2:
+        return [fold_function(fold, *parameters) for fold in range(folds_number)]
+    with multiprocessing.Pool(min(workers, folds_number), __cross_validation_initialize_worker,
+                              (fold_function, parameters)) as pool:
+        return pool.map(__cross_validation_run_fold, range(folds_number))
+
+
+# Cross validation of KNN.
+# - 'features' is a matrix with one instance (without class label) per row, as loaded by KNNParser.knn_load_data_set.
+# - 'labels' is an array with the class label of each row.
+# - 'k_values' is a list with the numbers of neighbours considered. The neighbours are searched once for all of them.
+# - 'classes' is a list with all class labels.
+# - 'engine' is the name of the search engine, one of KNN.knn_engines.
+# - 'workers' is the number of processes that classify the folds.
+# - 'trees' is the number of trees of the forest of the 'forest' engine.
+# - 'distance' and 'weights' are the distance and the weights of the attributes of the 'balltree' engine (see
+# KNNBallTree.knn_ball_tree_build).
+# - 'binary_columns' is the list of columns with binary attributes of the 'packed' engine (see
+# KNNPacked.knn_packed_build).
+# Returns a dictionary: k -> list with the confusion matrix of each fold.
+def cross_validation_knn(features, labels, k_values, classes, folds_number=cross_validation_folds,
+                         seed=cross_validation_seed, engine='kdtree', workers=1, trees=KNNForest.knn_forest_trees,
+                         distance='euclidean', weights=None, binary_columns=()):
+    folds = cross_validation_stratified_folds(labels, folds_number, seed)
+    results = __cross_validation_run_folds(__cross_validation_knn_fold,
+                                           (features, labels, folds, list(k_values), classes, engine, trees,
+                                            distance, weights, binary_columns),
+                                           folds_number, workers)
+    return {k: [result[k] for result in results] for k in k_values}
+
+
+# Cross validation of Naive Bayes.
+# - 'matrix' is a matrix with one instance (without class label) per row, as loaded by
+# NBParser.naive_bayes_load_data_set.
+# - 'labels' is an array with the class number (position in 'classes_labels') of each row.
+# - 'classes_labels' is a list with all class labels.
+# - 'schema' is the schema of the data set (see Schema), which tells the categorical attributes.
+# - 'workers' is the number of processes that classify the folds.
+# Returns a list with the confusion matrix of each fold.
+def cross_validation_naive_bayes(matrix, labels, classes_labels, schema, folds_number=cross_validation_folds,
+                                 seed=cross_validation_seed, workers=1):
+    folds = cross_validation_stratified_folds(labels, folds_number, seed)
+    return __cross_validation_run_folds(__cross_validation_naive_bayes_fold,
+                                        (matrix, labels, folds, classes_labels, schema), folds_number, workers)
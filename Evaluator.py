@@ -6,164 +6,421 @@ For each class, it evaluates the following metrics:
 + fall-off
 + f-measure
 It also computes the Macro and Micro of the previous metrics.
+The counting and the metrics are computed with arrays: the confusion matrix is built with a single bincount and the
+metrics of all the classes are computed at once from it. Writing the report is done separately.
+Predictions can also be evaluated incrementally, as they are produced, keeping only the confusion matrix in memory.
+Besides the text report, the metrics can be saved in a machine readable format (json or csv), together with the
+timings of the run.
+The confusion matrices of the folds of a cross validation are evaluated together, reporting the mean and the standard
+deviation of each metric over the folds.
 """
 
+import csv
+import json
+import numpy
+import time
+import Instrumentation
+import Utils
+
+
+# Number of predictions added together to the confusion matrix by evaluate_classifier_stream.
+evaluator_batch_size = 4096
+
+
+# Builds the confusion matrix of a classification.
+# - 'classification' is a list of tuples (true_class, classified_class).
+# - 'classes' is a list with all the possible class labels.
+# Returns a matrix where confusion_matrix[i][j] is the number of instances of class classes[j] classified as
+# class classes[i].
+def evaluate_confusion_matrix(classification, classes):
+    classes_number = len(classes)
+    if len(classification) == 0:
+        return numpy.zeros((classes_number, classes_number), dtype=numpy.int64)
+    with Instrumentation.instrumentation_stage('evaluate_confusion_matrix', len(classification)):
+        pairs = numpy.asarray(classification)
+        true_classes = __evaluate_class_numbers(pairs[:, 0], classes)
+        classified_classes = __evaluate_class_numbers(pairs[:, 1], classes)
+        # Encode each pair (classified class, true class) as a single number and count them all at once.
+        counts = numpy.bincount(classified_classes * classes_number + true_classes, minlength=classes_number ** 2)
+    return counts.reshape(classes_number, classes_number)
+
+
+# Returns an array with the position in 'classes' of each label in 'labels'.
+def __evaluate_class_numbers(labels, classes):
+    classes_array = numpy.asarray(classes)
+    sorter = numpy.argsort(classes_array, kind='stable')
+    positions = numpy.searchsorted(classes_array, labels.astype(classes_array.dtype), sorter=sorter)
+    positions = numpy.minimum(positions, len(classes_array) - 1)
+    class_numbers = sorter[positions]
+    if not numpy.array_equal(classes_array[class_numbers], labels):
+        raise Exception('Evaluator.evaluate_confusion_matrix: a class label is not in the list of classes')
+    return class_numbers
+
+
+# Computes the metrics of a classifier from its confusion matrix (as returned by evaluate_confusion_matrix).
+# Returns a dictionary with:
+#       + 'true_positives', 'false_positives', 'false_negatives', 'true_negatives', 'precision', 'recall',
+#       'fall_out', 'f_measure': arrays with the value of the metric for each class.
+#       + 'instances': array with the number of instances of each class.
+#       + 'macro', 'micro': dictionaries metric name -> value, for 'precision', 'recall', 'fall_out' and 'f_measure'.
+#       + 'accuracy': the proportion of instances correctly classified.
+#       + 'confusion_matrix': the confusion matrix.
+# The micro measures are the averages of the metrics of each class, weighted by the number of instances of the class.
+def evaluate_metrics(confusion_matrix):
+    confusion_matrix = numpy.asarray(confusion_matrix, dtype=numpy.int64)
+    instances_number = int(confusion_matrix.sum())
+    true_positives = numpy.diagonal(confusion_matrix).copy()
+    false_positives = confusion_matrix.sum(axis=1) - true_positives
+    false_negatives = confusion_matrix.sum(axis=0) - true_positives
+    true_negatives = instances_number - true_positives - false_positives - false_negatives
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        precision = numpy.where(true_positives == 0, 0.0, true_positives / (true_positives + false_positives))
+        recall = numpy.where(true_positives == 0, 0.0, true_positives / (true_positives + false_negatives))
+        fall_out = numpy.where(false_positives == 0, 0.0, false_positives / (false_positives + true_negatives))
+        f_measure = numpy.where((precision == 0) | (recall == 0), 0.0, 1 / ((0.5 / precision) + (0.5 / recall)))
+    metrics = {
+        'true_positives': true_positives,
+        'false_positives': false_positives,
+        'false_negatives': false_negatives,
+        'true_negatives': true_negatives,
+        'precision': precision,
+        'recall': recall,
+        'fall_out': fall_out,
+        'f_measure': f_measure,
+        'instances': confusion_matrix.sum(axis=0),
+        'macro': {},
+        'micro': {},
+        'accuracy': int(true_positives.sum()) / instances_number if instances_number > 0 else 0.0,
+        'confusion_matrix': confusion_matrix,
+    }
+    # The sums are done in class order, so the results don't depend on how numpy groups the additions.
+    instances = metrics['instances'].tolist()
+    for name in ['precision', 'recall', 'fall_out', 'f_measure']:
+        values = metrics[name].tolist()
+        metrics['macro'][name] = sum(values) / len(values)
+        metrics['micro'][name] = sum(amount * value for amount, value in zip(instances, values)) / instances_number
+    return metrics
+
+
+# Returns the lines of the report with the confusion matrix.
+def __confusion_matrix_lines(confusion_matrix, classes):
+    spaces = 16
+    cell = '%{spaces}s'.format(spaces=spaces)
+    number_cell = '%{spaces}d'.format(spaces=spaces)
+    lines = ['Confusion Matrix', ' '*(spaces + 4) + 'Actual class', ' '*spaces + ''.join(cell % c for c in classes)]
+    for c1, row in zip(classes, confusion_matrix.tolist()):
+        lines.append(cell % c1 + ''.join(number_cell % value for value in row))
+    lines.append('')
+    for row in confusion_matrix.tolist():
+        lines.append(''.join(number_cell % value for value in row))
+    lines.append('')
+    return lines
+
+
+# Writes the confusion matrix and the metrics to a given file's path.
+def __write_report(confusion_matrix, metrics, classes, file_path):
+    lines = __confusion_matrix_lines(confusion_matrix, classes)
+
+    lines += ['Metrics for a given class', 'True Positives', 'False Positives', 'False Negatives', 'True Negatives',
+              'Precision', 'Recall', 'Fall-out', 'F-Measure', '']
+    columns = [metrics[name].tolist() for name in ['true_positives', 'false_positives', 'false_negatives',
+                                                   'true_negatives', 'precision', 'recall', 'fall_out', 'f_measure']]
+    for c, values in zip(classes, zip(*columns)):
+        lines.append('Metrics for class {c} classification'.format(c=c))
+        # A F-Measure of zero has always been written as the integer 0.
+        values = values[:-1] + (0 if values[-1] == 0 else values[-1],)
+        lines += ['{val}'.format(val=value) for value in values]
+        lines += ['', '']
+
+    for title, measures in [('Macro measures', metrics['macro']), ('Micro measures', metrics['micro'])]:
+        lines += [title, 'Precision', 'Recall', 'Fall-out', 'F-Measure']
+        lines += ['{val}'.format(val=measures[name]) for name in ['precision', 'recall', 'fall_out', 'f_measure']]
+        lines += ['', '']
+    lines[-1:] = []
+
+    with open(file_path, 'w') as output:
+        output.write('\n'.join(lines) + '\n')
+
+
+# Names of the metrics computed for each class, in the order they are saved.
+__class_metrics_names = ['instances', 'true_positives', 'false_positives', 'false_negatives', 'true_negatives',
+                         'precision', 'recall', 'fall_out', 'f_measure']
+
+
+# Saves the metrics in a machine readable format, chosen by the extension of 'file_path':
+# + '.json': a json object with the classes, the confusion matrix (rows are classified classes and columns are actual
+# classes, as in the text report), the metrics of each class, the macro and micro measures, the accuracy and the
+# timings.
+# + '.csv': a table with the columns scope, class, metric and value. The confusion matrix is saved in the rows with
+# scope 'confusion_matrix', where class is the classified class and metric is the actual class.
+# - 'timings' is a dictionary: timing name -> seconds, for instance 'load_seconds', 'index_build_seconds' and
+# 'classify_seconds'. If 'classify_seconds' is present, the throughput (rows classified per second) is added.
+def evaluate_save_metrics(metrics, classes, file_path, timings=None):
+    timings = dict(timings or {})
+    instances_number = int(metrics['instances'].sum())
+    if timings.get('classify_seconds'):
+        timings['throughput_rows_per_second'] = instances_number / timings['classify_seconds']
+    per_class = {}
+    for position, c in enumerate(classes):
+        per_class[str(c)] = {name: metrics[name][position].item() for name in __class_metrics_names}
+
+    if file_path.endswith('.csv'):
+        with open(file_path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(['scope', 'class', 'metric', 'value'])
+            for c1, row in zip(classes, metrics['confusion_matrix'].tolist()):
+                for c2, value in zip(classes, row):
+                    writer.writerow(['confusion_matrix', c1, c2, value])
+            for c in per_class:
+                for name, value in per_class[c].items():
+                    writer.writerow(['class', c, name, value])
+            for scope in ['macro', 'micro']:
+                for name, value in metrics[scope].items():
+                    writer.writerow([scope, '', name, value])
+            writer.writerow(['global', '', 'instances', instances_number])
+            writer.writerow(['global', '', 'accuracy', metrics['accuracy']])
+            for name, value in timings.items():
+                writer.writerow(['timing', '', name, value])
+    elif file_path.endswith('.json'):
+        with open(file_path, 'w') as output:
+            json.dump({
+                'classes': [str(c) for c in classes],
+                'instances': instances_number,
+                'confusion_matrix': metrics['confusion_matrix'].tolist(),
+                'per_class': per_class,
+                'macro': metrics['macro'],
+                'micro': metrics['micro'],
+                'accuracy': metrics['accuracy'],
+                'timings': timings,
+            }, output, indent=2)
+    else:
+        raise Exception('Evaluator.evaluate_save_metrics: the file extension should be .json or .csv')
+
 
 # This function evaluates a given classifier's metrics: true positives, true negatives, false positives,
 # false negatives, precision, recall, fall-out and F-measure.
 # It saves the metrics and the confusion matrix to a given file's path.
 # - 'classification' is a list of tuples (true_class, classified_class).
 # - 'classes' is a list with all the possible class labels.
-# - 'instances_number' is the number of instances in 'instances'.
 # - 'file_path' is the route to the file for saving the evaluation metrics.
-def evaluate_classifier(classification, classes, file_path):
-    # Dictionary of dictionaries: confusion_matrix[class] has a dictionary
-    # with the instance number of each class.
-    # confusion_matrix[class_i][class_j] is the number of instances from
-    # class_i classified as class_j.
-    confusion_matrix = {}
-    # Initialize confusion_matrix
-    for c1 in classes:
-        confusion_matrix[c1] = {}
-        for c2 in classes:
-            confusion_matrix[c1][c2] = 0
-
-    # Amount of examples of each class
-    amount_instances = {}
-    for c in classes:
-        amount_instances[c] = 0
-
-    for c in classification:
-        amount_instances[c[0]] += 1
-
-    for true_class, classified_class in classification:
-        confusion_matrix[classified_class][true_class] += 1
-
-    precision_macro, recall_macro, fall_out_macro, f_measure_macro = 0, 0, 0, 0
-    precision_micro, recall_micro, fall_out_micro, f_measure_micro = 0, 0, 0, 0
-    with open(file_path, 'w') as output:
-        spaces = 16
-        output.write('Confusion Matrix\n')
-        output.write(' '*(spaces + 4) + 'Actual class\n')
-        output.write(' '*spaces)
-        for c in classes:
-            output.write('%{spaces}s'.format(spaces=spaces) % c)
-        output.write('\n')
-        for c1 in classes:
-            output.write('%{spaces}s'.format(spaces=spaces) % c1)
-            for c2 in classes:
-                output.write('%{spaces}d'.format(spaces=spaces) % confusion_matrix[c1][c2])
-            output.write('\n')
-
-        output.write('\n')
-        for c1 in classes:
-            for c2 in classes:
-                output.write('%{spaces}d'.format(spaces=spaces) % confusion_matrix[c1][c2])
-            output.write('\n')
-
-        output.write('\n')
-
-        output.write('Metrics for a given class\n')
-        output.write('True Positives\n')
-        output.write('False Positives\n')
-        output.write('False Negatives\n')
-        output.write('True Negatives\n')
-        output.write('Precision\n')
-        output.write('Recall\n')
-        output.write('Fall-out\n')
-        output.write('F-Measure\n')
-
-        output.write('\n')
-        for c in classes:
-            output.write('Metrics for class {c} classification\n'.format(c=c))
-
-            true_positives = confusion_matrix[c][c]
-            output.write('{val}\n'.format(val=true_positives))
-
-            false_positives, false_negatives = 0, 0
-            for c2 in classes:
-                if c != c2:
-                    false_positives += confusion_matrix[c][c2]
-                    false_negatives += confusion_matrix[c2][c]
-            output.write('{val}\n'.format(val=false_positives))
-            output.write('{val}\n'.format(val=false_negatives))
-
-            true_negatives = 0
-            for c1 in classes:
-                for c2 in classes:
-                    if c1 != c and c2 != c:
-                        true_negatives += confusion_matrix[c1][c2]
-            output.write('{val}\n'.format(val=true_negatives))
-
-            if true_positives == 0:
-                precision = 0.0
-            else:
-                precision = true_positives / (true_positives+false_positives)
-            output.write('{val}\n'.format(val=precision))
-
-            if true_positives == 0:
-                recall = 0.0
-            else:
-                recall = true_positives / (true_positives+false_negatives)
-            output.write('{val}\n'.format(val=recall))
-
-            if false_positives == 0:
-                fall_out = 0.0
-            else:
-                fall_out = false_positives / (false_positives+true_negatives)
-            output.write('{val}\n'.format(val=fall_out))
-
-            if precision == 0 or recall == 0:
-                f_measure = 0
-            else:
-                f_measure = 1 / ((0.5 / precision) + (0.5 / recall))
-            output.write('{val}\n'.format(val=f_measure))
-
-            precision_macro += precision
-            recall_macro += recall
-            fall_out_macro += fall_out
-            f_measure_macro += f_measure
-
-            precision_micro += amount_instances[c]*precision
-            recall_micro += amount_instances[c]*recall
-            fall_out_micro += amount_instances[c]*fall_out
-            f_measure_micro += amount_instances[c]*f_measure
-
-            output.write('\n\n')
-
-        class_number = len(classes)
-
-        precision_macro /= class_number
-        recall_macro /= class_number
-        fall_out_macro /= class_number
-        f_measure_macro /= class_number
-
-        instances_number = len(classification)
-        precision_micro /= instances_number
-        recall_micro /= instances_number
-        fall_out_micro /= instances_number
-        f_measure_micro /= instances_number
-
-        output.write('Macro measures\n')
-        output.write('Precision\n')
-        output.write('Recall\n')
-        output.write('Fall-out\n')
-        output.write('F-Measure\n')
-        output.write('{val}\n'.format(val=precision_macro))
-        output.write('{val}\n'.format(val=recall_macro))
-        output.write('{val}\n'.format(val=fall_out_macro))
-        output.write('{val}\n'.format(val=f_measure_macro))
-
-        output.write('\n\n')
-
-        output.write('Micro measures\n')
-        output.write('Precision\n')
-        output.write('Recall\n')
-        output.write('Fall-out\n')
-        output.write('F-Measure\n')
-        output.write('{val}\n'.format(val=precision_micro))
-        output.write('{val}\n'.format(val=recall_micro))
-        output.write('{val}\n'.format(val=fall_out_micro))
-        output.write('{val}\n'.format(val=f_measure_micro))
-
-        output.write('\n')
+# - 'metrics_file_path', if given, is the route to a json or csv file where the metrics are also saved, together with
+# 'timings' (see evaluate_save_metrics).
+# Returns the metrics, as computed by evaluate_metrics.
+def evaluate_classifier(classification, classes, file_path, metrics_file_path=None, timings=None):
+    confusion_matrix = evaluate_confusion_matrix(classification, classes)
+    metrics = evaluate_metrics(confusion_matrix)
+    with Instrumentation.instrumentation_stage('evaluate_report'):
+        __write_report(confusion_matrix, metrics, classes, file_path)
+        if metrics_file_path is not None:
+            evaluate_save_metrics(metrics, classes, metrics_file_path, timings)
+    return metrics
+
+
+# Creates the state of an incremental evaluation, to which predictions are added with evaluate_stream_update.
+# The state is a dictionary with the list of classes and the confusion matrix of the predictions added so far.
+def evaluate_stream_start(classes):
+    return {'classes': list(classes), 'confusion_matrix': numpy.zeros((len(classes), len(classes)), dtype=numpy.int64)}
+
+
+# Adds a batch of predictions to an incremental evaluation.
+# - 'classification' is a list of tuples (true_class, classified_class).
+def evaluate_stream_update(state, classification):
+    state['confusion_matrix'] += evaluate_confusion_matrix(classification, state['classes'])
+
+
+# Returns the metrics (as computed by evaluate_metrics) of the predictions added so far to an incremental evaluation.
+def evaluate_stream_metrics(state):
+    return evaluate_metrics(state['confusion_matrix'])
+
+
+# Prints the interim metrics of an incremental evaluation.
+def __print_interim_metrics(instances_number, metrics):
+    print('Instancias evaluadas: {n}. Accuracy: {accuracy:.4f}. F-Measure macro: {f_measure:.4f}'.format(
+        n=instances_number, accuracy=metrics['accuracy'], f_measure=metrics['macro']['f_measure']))
+
+
+# Evaluates a classifier from a stream of predictions, consuming them in batches, so they don't need to be kept in
+# memory. Saves the same report as evaluate_classifier.
+# - 'predictions' is an iterable of tuples (true_class, classified_class), for instance the generator returned by
+# KNN.knn_classify_instance_stream or NaiveBayes.naive_bayes_classify_stream.
+# - 'report_every' is the number of predictions between interim reports. If None, no interim report is made.
+# - 'report' is the function called with the number of predictions evaluated so far and their metrics for each
+# interim report. By default, the accuracy and the macro F-Measure are printed.
+# - 'metrics_file_path' and 'timings' are the same as in evaluate_classifier. If 'timings' doesn't have
+# 'classify_seconds', the time spent consuming the predictions (classifying and evaluating) is used.
+# Returns the metrics of all the predictions.
+def evaluate_classifier_stream(predictions, classes, file_path, report_every=None, report=__print_interim_metrics,
+                               metrics_file_path=None, timings=None):
+    classified_lists = ((true_class, [classified_class]) for true_class, classified_class in predictions)
+    return evaluate_classifiers_stream(classified_lists, classes, [file_path], report_every,
+                                       lambda instances_number, metrics: report(instances_number, metrics[0]),
+                                       [metrics_file_path], timings)[0]
+
+
+# Evaluates several classifiers at once from a single stream of predictions, as evaluate_classifier_stream does for
+# one classifier, for instance KNN with several values of k.
+# - 'predictions' is an iterable of tuples (true_class, classified classes), where classified classes is a sequence
+# with the class chosen by each classifier, for instance the generator returned by
+# KNN.knn_classify_instance_stream_sweep.
+# - 'file_paths' is a list with the route of the report of each classifier.
+# - 'report' is the function called with the number of predictions evaluated so far and a list with the metrics of
+# each classifier for each interim report. By default, the accuracy and the macro F-Measure of each one are printed.
+# - 'metrics_file_paths', if given, is a list with the route of the metrics file of each classifier (or None).
+# Returns a list with the metrics of all the predictions of each classifier.
+def evaluate_classifiers_stream(predictions, classes, file_paths, report_every=None, report=None,
+                                metrics_file_paths=None, timings=None):
+    start_time = time.perf_counter()
+    if report is None:
+        def report(instances_number, metrics):
+            for classifier_metrics in metrics:
+                __print_interim_metrics(instances_number, classifier_metrics)
+    if metrics_file_paths is None:
+        metrics_file_paths = [None] * len(file_paths)
+    states = [evaluate_stream_start(classes) for _ in file_paths]
+    batch_size = evaluator_batch_size
+    if report_every is not None:
+        # Batches that divide 'report_every', so the interim reports are made exactly every 'report_every' predictions.
+        batch_size = report_every // -(-report_every // evaluator_batch_size)
+    instances_number = 0
+    next_report = report_every
+    for batch in Utils.batches(predictions, batch_size):
+        for position, state in enumerate(states):
+            evaluate_stream_update(state, [(true_class, classified[position]) for true_class, classified in batch])
+        instances_number += len(batch)
+        if next_report is not None and instances_number >= next_report:
+            report(instances_number, [evaluate_stream_metrics(state) for state in states])
+            next_report += report_every
+    classify_seconds = time.perf_counter() - start_time
+    all_metrics = []
+    for state, file_path, metrics_file_path in zip(states, file_paths, metrics_file_paths):
+        metrics = evaluate_stream_metrics(state)
+        with Instrumentation.instrumentation_stage('evaluate_report'):
+            __write_report(state['confusion_matrix'], metrics, classes, file_path)
+            if metrics_file_path is not None:
+                metrics_timings = dict(timings or {})
+                metrics_timings.setdefault('classify_seconds', classify_seconds)
+                evaluate_save_metrics(metrics, classes, metrics_file_path, metrics_timings)
+        all_metrics.append(metrics)
+    return all_metrics
+
+
+# Names of the metrics averaged over the folds of a cross validation.
+__fold_metrics_names = ['precision', 'recall', 'fall_out', 'f_measure']
+
+
+# Computes the metrics of a cross validation from the confusion matrix of each fold.
+# - 'confusion_matrices' is a list with the confusion matrix of each fold, as returned by evaluate_confusion_matrix.
+# Returns a dictionary with:
+#       + 'folds': list with the metrics of each fold, as computed by evaluate_metrics.
+#       + 'mean', 'std': dictionaries with the mean and the (sample) standard deviation over the folds of the metrics
+#       of each class ('precision', 'recall', 'fall_out', 'f_measure': arrays with a value per class), of the 'macro'
+#       and 'micro' measures (dictionaries metric name -> value) and of the 'accuracy'.
+#       + 'confusion_matrix': the sum of the confusion matrices of the folds.
+def evaluate_cross_validation_metrics(confusion_matrices):
+    folds = [evaluate_metrics(confusion_matrix) for confusion_matrix in confusion_matrices]
+    ddof = 1 if len(folds) > 1 else 0
+    metrics = {'folds': folds, 'mean': {}, 'std': {},
+               'confusion_matrix': numpy.sum([fold['confusion_matrix'] for fold in folds], axis=0)}
+    for name in __fold_metrics_names:
+        values = numpy.array([fold[name] for fold in folds])
+        metrics['mean'][name] = values.mean(axis=0)
+        metrics['std'][name] = values.std(axis=0, ddof=ddof)
+    for scope in ['macro', 'micro']:
+        values = {name: numpy.array([fold[scope][name] for fold in folds]) for name in __fold_metrics_names}
+        metrics['mean'][scope] = {name: float(values[name].mean()) for name in __fold_metrics_names}
+        metrics['std'][scope] = {name: float(values[name].std(ddof=ddof)) for name in __fold_metrics_names}
+    accuracies = numpy.array([fold['accuracy'] for fold in folds])
+    metrics['mean']['accuracy'] = float(accuracies.mean())
+    metrics['std']['accuracy'] = float(accuracies.std(ddof=ddof))
+    return metrics
+
+
+# Writes the report of a cross validation: the confusion matrix of all the folds together, and the mean and standard
+# deviation of the metrics over the folds.
+def __write_cross_validation_report(metrics, classes, file_path):
+    lines = __confusion_matrix_lines(metrics['confusion_matrix'], classes)
+    lines += ['Folds', str(len(metrics['folds'])), '', '',
+              'Metrics for a given class (mean ± standard deviation over the folds)', 'Precision', 'Recall',
+              'Fall-out', 'F-Measure', '']
+    for position, c in enumerate(classes):
+        lines.append('Metrics for class {c} classification'.format(c=c))
+        lines += ['{mean} ± {std}'.format(mean=metrics['mean'][name][position], std=metrics['std'][name][position])
+                  for name in __fold_metrics_names]
+        lines += ['', '']
+    for title, scope in [('Macro measures', 'macro'), ('Micro measures', 'micro')]:
+        lines += [title, 'Precision', 'Recall', 'Fall-out', 'F-Measure']
+        lines += ['{mean} ± {std}'.format(mean=metrics['mean'][scope][name], std=metrics['std'][scope][name])
+                  for name in __fold_metrics_names]
+        lines += ['', '']
+    lines += ['Accuracy', '{mean} ± {std}'.format(mean=metrics['mean']['accuracy'], std=metrics['std']['accuracy']),
+              '', '', 'Accuracy of each fold']
+    lines += ['{val}'.format(val=fold['accuracy']) for fold in metrics['folds']]
+
+    with open(file_path, 'w', encoding='utf-8') as output:
+        output.write('\n'.join(lines) + '\n')
+
+
+# Saves the metrics of a cross validation in a machine readable format, chosen by the extension of 'file_path', as
+# evaluate_save_metrics:
+# + '.json': a json object with the classes, the confusion matrix of all the folds, the mean and standard deviation
+# of the metrics ('per_class', 'macro', 'micro' and 'accuracy'), the accuracy of each fold and the timings.
+# + '.csv': a table with the columns statistic (mean, std or fold number), scope, class, metric and value.
+def evaluate_save_cross_validation_metrics(metrics, classes, file_path, timings=None):
+    timings = dict(timings or {})
+    statistics = {}
+    for statistic in ['mean', 'std']:
+        statistics[statistic] = {
+            'per_class': {str(c): {name: float(metrics[statistic][name][position]) for name in __fold_metrics_names}
+                          for position, c in enumerate(classes)},
+            'macro': metrics[statistic]['macro'],
+            'micro': metrics[statistic]['micro'],
+            'accuracy': metrics[statistic]['accuracy'],
+        }
+
+    if file_path.endswith('.csv'):
+        with open(file_path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(['statistic', 'scope', 'class', 'metric', 'value'])
+            for c1, row in zip(classes, metrics['confusion_matrix'].tolist()):
+                for c2, value in zip(classes, row):
+                    writer.writerow(['sum', 'confusion_matrix', c1, c2, value])
+            for statistic, values in statistics.items():
+                for c in values['per_class']:
+                    for name, value in values['per_class'][c].items():
+                        writer.writerow([statistic, 'class', c, name, value])
+                for scope in ['macro', 'micro']:
+                    for name, value in values[scope].items():
+                        writer.writerow([statistic, scope, '', name, value])
+                writer.writerow([statistic, 'global', '', 'accuracy', values['accuracy']])
+            for fold, fold_metrics in enumerate(metrics['folds']):
+                writer.writerow([fold, 'global', '', 'accuracy', fold_metrics['accuracy']])
+            for name, value in timings.items():
+                writer.writerow(['', 'timing', '', name, value])
+    elif file_path.endswith('.json'):
+        with open(file_path, 'w') as output:
+            json.dump({
+                'classes': [str(c) for c in classes],
+                'folds': len(metrics['folds']),
+                'confusion_matrix': metrics['confusion_matrix'].tolist(),
+                'mean': statistics['mean'],
+                'std': statistics['std'],
+                'folds_accuracy': [fold['accuracy'] for fold in metrics['folds']],
+                'timings': timings,
+            }, output, indent=2)
+    else:
+        raise Exception('Evaluator.evaluate_save_cross_validation_metrics: the file extension should be .json or .csv')
+
+
+# Evaluates a classifier with the confusion matrices of the folds of a cross validation, saving the report to a given
+# file's path.
+# - 'confusion_matrices' is a list with the confusion matrix of each fold.
+# - 'classes' is a list with all the possible class labels.
+# - 'metrics_file_path' and 'timings' are the same as in evaluate_classifier.
+# Returns the metrics, as computed by evaluate_cross_validation_metrics.
+def evaluate_cross_validation(confusion_matrices, classes, file_path, metrics_file_path=None, timings=None):
+    metrics = evaluate_cross_validation_metrics(confusion_matrices)
+    with Instrumentation.instrumentation_stage('evaluate_report'):
+        __write_cross_validation_report(metrics, classes, file_path)
+        if metrics_file_path is not None:
+            evaluate_save_cross_validation_metrics(metrics, classes, metrics_file_path, timings)
+    return metrics
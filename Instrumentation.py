@@ -0,0 +1,126 @@
+"""
+This module measures the stages of the classifiers: the time spent in each stage, the rows it processed, and counters
+such as the nodes visited by the KNN searches. It also profiles a whole run with cProfile.
+
+The instrumentation is disabled by default. While it is disabled, instrumentation_stage returns a context manager
+that does nothing and instrumentation_count returns immediately, so the instrumented code isn't slowed down.
+Only the main process is measured: the stages run by the worker processes of KNN aren't included, but their peak
+memory is.
+"""
+
+import contextlib
+import cProfile
+import io
+import pstats
+import time
+
+try:
+    import resource
+except ImportError:
+    # The resource module only exists in Unix. Without it, the peak memory isn't reported.
+    resource = None
+
+
+# Whether the stages and counters are recorded.
+instrumentation_enabled = False
+
+# Dictionary: stage name -> [calls, seconds, rows].
+instrumentation_stages = {}
+
+# Dictionary: counter name -> value.
+instrumentation_counters = {}
+
+# Number of functions of the profile shown in the summary, sorted by cumulative time.
+instrumentation_profile_functions = 20
+
+__instrumentation_disabled_stage = contextlib.nullcontext()
+
+
+@contextlib.contextmanager
+def __instrumentation_timed_stage(name, rows):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage = instrumentation_stages.setdefault(name, [0, 0.0, 0])
+        stage[0] += 1
+        stage[1] += time.perf_counter() - start_time
+        stage[2] += rows
+
+
+# Returns a context manager that measures the code run inside it as a call to the stage 'name'.
+# - 'rows' is the number of rows (instances) processed by the call, used for computing the rows per second.
+def instrumentation_stage(name, rows=0):
+    if not instrumentation_enabled:
+        return __instrumentation_disabled_stage
+    return __instrumentation_timed_stage(name, rows)
+
+
+# Adds 'value' to the counter 'name'.
+def instrumentation_count(name, value=1):
+    if instrumentation_enabled:
+        instrumentation_counters[name] = instrumentation_counters.get(name, 0) + value
+
+
+# Enables the instrumentation, discarding the stages and counters recorded before.
+def instrumentation_enable():
+    global instrumentation_enabled
+    instrumentation_enabled = True
+    instrumentation_stages.clear()
+    instrumentation_counters.clear()
+
+
+# Returns a pair with the peak resident memory, in kilobytes, of this process and of its finished child processes,
+# or None if it can't be measured.
+def instrumentation_peak_memory():
+    if resource is None:
+        return None
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+# Returns a table with the stages, counters and peak memory recorded so far, as a string.
+def instrumentation_summary():
+    lines = ['{:<32} {:>8} {:>12} {:>12} {:>14}'.format('Etapa', 'Llamadas', 'Segundos', 'Filas', 'Filas/s')]
+    for name, (calls, seconds, rows) in instrumentation_stages.items():
+        rows_per_second = '{:.1f}'.format(rows / seconds) if rows and seconds > 0 else '-'
+        lines.append('{:<32} {:>8} {:>12.6f} {:>12} {:>14}'.format(name, calls, seconds, rows or '-', rows_per_second))
+    if instrumentation_counters:
+        lines.append('')
+        lines.append('{:<32} {:>12}'.format('Contador', 'Valor'))
+        for name, value in instrumentation_counters.items():
+            lines.append('{:<32} {:>12}'.format(name, value))
+        queries = instrumentation_counters.get('knn_queries')
+        if queries:
+            for name in ['knn_index_nodes_visited', 'knn_index_node_pairs_visited', 'knn_ball_tree_nodes_visited',
+                         'knn_ball_tree_node_pairs_visited', 'knn_brute_distances']:
+                if name in instrumentation_counters:
+                    lines.append('{:<32} {:>12.1f}'.format(name + '_per_query', instrumentation_counters[name] / queries))
+    peak_memory = instrumentation_peak_memory()
+    if peak_memory is not None:
+        lines.append('')
+        lines.append('Memoria máxima (KB): {} en este proceso, {} en los procesos hijos'.format(*peak_memory))
+    return '\n'.join(lines)
+
+
+# Enables the instrumentation and starts profiling the process with cProfile. Returns the profiler.
+def instrumentation_start_profile():
+    instrumentation_enable()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+# Stops a profiler started by instrumentation_start_profile and saves its dump (readable with pstats) in
+# 'profile_file_path'. The summary table, followed by the functions with the highest cumulative time, is printed and
+# saved in 'profile_file_path' + '.txt'.
+def instrumentation_stop_profile(profiler, profile_file_path):
+    profiler.disable()
+    profiler.dump_stats(profile_file_path)
+    functions = io.StringIO()
+    pstats.Stats(profiler, stream=functions).sort_stats('cumulative').print_stats(instrumentation_profile_functions)
+    summary = instrumentation_summary()
+    print(summary)
+    with open(profile_file_path + '.txt', 'w') as summary_file:
+        summary_file.write(summary + '\n\n' + functions.getvalue())
+    print('El perfil está en ' + profile_file_path + ' y el resumen en ' + profile_file_path + '.txt')
@@ -1,31 +1,51 @@
 """
 This module implements the K-Nearest Neighbour algorithm. It assumes that instances don't have a class label at the
-end. Instead, it receives a hash table such that for each instance, returns the associated class label. It also assumes
+end. Instead, it receives an array with the class label of each training instance, indexed by its row number. It also assumes
 that the instance's attributes are normalized. It receives a k-d-tree for efficiently
 calculating the k nearest neighbours and their distances.
 The classification function of this module returns a class label.
+
+Six search engines are available:
++ 'kdtree' searches the neighbours of each instance with the kdtree package.
++ 'brute' keeps the training set as one contiguous matrix and computes the distances of blocks of instances at once.
++ 'index' searches the neighbours of all the instances at once in the flat array k-d-tree of KNNIndex, traversing it
+together with a tree of the instances (dual-tree search).
++ 'balltree' searches the neighbours of all the instances at once in the ball tree of KNNBallTree (dual-tree search, as
+'index'), with a configurable distance.
++ 'forest' searches approximate neighbours of blocks of instances in the random projection forest of KNNForest. It
+may miss some of the nearest neighbours (knn_forest_recall measures how many), but it is much faster on large data
+sets.
++ 'packed' computes the distances of blocks of instances at once, as 'brute', with the compact training set of
+KNNPacked: float32 continuous attributes and the binary attributes packed as bits.
 """
 
-import Evaluator
-import KNNParser
+import numpy
+import Instrumentation
+import Utils
 
 
-# Implement the K-Nearest Neighbour algorithm.
-# - 'x' is the instance to classify.
-# - 'k' is the number of neighbours considered. It may be 1, 3 or 7.
-# - 'k_d_tree' is a k-d-tree that contains all instances for efficient neighbour searching.
-# - 'classes' is a list with all class labels.
-# - 'class_label' is a dictionary: instance -> class label.
-# Return the class number that classifies x with the K-NN algorithm.
-def __knn_classify_instance(x, true_class, k, k_d_tree, class_label, classes):
-    # Check if k is 1, 3 or 7
-    # if k != 1 and k != 3 and k != 7:
-        # raise Exception('K-NN.knn: expected a k value of 1, 3 or 7')
-
-    # search_knn receives k+1 because it includes x in the result list of neighbours.
-    # neighbours_pairs_list is a list of paris (KDNode, distance).
-    neighbours_pairs_list = k_d_tree.search_knn(x, k)
+# Names of the available search engines.
+knn_engines = ['kdtree', 'brute', 'index', 'balltree', 'forest', 'packed']
+
+# Maximum number of distances computed at once by the 'brute' engine (instances in a block times training instances).
+knn_brute_block_elements = 2 ** 22
+
+# Number of chunks of instances per worker process in knn_classify_instance_set.
+knn_chunks_per_worker = 4
 
+# Number of instances classified together by knn_classify_instance_stream.
+knn_stream_batch_size = 1024
+
+# Maximum number of instances used by knn_forest_recall.
+knn_forest_recall_queries = 1000
+
+
+# Classify an instance from its nearest neighbours.
+# - 'neighbours_pairs_list' is a list of pairs (KDNode, distance) with the neighbours of the instance.
+# - 'classes' is a list with all class labels.
+# - 'class_label' is an array with the class label of each training instance, indexed by KNNPoint.row_id.
+# Return the class label with the highest cumulative inverse distance of the neighbours.
+def __knn_vote_neighbours(neighbours_pairs_list, class_label, classes):
     # Dictionary: class number -> cumulative distance of nodes of that class to x
     cumulative_distance = {}
     for c in classes:
@@ -36,8 +56,9 @@ def __knn_classify_instance(x, true_class, k, k_d_tree, class_label, classes):
         # The actual point that is a neighbour of x.
         neighbour_point = pair[0].data
         neighbour_distance = pair[1]
-        neighbour_class = class_label[neighbour_point]
-        cumulative_distance[neighbour_class] += 1 / neighbour_distance
+        neighbour_class = class_label[neighbour_point.row_id]
+        # A neighbour equal to x (distance zero) has infinite weight, as in __knn_vote.
+        cumulative_distance[neighbour_class] += 1 / neighbour_distance if neighbour_distance > 0 else numpy.inf
 
     # Find the class of neighbours with highest cumulative distance to x and classify x with that class number.
     # In case of tie (very unlikely), the algorithm prefers to take the first class number considered.
@@ -47,42 +68,346 @@ def __knn_classify_instance(x, true_class, k, k_d_tree, class_label, classes):
         if max_cum_distance is None or max_cum_distance < cumulative_distance[c]:
             classified_class = c
             max_cum_distance = cumulative_distance[c]
+    return classified_class
+
+
+# Implement the K-Nearest Neighbour algorithm for several values of k at once.
+# - 'x' is the instance to classify.
+# - 'k_values' is a list with the numbers of neighbours considered.
+# - 'k_d_tree' is a k-d-tree that contains all instances for efficient neighbour searching.
+# - 'classes' is a list with all class labels.
+# - 'class_label' is an array with the class label of each training instance, indexed by KNNPoint.row_id.
+# Return a list with a pair (true class, classified class) for each value in 'k_values'.
+# The neighbours are searched only once, for the largest k. Since search_knn returns them sorted by distance, the
+# neighbours for a smaller k are a prefix of that list.
+def __knn_classify_instance(x, true_class, k_values, k_d_tree, class_label, classes):
+    # neighbours_pairs_list is a list of paris (KDNode, distance).
+    neighbours_pairs_list = k_d_tree.search_knn(x, max(k_values))
 
     # Classify x as being of the class with the highest cumulative distance.
-    return true_class, classified_class
+    return [(true_class, __knn_vote_neighbours(neighbours_pairs_list[:k], class_label, classes)) for k in k_values]
+
+
+# Find the k nearest neighbours of each row of 'queries' by brute force.
+# - 'queries' is a matrix with one instance per row.
+# - 'training_matrix' is a matrix with one training instance per row.
+# - 'training_squared_norms' is the squared norm of each row of 'training_matrix'.
+# Return a pair of matrices (neighbour row numbers, neighbour distances) with one row per query, where the neighbours
+# are sorted by increasing distance. Distances are squared euclidean distances, as the ones returned by kdtree.
+def __knn_search_block(queries, k, training_matrix, training_squared_norms):
+    k = min(k, len(training_matrix))
+    # |q - t|^2 = |q|^2 - 2*q.t + |t|^2, where |q|^2 is the same for every training instance, so it is not needed
+    # for ranking them.
+    scores = training_squared_norms - 2.0 * (queries @ training_matrix.T)
+    if k < scores.shape[1]:
+        candidates = numpy.argpartition(scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = numpy.tile(numpy.arange(scores.shape[1]), (len(queries), 1))
+    # Compute the exact distances to the candidates, so the votes are the same as the ones of the kdtree engine.
+    differences = training_matrix[candidates] - queries[:, numpy.newaxis, :]
+    distances = numpy.einsum('ijk,ijk->ij', differences, differences)
+    order = numpy.argsort(distances, axis=1, kind='stable')
+    return numpy.take_along_axis(candidates, order, axis=1), numpy.take_along_axis(distances, order, axis=1)
+
+
+# Vote the class of each instance, weighting each neighbour with the inverse of its distance.
+# - 'neighbour_classes' is a matrix with the class number (position in the list of classes) of the neighbours of
+# each instance, sorted by increasing distance.
+# - 'neighbour_distances' is a matrix with the distances of those neighbours.
+# Return an array with the class number that classifies each instance. In case of tie, the first class is preferred,
+# as in __knn_classify_instance.
+def __knn_vote(neighbour_classes, neighbour_distances, classes_number):
+    with numpy.errstate(divide='ignore'):
+        weights = 1 / neighbour_distances
+    cumulative_distance = numpy.zeros((len(neighbour_classes), classes_number))
+    rows = numpy.arange(len(neighbour_classes))[:, numpy.newaxis]
+    # numpy.add.at adds the weights in order, as __knn_classify_instance does.
+    numpy.add.at(cumulative_distance, (rows, neighbour_classes), weights)
+    return numpy.argmax(cumulative_distance, axis=1)
+
+
+# Return an array with the class number (position in 'classes') of each label in 'class_label'.
+def __knn_class_numbers(class_label, classes):
+    classes_array = numpy.asarray(classes)
+    sorter = numpy.argsort(classes_array, kind='stable')
+    positions = numpy.searchsorted(classes_array, numpy.asarray(class_label), sorter=sorter)
+    return sorter[positions].astype(numpy.intp)
+
+
+# Prepare the training data for classifying instances with the given engine, so it is done only once per
+# classification (and once per worker process).
+# Return a tuple whose first element is the engine name:
+#       + ('kdtree', k-d-tree, class label array) for the 'kdtree' engine.
+#       + ('brute', training matrix, squared norms of its rows, class number of its rows) for the 'brute' engine.
+#       + ('index', index, class number of the rows of the index) for the 'index' engine.
+#       + ('balltree', ball tree, class number of the rows of the ball tree) for the 'balltree' engine.
+#       + ('forest', forest, class number of the rows of the forest) for the 'forest' engine.
+#       + ('packed', packed training set, class number of its rows) for the 'packed' engine.
+def __knn_prepare_search(k_d_tree, class_label, classes, engine):
+    if engine == 'kdtree':
+        # kdtree.create already builds a balanced tree, so it isn't rebalanced.
+        return engine, k_d_tree, class_label
+    elif engine == 'brute':
+        training_matrix = numpy.ascontiguousarray(k_d_tree, dtype=numpy.float64)
+        training_squared_norms = numpy.einsum('ij,ij->i', training_matrix, training_matrix)
+        return engine, training_matrix, training_squared_norms, __knn_class_numbers(class_label, classes)
+    elif engine == 'index' or engine == 'balltree' or engine == 'forest' or engine == 'packed':
+        return engine, k_d_tree, __knn_class_numbers(class_label, classes)
+    else:
+        raise Exception('KNN.knn_classify_instance_set: unknown engine ' + str(engine))
+
+
+# Apply the K-Nearest Neighbour algorithm to each instance in 'instances', for each value of k in 'k_values'.
+# - 'instances' is a list of pairs (instance, true class).
+# - 'search' is the training data prepared by __knn_prepare_search.
+# Return a list with, for each value of k, a list of tuples (true class, classified class) in the same order as
+# 'instances'.
+def __knn_classify_pairs(instances, k_values, search, classes):
+    Instrumentation.instrumentation_count('knn_queries', len(instances))
+    with Instrumentation.instrumentation_stage('knn_search_' + search[0], len(instances)):
+        return __knn_classify_pairs_with_engine(instances, k_values, search, classes)
+
+
+# Implements __knn_classify_pairs for the engine of 'search'.
+# The module of each engine is imported when it is used, so classifying with one engine (for example, with a bundle)
+# doesn't import the others.
+def __knn_classify_pairs_with_engine(instances, k_values, search, classes):
+    classifications = [[] for _ in k_values]
+    if search[0] == 'kdtree':
+        _, k_d_tree, class_label = search
+        for instance, true_class in instances:
+            for classification, pair in zip(classifications, __knn_classify_instance(
+                    instance, true_class, k_values, k_d_tree, class_label, classes)):
+                classification.append(pair)
+        return classifications
+
+    if search[0] == 'index':
+        import KNNIndex
+        _, index, training_classes = search
+        return __knn_classify_blocks(instances, k_values, classes, training_classes, max(1, len(instances)),
+                                     lambda queries, k: KNNIndex.knn_index_search_batch(index, queries, k))
+
+    if search[0] == 'balltree':
+        import KNNBallTree
+        _, ball_tree, training_classes = search
+        return __knn_classify_blocks(instances, k_values, classes, training_classes, max(1, len(instances)),
+                                     lambda queries, k: KNNBallTree.knn_ball_tree_search_batch(ball_tree, queries, k))
+
+    if search[0] == 'forest':
+        import KNNForest
+        _, forest, training_classes = search
+        attributes_number = len(instances[0][0]) if instances else 0
+        candidates_number = len(forest['roots']) * int(forest['leaf_capacity']) * max(1, attributes_number)
+        block_size = max(1, knn_brute_block_elements // max(1, candidates_number))
+        return __knn_classify_blocks(instances, k_values, classes, training_classes, block_size,
+                                     lambda queries, k: KNNForest.knn_forest_search_block(forest, queries, k))
+
+    if search[0] == 'packed':
+        import KNNPacked
+        _, packed, training_classes = search
+
+        def search_block(queries, k):
+            Instrumentation.instrumentation_count('knn_packed_distances', len(queries) * len(training_classes))
+            return KNNPacked.knn_packed_search_block(packed, queries, k)
+
+        block_size = max(1, knn_brute_block_elements // max(1, len(training_classes)))
+        return __knn_classify_blocks(instances, k_values, classes, training_classes, block_size, search_block)
+
+    _, training_matrix, training_squared_norms, training_classes = search
+
+    def search_block(queries, k):
+        Instrumentation.instrumentation_count('knn_brute_distances', len(queries) * len(training_matrix))
+        return __knn_search_block(queries, k, training_matrix, training_squared_norms)
+
+    block_size = max(1, knn_brute_block_elements // max(1, len(training_matrix)))
+    return __knn_classify_blocks(instances, k_values, classes, training_classes, block_size, search_block)
+
+
+# Classify the instances in blocks of 'block_size' instances, for the engines that search the neighbours of blocks of
+# instances at once.
+# - 'training_classes' is an array with the class number of each training instance.
+# - 'search_block' is a function (queries, k) -> (neighbour rows, neighbour distances), with one row per query
+# sorted by increasing distance. The neighbours are searched once for the largest k, and the ones of a smaller k are
+# a prefix of them.
+# Return a list with, for each value of k, a list of tuples (true class, classified class) in the same order as
+# 'instances'.
+def __knn_classify_blocks(instances, k_values, classes, training_classes, block_size, search_block):
+    classifications = [[] for _ in k_values]
+    queries = numpy.array([instance for instance, _ in instances], dtype=numpy.float64).reshape(len(instances), -1)
+    for start in range(0, len(queries), block_size):
+        neighbours, distances = search_block(queries[start:start + block_size], max(k_values))
+        neighbour_classes = training_classes[neighbours]
+        for classification, k in zip(classifications, k_values):
+            classified = __knn_vote(neighbour_classes[:, :k], distances[:, :k], len(classes))
+            for (_, true_class), classified_class in zip(instances[start:start + block_size], classified):
+                classification.append((true_class, classes[classified_class]))
+    return classifications
+
+
+# Training data and parameters of the worker processes of knn_classify_instance_set: (k values, search, classes).
+# It is set once per worker when the pool is created, so the training data isn't sent with every task.
+__knn_worker_state = None
+
+
+def __knn_initialize_worker(k_values, search, classes):
+    global __knn_worker_state
+    __knn_worker_state = (k_values, search, classes)
+
+
+def __knn_classify_chunk(instances):
+    k_values, search, classes = __knn_worker_state
+    return __knn_classify_pairs(instances, k_values, search, classes)
+
+
+# Apply the K-Nearest Neighbour algorithm to each instance in 'instances', for several values of k at once.
+# The neighbours of each instance are searched only once, for the largest k, and the classification for each smaller
+# k is computed from the nearest of them.
+# - 'k_values' is a list with the numbers of neighbours considered.
+# - 'instances' is a dictionary: instance -> class label, as in knn_classify_instance_set, or a list of pairs
+# (instance, class label), which may have repeated instances.
+# The other parameters are the same as in knn_classify_instance_set.
+# Return a dictionary: k -> list of tuples (true class, classified class), in the same order as 'instances'.
+def knn_classify_instance_set_sweep(instances, k_values, k_d_tree, class_label, classes, engine='kdtree', workers=1):
+    k_values = list(k_values)
+    search = __knn_prepare_search(k_d_tree, class_label, classes, engine)
+    pairs = list(instances.items()) if isinstance(instances, dict) else list(instances)
+    if workers <= 1 or len(pairs) < 2:
+        classifications = __knn_classify_pairs(pairs, k_values, search, classes)
+    else:
+        # Several chunks per worker, so the work stays balanced when some chunks are slower than others.
+        chunks_number = min(len(pairs), workers * knn_chunks_per_worker)
+        chunk_size = -(-len(pairs) // chunks_number)
+        chunks = [pairs[start:start + chunk_size] for start in range(0, len(pairs), chunk_size)]
+        # Imported here, so classifying in a single process (as ModelBundle does) doesn't pay for importing it.
+        import multiprocessing
+        with multiprocessing.Pool(workers, __knn_initialize_worker, (k_values, search, classes)) as pool:
+            classified_chunks = pool.map(__knn_classify_chunk, chunks)
+        classifications = [[] for _ in k_values]
+        for classified_chunk in classified_chunks:
+            for classification, classified in zip(classifications, classified_chunk):
+                classification.extend(classified)
+    return dict(zip(k_values, classifications))
+
+
+# Apply the K-Nearest Neighbour algorithm to a stream of instances, yielding each classification as soon as the batch
+# of instances that contains it is classified. Only one batch of instances is kept in memory.
+# - 'instances' is an iterable of pairs (instance, true class), for instance the validation instances read by
+# KNNParser.knn_iterate_validation_instances.
+# The other parameters are the same as in knn_classify_instance_set.
+# Yields tuples (true class, classified class), in the same order as 'instances'.
+def knn_classify_instance_stream(instances, k, k_d_tree, class_label, classes, engine='kdtree',
+                                 batch_size=knn_stream_batch_size, workers=1):
+    for true_class, classified in knn_classify_instance_stream_sweep(instances, [k], k_d_tree, class_label, classes,
+                                                                     engine, batch_size, workers):
+        yield true_class, classified[0]
+
+
+# Apply the K-Nearest Neighbour algorithm to a stream of instances for several values of k at once, as
+# knn_classify_instance_set_sweep does: the neighbours of each batch of instances are searched only once, for the
+# largest k.
+# - 'workers' is the number of processes that classify the batches. Each process receives the training data only
+# once, and classifies whole batches. At most knn_chunks_per_worker batches per process are read at a time, so the
+# memory used doesn't depend on the number of instances.
+# The other parameters are the same as in knn_classify_instance_stream.
+# Yields tuples (true class, list with the classified class for each value in 'k_values'), in the same order as
+# 'instances'.
+def knn_classify_instance_stream_sweep(instances, k_values, k_d_tree, class_label, classes, engine='kdtree',
+                                       batch_size=knn_stream_batch_size, workers=1):
+    k_values = list(k_values)
+    search = __knn_prepare_search(k_d_tree, class_label, classes, engine)
+    if workers <= 1:
+        for batch in Utils.batches(instances, batch_size):
+            yield from __knn_stream_classifications(__knn_classify_pairs(batch, k_values, search, classes))
+        return
+    import multiprocessing
+    with multiprocessing.Pool(workers, __knn_initialize_worker, (k_values, search, classes)) as pool:
+        for batches in Utils.batches(Utils.batches(instances, batch_size), workers * knn_chunks_per_worker):
+            for classifications in pool.map(__knn_classify_chunk, batches):
+                yield from __knn_stream_classifications(classifications)
+
+
+# Converts the classifications of a batch (a list with, for each value of k, a list of tuples (true class, classified
+# class)) to tuples (true class, list with the classified class for each value of k).
+def __knn_stream_classifications(classifications):
+    for pairs in zip(*classifications):
+        yield pairs[0][0], [classified_class for _, classified_class in pairs]
+
+
+# Prepare the training data once, for classifying many matrices with knn_classify_matrix (for instance, the requests
+# received by Server). The parameters are the same as in knn_classify_instance_set.
+def knn_prepare(k_d_tree, class_label, classes, engine='kdtree'):
+    return __knn_prepare_search(k_d_tree, class_label, classes, engine)
+
+
+# Apply the K-Nearest Neighbour algorithm to each row of 'matrix', for several values of k at once, with the training
+# data prepared by knn_prepare.
+# - 'matrix' is a matrix with one instance (without class label) per row.
+# Return a dictionary: k -> list with the classified class of each row.
+def knn_classify_matrix(search, matrix, k_values, classes):
+    k_values = list(k_values)
+    pairs = [(tuple(instance), None) for instance in numpy.asarray(matrix, dtype=numpy.float64).tolist()]
+    classifications = __knn_classify_pairs(pairs, k_values, search, classes)
+    return {k: [classified for _, classified in classification] for k, classification in zip(k_values, classifications)}
 
 
 # Apply the K-Nearest Neighbour algorithm to each instance in 'instances'
-# - 'instances' is a list of instances to classify.
+# - 'instances' is a dictionary: instance -> class label, with the instances to classify.
 # - 'k' is the number of neighbours considered. It may be 1, 3 or 7.
-# - 'k_d_tree' is a k-d-tree that contains all instances for efficient neighbour searching.
+# - 'k_d_tree' is the structure used for neighbour searching: a k-d-tree that contains all instances for the 'kdtree'
+# engine, a matrix with one training instance per row for the 'brute' engine, an index of KNNIndex for the 'index'
+# engine, a ball tree of KNNBallTree for the 'balltree' engine, a forest of KNNForest for the 'forest' engine, or a
+# packed training set of KNNPacked for the 'packed' engine.
 # - 'classes' is a list with all class labels.
-# - 'class_label' is a dictionary: instance -> class label.
+# - 'class_label' is a sequence with the class label of each training instance: indexed by KNNPoint.row_id for the
+# 'kdtree' engine, or by the row of the matrix (or of the 'features' of the index, ball tree or forest, or of the
+# packed training set) for the other engines.
+# - 'engine' is the name of the search engine, one of knn_engines.
+# - 'workers' is the number of processes that classify the instances. The instances are split in chunks, and each
+# process receives the training data only once, when it starts.
 # Return the input parameters of evaluate_classifier:
-#       + a list of tuples (true class, classified class).
+#       + a list of tuples (true class, classified class), in the same order as 'instances'.
 #       + class labels.
-def knn_classify_instance_set(instances, k, k_d_tree, class_label, classes):
-    # Classify each instance in 'instances' in parallel
-    # return Parallel(n_jobs=1,
-    #                 verbose=100)(delayed(__knn_classify_instance)(instance, instances[instance], k, k_d_tree,
-    #                                                              class_label, classes) for instance in instances)
-    k_d_tree.rebalance()
-    classification = []
-    for instance in instances:
-        classification.append(__knn_classify_instance(instance, instances[instance], k, k_d_tree, class_label, classes))
-    return classification
+def knn_classify_instance_set(instances, k, k_d_tree, class_label, classes, engine='kdtree', workers=1):
+    return knn_classify_instance_set_sweep(instances, [k], k_d_tree, class_label, classes, engine, workers)[k]
+
+
+# Measure the recall of the 'forest' engine: the proportion of the exact k nearest neighbours of the instances that
+# the forest finds. A neighbour found at the same distance as the k-th exact neighbour counts as found, so ties
+# don't lower the recall.
+# - 'forest' is a forest built by KNNForest.knn_forest_build.
+# - 'instances' is a matrix with one instance per row. At most knn_forest_recall_queries of them are used.
+# Return the recall, between 0 and 1.
+def knn_forest_recall(forest, instances, k):
+    import KNNForest
+    queries = numpy.asarray(instances, dtype=numpy.float64)[:knn_forest_recall_queries]
+    training_matrix = forest['features']
+    training_squared_norms = numpy.einsum('ij,ij->i', training_matrix, training_matrix)
+    k = min(k, len(training_matrix))
+    found = 0
+    block_size = max(1, knn_brute_block_elements // max(1, len(training_matrix)))
+    for start in range(0, len(queries), block_size):
+        block = queries[start:start + block_size]
+        _, exact_distances = __knn_search_block(block, k, training_matrix, training_squared_norms)
+        _, approximate_distances = KNNForest.knn_forest_search_block(forest, block, k)
+        # Squared distances computed from the same differences, so equal neighbours have exactly equal distances.
+        found += int((approximate_distances <= exact_distances[:, -1:]).sum())
+    return found / (len(queries) * k) if len(queries) > 0 else 1.0
 
 
 if __name__ == '__main__':
+    import Evaluator
+    import KNNParser
     """
-    k_d_tree, hash_, validation_dictionary = KNNParser.knn_load_processed_data_and_dictionary(
+    k_d_tree, labels, validation_dictionary = KNNParser.knn_load_processed_data_and_dictionary(
         KNNParser.knn_iris_processed_data_file_name, KNNParser.knn_iris_validation_file_name)
-    for k in [1, 3, 7]:
-        classification = knn_classify_instance_set(validation_dictionary, k, k_d_tree, hash_, [0, 1, 2])
-        Evaluator.evaluate_classifier(classification, [0, 1, 2], 'knn_exp/iris{k}.data'.format(k=k))
+    classifications = knn_classify_instance_set_sweep(validation_dictionary, [1, 3, 7], k_d_tree, labels, [0, 1, 2])
+    for k in classifications:
+        Evaluator.evaluate_classifier(classifications[k], [0, 1, 2], 'knn_exp/iris{k}.data'.format(k=k))
     """
-    k_d_tree, hash_, validation_dictionary = KNNParser.knn_load_processed_data_and_dictionary(
+    k_d_tree, labels, validation_dictionary = KNNParser.knn_load_processed_data_and_dictionary(
         KNNParser.knn_covtype_processed_data_file_name, KNNParser.knn_covtype_validation_file_name)
-    for k in [1, 3, 7]:
-        classification = knn_classify_instance_set(validation_dictionary, k, k_d_tree, hash_, [0, 1, 2, 3, 4, 5, 6])
-        Evaluator.evaluate_classifier(classification, [0, 1, 2, 3, 4, 5, 6], 'knn_exp/covtype{k}.data'.format(k=k))
+    classifications = knn_classify_instance_set_sweep(validation_dictionary, [1, 3, 7], k_d_tree, labels,
+                                                      [0, 1, 2, 3, 4, 5, 6])
+    for k in classifications:
+        Evaluator.evaluate_classifier(classifications[k], [0, 1, 2, 3, 4, 5, 6],
+                                      'knn_exp/covtype{k}.data'.format(k=k))
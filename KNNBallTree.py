@@ -0,0 +1,248 @@
+"""
+This module implements a ball tree stored in flat arrays, used by the 'balltree' engine of KNN.
+
+Each node of the tree is a ball (a center and a radius) that contains all its training instances. Unlike the
+axis-aligned splits of a k-d-tree, the balls use all the attributes at once, so they still prune the search when most
+attributes are binary, as the one-hot attributes of covtype. A node is split in two by assigning each instance to the
+nearer of two distant instances (at the median of the difference of the distances, so both children have the same
+size).
+
+The distance is configurable:
++ 'euclidean': sqrt(sum(w_i * (x_i - y_i)^2)).
++ 'manhattan': sum(w_i * |x_i - y_i|).
+where w_i is the weight of each attribute (1 by default). Giving the one-hot attributes a weight different from the
+continuous ones mixes both blocks with the desired importance (see knn_ball_tree_weights).
+
+The tree is a dictionary with the following entries:
++ 'features': matrix with one training instance (without class label) per row, in the order of the tree.
++ 'labels': class label of each row of 'features'.
++ 'row_ids': position of each row of 'features' in the training set.
++ 'node_start', 'node_end': range of rows covered by each node. The root is node 0.
++ 'node_center', 'node_radius': ball of each node.
++ 'node_left', 'node_right': children of each node, or -1 if the node is a leaf.
++ 'distance': name of the distance, one of knn_ball_tree_distances.
++ 'weights': weight of each attribute.
+
+knn_ball_tree_search finds the neighbours of one instance. knn_ball_tree_search_batch finds the neighbours of many
+instances in one call, traversing together the tree and a ball tree of the instances, as
+KNNIndex.knn_index_search_batch does.
+"""
+
+import numpy
+import Instrumentation
+
+
+# Names of the available distances.
+knn_ball_tree_distances = ['euclidean', 'manhattan']
+
+# Maximum number of training instances in a leaf of the tree.
+knn_ball_tree_leaf_size = 32
+
+# Maximum number of instances in a leaf of the tree of instances built by knn_ball_tree_search_batch.
+knn_ball_tree_query_leaf_size = 32
+
+
+# Returns the weights of the attributes for a distance that mixes continuous and one-hot attributes.
+# - 'one_hot_attributes' is a list with the numbers of the one-hot attributes.
+# - 'one_hot_weight' is the weight of each one-hot attribute. The weight of the other attributes is 1.
+def knn_ball_tree_weights(attributes_number, one_hot_attributes, one_hot_weight):
+    weights = numpy.ones(attributes_number)
+    weights[list(one_hot_attributes)] = one_hot_weight
+    return weights
+
+
+# Distances (as defined by 'distance' and 'weights') from each row of 'points' to 'x'.
+def __ball_tree_distances(points, x, distance, weights):
+    differences = points - x
+    if distance == 'manhattan':
+        return numpy.abs(differences) @ weights
+    return numpy.sqrt((differences * differences) @ weights)
+
+
+# Builds the ball tree of a training set.
+# - 'features' is a matrix with one training instance (without class label) per row.
+# - 'labels' is a sequence with the class label of each row. Labels must be integers between 0 and 255.
+# - 'distance' is the name of the distance, one of knn_ball_tree_distances.
+# - 'weights' is a sequence with the weight of each attribute in the distance, or None for giving all the attributes
+# the same weight.
+# Returns the tree as a dictionary.
+def knn_ball_tree_build(features, labels, distance='euclidean', weights=None, leaf_size=knn_ball_tree_leaf_size):
+    if distance not in knn_ball_tree_distances:
+        raise Exception('KNNBallTree.knn_ball_tree_build: unknown distance ' + str(distance))
+    features = numpy.ascontiguousarray(features, dtype=numpy.float64)
+    weights = numpy.ones(features.shape[1]) if weights is None else numpy.asarray(weights, dtype=numpy.float64)
+    order = numpy.arange(len(features))
+    node_start, node_end, node_center, node_radius, node_left, node_right = [], [], [], [], [], []
+
+    def add_node(start, end):
+        node_start.append(start)
+        node_end.append(end)
+        node_center.append(None)
+        node_radius.append(0.0)
+        node_left.append(-1)
+        node_right.append(-1)
+        return len(node_start) - 1
+
+    # Stack of nodes to build: (node number, first row, last row + 1). 'order' is partitioned in place.
+    stack = [(add_node(0, len(features)), 0, len(features))]
+    while stack:
+        node, start, end = stack.pop()
+        rows = features[order[start:end]]
+        node_center[node] = rows.mean(axis=0)
+        node_radius[node] = float(__ball_tree_distances(rows, node_center[node], distance, weights).max())
+        if end - start <= leaf_size or node_radius[node] == 0:
+            continue
+        # Two distant instances: the farthest from the first one, and the farthest from it.
+        first_pivot = rows[numpy.argmax(__ball_tree_distances(rows, rows[0], distance, weights))]
+        second_pivot = rows[numpy.argmax(__ball_tree_distances(rows, first_pivot, distance, weights))]
+        difference = (__ball_tree_distances(rows, first_pivot, distance, weights) -
+                      __ball_tree_distances(rows, second_pivot, distance, weights))
+        middle = (end - start) // 2
+        order[start:end] = order[start:end][numpy.argpartition(difference, middle)]
+        node_left[node] = add_node(start, start + middle)
+        node_right[node] = add_node(start + middle, end)
+        stack.append((node_left[node], start, start + middle))
+        stack.append((node_right[node], start + middle, end))
+
+    return {
+        'features': numpy.ascontiguousarray(features[order]),
+        'labels': numpy.asarray(labels, dtype=numpy.uint8)[order],
+        'row_ids': order.astype(numpy.int64),
+        'node_start': numpy.array(node_start, dtype=numpy.int64),
+        'node_end': numpy.array(node_end, dtype=numpy.int64),
+        'node_center': numpy.array(node_center, dtype=numpy.float64).reshape(len(node_start), features.shape[1]),
+        'node_radius': numpy.array(node_radius, dtype=numpy.float64),
+        'node_left': numpy.array(node_left, dtype=numpy.int32),
+        'node_right': numpy.array(node_right, dtype=numpy.int32),
+        'distance': distance,
+        'weights': weights,
+    }
+
+
+# Find the k nearest neighbours of an instance, with the same interface as KNNIndex.knn_index_search.
+# - 'x' is the instance, as a sequence of attribute values.
+# Return a pair of arrays (neighbour rows of tree['features'], neighbour distances), sorted by increasing distance.
+# For the 'euclidean' distance the squared distances are returned, as the ones returned by kdtree.
+def knn_ball_tree_search(tree, x, k):
+    features, node_center, node_radius = tree['features'], tree['node_center'], tree['node_radius']
+    node_start, node_end = tree['node_start'], tree['node_end']
+    node_left, node_right = tree['node_left'], tree['node_right']
+    distance, weights = tree['distance'], tree['weights']
+    x = numpy.asarray(x, dtype=numpy.float64)
+
+    best_rows = numpy.empty(0, dtype=numpy.int64)
+    best_distances = numpy.empty(0, dtype=numpy.float64)
+    worst_distance = numpy.inf
+    nodes_visited = 0
+    # Stack of pairs (node, lower bound of the distance from x to the instances of the node).
+    stack = [(0, 0.0)]
+    while stack:
+        node, bound = stack.pop()
+        if bound > worst_distance:
+            continue
+        nodes_visited += 1
+        left = node_left[node]
+        if left < 0:
+            start, end = node_start[node], node_end[node]
+            distances = __ball_tree_distances(features[start:end], x, distance, weights)
+            best_rows = numpy.concatenate((best_rows, numpy.arange(start, end)))
+            best_distances = numpy.concatenate((best_distances, distances))
+            if len(best_distances) > k:
+                nearest = numpy.argpartition(best_distances, k - 1)[:k]
+                best_rows, best_distances = best_rows[nearest], best_distances[nearest]
+            if len(best_distances) == k:
+                worst_distance = best_distances.max()
+            continue
+        children = [left, node_right[node]]
+        center_distances = __ball_tree_distances(node_center[children], x, distance, weights)
+        bounds = numpy.maximum(center_distances - node_radius[children], 0.0)
+        # Visit first the child whose center is nearer to x.
+        near, far = (0, 1) if center_distances[0] <= center_distances[1] else (1, 0)
+        stack.append((children[far], bounds[far]))
+        stack.append((children[near], bounds[near]))
+    Instrumentation.instrumentation_count('knn_ball_tree_nodes_visited', nodes_visited)
+
+    order = numpy.argsort(best_distances, kind='stable')
+    best_rows, best_distances = best_rows[order], best_distances[order]
+    if distance == 'euclidean':
+        # Computed from the differences, as the other engines, instead of squaring the square root.
+        differences = features[best_rows] - x
+        best_distances = (differences * differences) @ weights
+    return best_rows, best_distances
+
+
+# Find the k nearest neighbours of each row of 'queries' at once, traversing together the tree and a ball tree of the
+# queries built with the same distance and weights (dual-tree search).
+# - 'queries' is a matrix with one instance per row.
+# The distance between the instances of two balls is at least the distance between their centers minus both radii, so
+# a pair of nodes (node of queries, node of the tree) is discarded when that bound is larger than the distance to the
+# k-th neighbour found so far of every query of the node. Otherwise, the largest of the two nodes is split, and the
+# pairs of leaves compute the distances of all their instances at once.
+# Return a pair of matrices (neighbour rows of tree['features'], neighbour distances), with one row per query, sorted
+# by increasing distance, with the same distances as knn_ball_tree_search.
+def knn_ball_tree_search_batch(tree, queries, k):
+    features, node_center, node_radius = tree['features'], tree['node_center'], tree['node_radius']
+    node_start, node_end = tree['node_start'], tree['node_end']
+    node_left, node_right = tree['node_left'], tree['node_right']
+    distance, weights = tree['distance'], tree['weights']
+    k = min(k, len(features))
+    if len(queries) == 0 or k == 0:
+        return numpy.empty((len(queries), k), dtype=numpy.int64), numpy.empty((len(queries), k))
+    queries = numpy.asarray(queries, dtype=numpy.float64).reshape(len(queries), -1)
+
+    query_tree = knn_ball_tree_build(queries, numpy.zeros(len(queries)), distance, weights,
+                                     knn_ball_tree_query_leaf_size)
+    query_features, query_center, query_radius = (query_tree['features'], query_tree['node_center'],
+                                                  query_tree['node_radius'])
+    query_start, query_end = query_tree['node_start'], query_tree['node_end']
+    query_left, query_right = query_tree['node_left'], query_tree['node_right']
+
+    def pair_bound(query_node, node):
+        center_distance = __ball_tree_distances(node_center[node], query_center[query_node], distance, weights)
+        return max(float(center_distance) - query_radius[query_node] - node_radius[node], 0.0)
+
+    # Neighbours found so far of each query, in the order of the tree of queries.
+    best_rows = numpy.full((len(queries), k), -1, dtype=numpy.int64)
+    best_distances = numpy.full((len(queries), k), numpy.inf)
+    pairs_visited = 0
+    # Stack of triples (node of queries, node of the tree, lower bound of the distance between their instances).
+    stack = [(0, 0, pair_bound(0, 0))]
+    while stack:
+        query_node, node, bound = stack.pop()
+        first, last = query_start[query_node], query_end[query_node]
+        if bound > best_distances[first:last, -1].max():
+            continue
+        pairs_visited += 1
+        start, end = node_start[node], node_end[node]
+        query_is_leaf, is_leaf = query_left[query_node] < 0, node_left[node] < 0
+        if query_is_leaf and is_leaf:
+            leaf_distances = __ball_tree_distances(features[start:end], query_features[first:last, numpy.newaxis, :],
+                                                   distance, weights)
+            distances = numpy.concatenate((best_distances[first:last], leaf_distances), axis=1)
+            leaf_rows = numpy.broadcast_to(numpy.arange(start, end), (last - first, end - start))
+            rows = numpy.concatenate((best_rows[first:last], leaf_rows), axis=1)
+            nearest = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+            best_rows[first:last] = numpy.take_along_axis(rows, nearest, axis=1)
+            best_distances[first:last] = numpy.take_along_axis(distances, nearest, axis=1)
+        elif is_leaf or (not query_is_leaf and last - first >= end - start):
+            for child in (query_left[query_node], query_right[query_node]):
+                stack.append((child, node, pair_bound(child, node)))
+        else:
+            children = [(pair_bound(query_node, child), child) for child in (node_left[node], node_right[node])]
+            # Visit first the child nearest to the queries, so the distances to the k-th neighbours shrink sooner.
+            for child_bound, child in sorted(children, reverse=True):
+                stack.append((query_node, child, child_bound))
+    Instrumentation.instrumentation_count('knn_ball_tree_node_pairs_visited', pairs_visited)
+
+    order = numpy.argsort(best_distances, axis=1, kind='stable')
+    best_rows = numpy.take_along_axis(best_rows, order, axis=1)
+    best_distances = numpy.take_along_axis(best_distances, order, axis=1)
+    if distance == 'euclidean':
+        # Computed from the differences, as knn_ball_tree_search.
+        differences = features[best_rows] - query_features[:, numpy.newaxis, :]
+        best_distances = (differences * differences) @ weights
+    rows = numpy.empty_like(best_rows)
+    distances = numpy.empty_like(best_distances)
+    rows[query_tree['row_ids']] = best_rows
+    distances[query_tree['row_ids']] = best_distances
+    return rows, distances
@@ -0,0 +1,149 @@
+"""
+This module implements a random projection forest stored in flat arrays, used by the approximate 'forest' engine of
+KNN.
+
+Each tree splits the training instances recursively at the median of their projection over a random direction, until
+the leaves have at most leaf_size instances. All the nodes at the same depth of a tree use the same direction, so a
+tree only keeps one direction per level. A query descends each tree to a single leaf, without backtracking, and its
+neighbours are searched only among the instances of those leaves. More trees give a higher recall (the proportion of
+the exact nearest neighbours found) at the cost of a slower search.
+
+The forest is a dictionary with the following arrays:
++ 'features': matrix with one training instance (without class label) per row.
++ 'labels': class label of each row of 'features'.
++ 'orders': matrix with one row per tree, with the rows of 'features' ordered so that each node of the tree covers a
+contiguous range of it.
++ 'directions': array with the random direction of each level of each tree (trees x levels x attributes).
++ 'roots': root node of each tree.
++ 'node_start', 'node_end': range of 'orders' covered by each node.
++ 'node_split': projection value used to split each node.
++ 'node_left', 'node_right': children of each node, or -1 if the node is a leaf.
++ 'leaf_capacity': the number of instances of the largest leaf.
+"""
+
+import math
+import numpy
+
+
+# Default number of trees of the forest.
+knn_forest_trees = 16
+
+# Maximum number of training instances in a leaf of a tree (unless all its instances have the same projection).
+knn_forest_leaf_size = 32
+
+# Default seed for the random directions.
+knn_forest_seed = 0
+
+
+# Builds a random projection forest of a training set.
+# - 'features' is a matrix with one training instance (without class label) per row.
+# - 'labels' is a sequence with the class label of each row. Labels must be integers between 0 and 255.
+# - 'trees' is the number of trees. It is the knob between recall and speed.
+# Returns the forest as a dictionary of arrays.
+def knn_forest_build(features, labels, trees=knn_forest_trees, leaf_size=knn_forest_leaf_size, seed=knn_forest_seed):
+    features = numpy.ascontiguousarray(features, dtype=numpy.float64)
+    rows_number, attributes_number = features.shape
+    generator = numpy.random.default_rng(seed)
+    # The median splits halve the nodes, so this many levels are enough unless there are many repeated projections.
+    levels = max(1, math.ceil(math.log2(max(rows_number, 1) / leaf_size)) + 4)
+    directions = generator.standard_normal((trees, levels, attributes_number))
+    orders, roots = [], []
+    node_start, node_end, node_split, node_left, node_right = [], [], [], [], []
+
+    def add_node(start, end):
+        node_start.append(start)
+        node_end.append(end)
+        node_split.append(0.0)
+        node_left.append(-1)
+        node_right.append(-1)
+        return len(node_start) - 1
+
+    for tree in range(trees):
+        order = numpy.arange(rows_number)
+        roots.append(add_node(0, rows_number))
+        # Stack of nodes to split: (node number, first position, last position + 1, level).
+        stack = [(roots[-1], 0, rows_number, 0)]
+        while stack:
+            node, start, end, level = stack.pop()
+            if end - start <= leaf_size or level == levels:
+                continue
+            projections = features[order[start:end]] @ directions[tree, level]
+            middle = (end - start) // 2
+            partition = numpy.argpartition(projections, middle)
+            split = projections[partition[middle]]
+            if split == projections.min():
+                # The instances of the left side wouldn't be reached by any query, so the node isn't split.
+                continue
+            order[start:end] = order[start:end][partition]
+            node_split[node] = float(split)
+            node_left[node] = add_node(start, start + middle)
+            node_right[node] = add_node(start + middle, end)
+            stack.append((node_left[node], start, start + middle, level + 1))
+            stack.append((node_right[node], start + middle, end, level + 1))
+        orders.append(order)
+
+    node_start = numpy.array(node_start, dtype=numpy.int64)
+    node_end = numpy.array(node_end, dtype=numpy.int64)
+    node_left = numpy.array(node_left, dtype=numpy.int64)
+    leaves = node_left < 0
+    return {
+        'features': features,
+        'labels': numpy.asarray(labels, dtype=numpy.uint8),
+        'orders': numpy.array(orders, dtype=numpy.int64).reshape(trees, rows_number),
+        'directions': directions,
+        'roots': numpy.array(roots, dtype=numpy.int64),
+        'node_start': node_start,
+        'node_end': node_end,
+        'node_split': numpy.array(node_split, dtype=numpy.float64),
+        'node_left': node_left,
+        'node_right': numpy.array(node_right, dtype=numpy.int64),
+        'leaf_capacity': numpy.array(int((node_end - node_start)[leaves].max()) if leaves.any() else 0),
+    }
+
+
+# Find the approximate k nearest neighbours of each row of 'queries'.
+# - 'queries' is a matrix with one instance per row.
+# Return a pair of matrices (neighbour rows of forest['features'], neighbour distances) with one row per query, where
+# the neighbours are sorted by increasing distance. Distances are squared euclidean distances, as the ones returned by
+# kdtree. If the leaves of a query have less than k different instances, the missing neighbours have row 0 and
+# infinite distance.
+def knn_forest_search_block(forest, queries, k):
+    features, orders = forest['features'], forest['orders']
+    node_start, node_end, node_split = forest['node_start'], forest['node_end'], forest['node_split']
+    node_left, node_right = forest['node_left'], forest['node_right']
+    queries = numpy.asarray(queries, dtype=numpy.float64).reshape(-1, features.shape[1])
+    capacity = int(forest['leaf_capacity'])
+    rows_number = len(features)
+
+    candidates = []
+    for tree, root in enumerate(forest['roots']):
+        # Descend the tree with all the queries at once, one level at a time.
+        nodes = numpy.full(len(queries), root)
+        for direction in forest['directions'][tree]:
+            internal = node_left[nodes] >= 0
+            if not internal.any():
+                break
+            projections = queries @ direction
+            children = numpy.where(projections < node_split[nodes], node_left[nodes], node_right[nodes])
+            nodes = numpy.where(internal, children, nodes)
+        positions = node_start[nodes][:, numpy.newaxis] + numpy.arange(capacity)
+        rows = orders[tree][numpy.minimum(positions, rows_number - 1)]
+        # Positions after the end of the leaf are marked with rows_number, which is not a valid row.
+        candidates.append(numpy.where(positions < node_end[nodes][:, numpy.newaxis], rows, rows_number))
+    candidates = numpy.sort(numpy.concatenate(candidates, axis=1), axis=1)
+    # The same instance may be in the leaves of several trees. Only its first appearance is kept.
+    repeated = numpy.zeros(candidates.shape, dtype=bool)
+    repeated[:, 1:] = candidates[:, 1:] == candidates[:, :-1]
+    invalid = repeated | (candidates == rows_number)
+    candidates[invalid] = 0
+
+    differences = features[candidates] - queries[:, numpy.newaxis, :]
+    distances = numpy.einsum('ijk,ijk->ij', differences, differences)
+    distances[invalid] = numpy.inf
+    k = min(k, candidates.shape[1])
+    if k < candidates.shape[1]:
+        nearest = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+        candidates = numpy.take_along_axis(candidates, nearest, axis=1)
+        distances = numpy.take_along_axis(distances, nearest, axis=1)
+    order = numpy.argsort(distances, axis=1, kind='stable')
+    return numpy.take_along_axis(candidates, order, axis=1), numpy.take_along_axis(distances, order, axis=1)
@@ -0,0 +1,246 @@
+"""
+This module implements a k-d-tree stored in flat arrays, used by the 'index' engine of KNN.
+The index is built once by the preprocessing step and saved to a binary file, which is later opened with mmap, so
+loading it doesn't need to parse the processed data nor to rebuild the tree.
+
+The training instances are reordered so that each node of the tree covers a contiguous range of rows. The index is a
+dictionary with the following arrays:
++ 'features': matrix with one training instance (without class label) per row, in the order of the tree.
++ 'labels': class label of each row of 'features'.
++ 'row_ids': position of each row of 'features' in the processed data file.
++ 'node_start', 'node_end': range of rows covered by each node. The root is node 0.
++ 'node_dimension', 'node_split': attribute and value used to split each node.
++ 'node_left', 'node_right': children of each node, or -1 if the node is a leaf.
++ 'node_lower', 'node_upper': bounding box of the instances of each node (minimum and maximum of each attribute).
+
+knn_index_search finds the neighbours of one instance. knn_index_search_batch finds the neighbours of many instances
+in one call: it builds a tree of the instances too, and traverses both trees together, so the nodes of training
+instances far from a whole node of instances are discarded once for all of them.
+"""
+
+import numpy
+import Instrumentation
+import Utils
+
+
+# Version of the binary format of the index. It changes when the saved arrays change.
+knn_index_version = 2
+
+# Maximum number of training instances in a leaf of the tree.
+knn_index_leaf_size = 32
+
+# Maximum number of instances in a leaf of the tree of instances built by knn_index_search_batch.
+knn_index_query_leaf_size = 32
+
+
+# Builds the index of a training set.
+# - 'features' is a matrix with one training instance (without class label) per row.
+# - 'labels' is a sequence with the class label of each row. Labels must be integers between 0 and 255.
+# - 'dtype' is the type used for storing the features (numpy.float64 or numpy.float32).
+# Returns the index as a dictionary of arrays.
+def knn_index_build(features, labels, leaf_size=knn_index_leaf_size, dtype=numpy.float64):
+    features = numpy.asarray(features, dtype=dtype)
+    order = numpy.arange(len(features))
+    node_start, node_end, node_dimension, node_split, node_left, node_right = [], [], [], [], [], []
+
+    # Stack of nodes to split: (node number, first row, last row + 1). 'order' is partitioned in place.
+    def add_node(start, end):
+        node_start.append(start)
+        node_end.append(end)
+        node_dimension.append(0)
+        node_split.append(0.0)
+        node_left.append(-1)
+        node_right.append(-1)
+        return len(node_start) - 1
+
+    stack = [(add_node(0, len(features)), 0, len(features))]
+    while stack:
+        node, start, end = stack.pop()
+        if end - start <= leaf_size:
+            continue
+        rows = features[order[start:end]]
+        # Split by the attribute with the widest range of values, at its median.
+        spread = rows.max(axis=0) - rows.min(axis=0)
+        dimension = int(numpy.argmax(spread))
+        if spread[dimension] == 0:
+            # All the instances are equal, so the node can't be split.
+            continue
+        middle = (end - start) // 2
+        partition = numpy.argpartition(rows[:, dimension], middle)
+        order[start:end] = order[start:end][partition]
+        node_dimension[node] = dimension
+        node_split[node] = float(features[order[start + middle], dimension])
+        node_left[node] = add_node(start, start + middle)
+        node_right[node] = add_node(start + middle, end)
+        stack.append((node_left[node], start, start + middle))
+        stack.append((node_right[node], start + middle, end))
+
+    features = numpy.ascontiguousarray(features[order])
+    # The children of a node are added after it, so the boxes are computed from the last node to the root.
+    node_lower = numpy.full((len(node_start), features.shape[1]), numpy.inf)
+    node_upper = numpy.full((len(node_start), features.shape[1]), -numpy.inf)
+    for node in range(len(node_start) - 1, -1, -1):
+        if node_left[node] >= 0:
+            node_lower[node] = numpy.minimum(node_lower[node_left[node]], node_lower[node_right[node]])
+            node_upper[node] = numpy.maximum(node_upper[node_left[node]], node_upper[node_right[node]])
+        elif node_end[node] > node_start[node]:
+            node_lower[node] = features[node_start[node]:node_end[node]].min(axis=0)
+            node_upper[node] = features[node_start[node]:node_end[node]].max(axis=0)
+
+    return {
+        'features': features,
+        'labels': numpy.asarray(labels, dtype=numpy.uint8)[order],
+        'row_ids': order.astype(numpy.int64),
+        'node_start': numpy.array(node_start, dtype=numpy.int64),
+        'node_end': numpy.array(node_end, dtype=numpy.int64),
+        'node_dimension': numpy.array(node_dimension, dtype=numpy.int32),
+        'node_split': numpy.array(node_split, dtype=numpy.float64),
+        'node_left': numpy.array(node_left, dtype=numpy.int32),
+        'node_right': numpy.array(node_right, dtype=numpy.int32),
+        'node_lower': node_lower,
+        'node_upper': node_upper,
+    }
+
+
+# Saves the index to a binary file.
+def knn_index_save(index, index_file_path):
+    Utils.save_arrays(index_file_path, index, {'version': knn_index_version})
+
+
+# Opens an index saved with knn_index_save. The arrays are memory mapped, so opening it takes milliseconds and the
+# memory is shared by all the processes that open the same file.
+def knn_index_load(index_file_path):
+    index, metadata = Utils.load_arrays(index_file_path)
+    if metadata.get('version') != knn_index_version:
+        raise Exception('KNNIndex.knn_index_load: ' + index_file_path + ' has an unsupported index version')
+    return index
+
+
+# Returns true iff the index file was saved with the current version of the index (so it has all the arrays that the
+# searches use).
+def knn_index_is_current(index_file_path):
+    return Utils.load_arrays(index_file_path)[1].get('version') == knn_index_version
+
+
+# Find the k nearest neighbours of an instance.
+# - 'x' is the instance, as a sequence of attribute values.
+# Return a pair of arrays (neighbour rows of index['features'], neighbour distances), sorted by increasing distance.
+# Distances are squared euclidean distances, as the ones returned by kdtree.
+def knn_index_search(index, x, k):
+    features = index['features']
+    node_start, node_end = index['node_start'], index['node_end']
+    node_dimension, node_split = index['node_dimension'], index['node_split']
+    node_left, node_right = index['node_left'], index['node_right']
+    x = numpy.asarray(x, dtype=numpy.float64)
+
+    best_rows = numpy.empty(0, dtype=numpy.int64)
+    best_distances = numpy.empty(0, dtype=numpy.float64)
+    worst_distance = numpy.inf
+    nodes_visited = 0
+    # Stack of pairs (node, lower bound of the distance from x to the instances of the node).
+    stack = [(0, 0.0)]
+    while stack:
+        node, bound = stack.pop()
+        if bound > worst_distance:
+            continue
+        nodes_visited += 1
+        left = node_left[node]
+        if left < 0:
+            start, end = node_start[node], node_end[node]
+            differences = features[start:end] - x
+            distances = numpy.einsum('ij,ij->i', differences, differences)
+            best_rows = numpy.concatenate((best_rows, numpy.arange(start, end)))
+            best_distances = numpy.concatenate((best_distances, distances))
+            if len(best_distances) > k:
+                nearest = numpy.argpartition(best_distances, k - 1)[:k]
+                best_rows, best_distances = best_rows[nearest], best_distances[nearest]
+            if len(best_distances) == k:
+                worst_distance = best_distances.max()
+            continue
+        plane_distance = x[node_dimension[node]] - node_split[node]
+        # Visit first the side of the splitting plane that contains x.
+        if plane_distance < 0:
+            near, far = left, node_right[node]
+        else:
+            near, far = node_right[node], left
+        stack.append((far, plane_distance * plane_distance))
+        stack.append((near, bound))
+
+    Instrumentation.instrumentation_count('knn_index_nodes_visited', nodes_visited)
+    order = numpy.argsort(best_distances, kind='stable')
+    return best_rows[order], best_distances[order]
+
+
+# Returns the squared euclidean distance between two bounding boxes, which is a lower bound of the distance between any
+# instance of one box and any instance of the other.
+def __knn_index_box_distance(lower, upper, other_lower, other_upper):
+    gaps = numpy.maximum(numpy.maximum(lower - other_upper, other_lower - upper), 0.0)
+    return float(gaps @ gaps)
+
+
+# Find the k nearest neighbours of each row of 'queries' at once, traversing together the tree of the index and a
+# tree of the queries (dual-tree search).
+# - 'queries' is a matrix with one instance per row.
+# A pair of nodes (node of queries, node of the index) is discarded when the distance between their bounding boxes is
+# larger than the distance to the k-th neighbour found so far of every query of the node. Otherwise, the largest of
+# the two nodes is split, and the pairs of leaves compute the distances of all their instances at once.
+# Return a pair of matrices (neighbour rows of index['features'], neighbour distances), with one row per query, sorted
+# by increasing distance. The distances are the same as the ones of knn_index_search.
+def knn_index_search_batch(index, queries, k):
+    features = index['features']
+    node_start, node_end = index['node_start'], index['node_end']
+    node_left, node_right = index['node_left'], index['node_right']
+    node_lower, node_upper = index['node_lower'], index['node_upper']
+    k = min(k, len(features))
+    if len(queries) == 0 or k == 0:
+        return numpy.empty((len(queries), k), dtype=numpy.int64), numpy.empty((len(queries), k))
+    queries = numpy.asarray(queries, dtype=numpy.float64).reshape(len(queries), -1)
+
+    query_tree = knn_index_build(queries, numpy.zeros(len(queries)), knn_index_query_leaf_size)
+    query_features = query_tree['features']
+    query_start, query_end = query_tree['node_start'], query_tree['node_end']
+    query_left, query_right = query_tree['node_left'], query_tree['node_right']
+    query_lower, query_upper = query_tree['node_lower'], query_tree['node_upper']
+
+    # Neighbours found so far of each query, in the order of the tree of queries.
+    best_rows = numpy.full((len(queries), k), -1, dtype=numpy.int64)
+    best_distances = numpy.full((len(queries), k), numpy.inf)
+    pairs_visited = 0
+    # Stack of triples (node of queries, node of the index, lower bound of the distance between their instances).
+    stack = [(0, 0, __knn_index_box_distance(query_lower[0], query_upper[0], node_lower[0], node_upper[0]))]
+    while stack:
+        query_node, node, bound = stack.pop()
+        first, last = query_start[query_node], query_end[query_node]
+        if bound > best_distances[first:last, -1].max():
+            continue
+        pairs_visited += 1
+        start, end = node_start[node], node_end[node]
+        query_is_leaf, is_leaf = query_left[query_node] < 0, node_left[node] < 0
+        if query_is_leaf and is_leaf:
+            differences = features[start:end] - query_features[first:last, numpy.newaxis, :]
+            distances = numpy.concatenate((best_distances[first:last],
+                                           numpy.einsum('ijk,ijk->ij', differences, differences)), axis=1)
+            leaf_rows = numpy.broadcast_to(numpy.arange(start, end), (last - first, end - start))
+            rows = numpy.concatenate((best_rows[first:last], leaf_rows), axis=1)
+            nearest = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+            best_rows[first:last] = numpy.take_along_axis(rows, nearest, axis=1)
+            best_distances[first:last] = numpy.take_along_axis(distances, nearest, axis=1)
+        elif is_leaf or (not query_is_leaf and last - first >= end - start):
+            for child in (query_left[query_node], query_right[query_node]):
+                stack.append((child, node, __knn_index_box_distance(query_lower[child], query_upper[child],
+                                                                    node_lower[node], node_upper[node])))
+        else:
+            children = [(__knn_index_box_distance(query_lower[query_node], query_upper[query_node],
+                                                  node_lower[child], node_upper[child]), child)
+                        for child in (node_left[node], node_right[node])]
+            # Visit first the child nearest to the queries, so the distances to the k-th neighbours shrink sooner.
+            for child_bound, child in sorted(children, reverse=True):
+                stack.append((query_node, child, child_bound))
+
+    Instrumentation.instrumentation_count('knn_index_node_pairs_visited', pairs_visited)
+    order = numpy.argsort(best_distances, axis=1, kind='stable')
+    rows = numpy.empty_like(best_rows)
+    distances = numpy.empty_like(best_distances)
+    rows[query_tree['row_ids']] = numpy.take_along_axis(best_rows, order, axis=1)
+    distances[query_tree['row_ids']] = numpy.take_along_axis(best_distances, order, axis=1)
+    return rows, distances
@@ -0,0 +1,123 @@
+"""
+This module implements the compact training set of the 'packed' engine of KNN. The continuous attributes of the
+training instances are stored as float32, and the binary attributes (as the OneHot attributes of Cover type) as bits,
+64 per word, so a training instance of Cover type takes 53 bytes (with the squared norm of its continuous attributes and
+its label) instead of the 432 bytes of its row of float64 attributes.
+
+The squared euclidean distance between two instances is the squared euclidean distance of their continuous
+attributes plus the number of binary attributes where they differ, which is the number of bits set in the XOR of
+their words (popcount). numpy.bitwise_count counts them when it is available (numpy >= 2.0), and a table with the
+bits of each byte otherwise.
+
+The packed training set is a dictionary with the following arrays:
++ 'continuous': float32 matrix with the continuous attributes of each training instance.
++ 'continuous_columns': columns of the instances stored in 'continuous'.
++ 'continuous_squared_norms': squared norm of each row of 'continuous'.
++ 'bits': matrix with the binary attributes of each training instance, packed in words of 64 bits.
++ 'binary_columns': columns of the instances stored in 'bits'.
++ 'labels': class label of each training instance.
+"""
+
+import numpy
+import Utils
+
+
+# Version of the binary format of the packed training set. It changes when the saved arrays change.
+knn_packed_version = 1
+
+# Number of bits set in each byte, for counting bits when numpy doesn't have bitwise_count.
+__knn_packed_byte_bits = numpy.array([bin(byte).count('1') for byte in range(256)], dtype=numpy.uint8)
+
+
+# Returns an array with the number of bits set in each word of 'words' (an array of numpy.uint64).
+def __knn_packed_count_bits(words):
+    if hasattr(numpy, 'bitwise_count'):
+        return numpy.bitwise_count(words)
+    counts = __knn_packed_byte_bits[numpy.ascontiguousarray(words).view(numpy.uint8)]
+    return counts.reshape(words.shape + (8,)).sum(axis=-1, dtype=numpy.uint8)
+
+
+# Packs the binary attributes of each row of 'matrix' in words of 64 bits.
+# - 'binary_columns' is the list of columns of 'matrix' with binary attributes. Their values must be 0 or 1.
+# Returns a matrix of numpy.uint64 with one row per row of 'matrix' and one column per word.
+def knn_packed_pack_bits(matrix, binary_columns):
+    binary = numpy.asarray(matrix)[:, list(binary_columns)]
+    if not numpy.isin(binary, [0, 1]).all():
+        raise Exception('KNNPacked.knn_packed_pack_bits: the binary attributes must be 0 or 1')
+    words_number = -(-len(binary_columns) // 64)
+    packed = numpy.packbits(binary.astype(bool), axis=1, bitorder='little')
+    padded = numpy.zeros((len(binary), 8 * words_number), dtype=numpy.uint8)
+    padded[:, :packed.shape[1]] = packed
+    return padded.view(numpy.uint64)
+
+
+# Builds the packed training set.
+# - 'features' is a matrix with one training instance (without class label) per row.
+# - 'labels' is a sequence with the class label of each row. Labels must be integers between 0 and 255.
+# - 'binary_columns' is the list of columns with binary attributes (for instance, the OneHot columns of the schema of
+# the data set). The other columns are continuous.
+# Returns the packed training set as a dictionary of arrays.
+def knn_packed_build(features, labels, binary_columns=()):
+    features = numpy.asarray(features, dtype=numpy.float64).reshape(len(features), -1)
+    binary_columns = sorted(binary_columns)
+    continuous_columns = [column for column in range(features.shape[1]) if column not in set(binary_columns)]
+    continuous = numpy.ascontiguousarray(features[:, continuous_columns], dtype=numpy.float32)
+    return {
+        'continuous': continuous,
+        'continuous_columns': numpy.array(continuous_columns, dtype=numpy.int64),
+        'continuous_squared_norms': numpy.einsum('ij,ij->i', continuous, continuous),
+        'bits': knn_packed_pack_bits(features, binary_columns),
+        'binary_columns': numpy.array(binary_columns, dtype=numpy.int64),
+        'labels': numpy.asarray(labels, dtype=numpy.uint8),
+    }
+
+
+# Saves the packed training set to a binary file.
+def knn_packed_save(packed, packed_file_path):
+    Utils.save_arrays(packed_file_path, packed, {'version': knn_packed_version})
+
+
+# Opens a packed training set saved with knn_packed_save. The arrays are memory mapped, as in KNNIndex.knn_index_load.
+def knn_packed_load(packed_file_path):
+    packed, metadata = Utils.load_arrays(packed_file_path)
+    if metadata.get('version') != knn_packed_version:
+        raise Exception('KNNPacked.knn_packed_load: ' + packed_file_path + ' has an unsupported version')
+    return packed
+
+
+# Returns true iff the packed file was saved with the current version of the packed training set (so it has all the
+# arrays that the searches use).
+def knn_packed_is_current(packed_file_path):
+    return Utils.load_arrays(packed_file_path)[1].get('version') == knn_packed_version
+
+
+# Returns the number of bytes of the arrays of the packed training set.
+def knn_packed_bytes(packed):
+    return sum(array.nbytes for array in packed.values())
+
+
+# Find the k nearest neighbours of a block of instances at once.
+# - 'queries' is a matrix with one instance (without class label) per row, with all the columns of the training
+# instances.
+# Return a pair of matrices (neighbour rows, neighbour distances), with one row per query, sorted by increasing
+# distance. Distances are squared euclidean distances, computed from the float32 attributes of the training instances.
+def knn_packed_search_block(packed, queries, k):
+    queries = numpy.asarray(queries, dtype=numpy.float64).reshape(len(queries), -1)
+    continuous, bits = packed['continuous'], packed['bits']
+    query_continuous = queries[:, packed['continuous_columns']]
+    query_bits = knn_packed_pack_bits(queries, packed['binary_columns'])
+    # The squared norm of the query is the same for all the training instances, so it isn't needed for ranking them.
+    scores = packed['continuous_squared_norms'] - 2.0 * (query_continuous.astype(numpy.float32) @ continuous.T)
+    for word in range(bits.shape[1]):
+        scores += __knn_packed_count_bits(bits[:, word] ^ query_bits[:, word, numpy.newaxis])
+    k = min(k, len(continuous))
+    if k < scores.shape[1]:
+        candidates = numpy.argpartition(scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = numpy.tile(numpy.arange(scores.shape[1]), (len(queries), 1))
+    # Compute the exact distances to the candidates, as the 'brute' engine of KNN does.
+    differences = continuous[candidates] - query_continuous[:, numpy.newaxis, :]
+    distances = numpy.einsum('ijk,ijk->ij', differences, differences)
+    distances += __knn_packed_count_bits(bits[candidates] ^ query_bits[:, numpy.newaxis, :]).sum(axis=2)
+    order = numpy.argsort(distances, axis=1, kind='stable')
+    return numpy.take_along_axis(candidates, order, axis=1), numpy.take_along_axis(distances, order, axis=1)
@@ -2,18 +2,29 @@
 Read the data sets Iris and Cover type and process the instances, so that it can be used by the algorithms.
 
 For K-NN:
-+ normalize the attributes (assuming normal distribution).
++ normalize the attributes (min-max scaling). The scaler is saved, so new instances can be normalized the same way.
 + leave unchanged the binary attributes of Cover type (OneHot).
-+ remove the class label of each instance. Manage a hash table that for each instance (without class label) returns
-the associated class label.
++ remove the class label of each instance. Each instance in the k-d-tree knows its row number, and the class labels
+are stored in an array indexed by row number.
 + return the k-d-tree which contains all the instances.
++ save the index of KNNIndex, which is opened with mmap instead of rebuilding the k-d-tree.
++ save the packed training set of KNNPacked (float32 continuous attributes and the OneHot attributes as bits).
++ select prototypes of the training instances (see KNNPrototypes), saved as an alternate processed data file.
 """
 
-import ast
 import json
 import kdtree
+import numpy
+import os
 import random
-import Utils
+import sys
+import time
+import Instrumentation
+import KNNIndex
+import KNNPacked
+import KNNPrototypes
+import Parser
+import Schema
 
 
 """
@@ -27,6 +38,18 @@ knn_iris_validation_file_name = knn_directory + 'iris_validation.data'
 knn_covtype_data_file_name = knn_directory + 'covtype_data.json'
 knn_covtype_processed_data_file_name = knn_directory + 'covtype_processed_data.data'
 knn_covtype_validation_file_name = knn_directory + 'covtype_validation.data'
+knn_iris_index_file_name = knn_directory + 'iris_index.bin'
+knn_covtype_index_file_name = knn_directory + 'covtype_index.bin'
+knn_iris_scaler_file_name = knn_directory + 'iris_scaler.json'
+knn_covtype_scaler_file_name = knn_directory + 'covtype_scaler.json'
+knn_iris_prototypes_file_name = knn_directory + 'iris_prototypes.data'
+knn_covtype_prototypes_file_name = knn_directory + 'covtype_prototypes.data'
+knn_iris_prototypes_index_file_name = knn_directory + 'iris_prototypes_index.bin'
+knn_covtype_prototypes_index_file_name = knn_directory + 'covtype_prototypes_index.bin'
+knn_iris_packed_file_name = knn_directory + 'iris_packed.bin'
+knn_covtype_packed_file_name = knn_directory + 'covtype_packed.bin'
+knn_iris_prototypes_packed_file_name = knn_directory + 'iris_prototypes_packed.bin'
+knn_covtype_prototypes_packed_file_name = knn_directory + 'covtype_prototypes_packed.bin'
 
 
 # Parse the instances
@@ -36,34 +59,17 @@ knn_covtype_validation_file_name = knn_directory + 'covtype_validation.data'
 #       -> data set (contains the tuples of the data set)
 # Save the dictionary in knn_data (json) and return it.
 def __knn_parse_instances(data_set_file_path):
-    # Parse each instance line to a list
-    with open(data_set_file_path, 'r') as data_set_file:
-        instances_lines = data_set_file.readlines()
-    # Get the amount of classes
-    if 'iris' in data_set_file_path:
-        classes_number = 3
-    elif 'covtype' in data_set_file_path:
-        classes_number = 7
-    else:
-        raise Exception('Parser.knn_parse_binary_attributes: "iris" or "covtype" not present in data set file' +
-                        ' path')
+    schema = Schema.schema_of_data_set(data_set_file_path)
     # Initialize empty dictionary
     data = {}
-    dataset = []
-    # Add each line to the data set
-    for instance_line in instances_lines:
-        instance_tokens = instance_line.split(',')
-        class_label = Utils.num(instance_tokens[-1])
-        # Adjust the class label range of cover type from [1,...,7] to [0,...,6]
-        class_label = class_label if 'iris' in data_set_file_path else class_label - 1
-        instance_tokens[-1] = class_label
-        # Change the attributes from str to its current type
-        for instance_index in range(len(instance_tokens)-1):
-            instance_tokens[instance_index] = Utils.num(instance_tokens[instance_index])
-        dataset.append(instance_tokens)
+    rows = Parser.load_numeric_file(data_set_file_path)
+    # Add each instance, with the class label at the end. Class labels start at 0 (the class labels of cover type are
+    # in the range [1,...,7] in the data set file).
+    dataset = [attributes + [class_label] for attributes, class_label in
+               zip(Schema.schema_attributes(schema, rows).tolist(), Schema.schema_labels(schema, rows).tolist())]
     data["dataset"] = dataset
     data["attributes_count"] = len(dataset[0])-1
-    data["class_count"] = classes_number
+    data["class_count"] = schema['classes_number']
 
     # Save the instances dictionary as a json file
     if 'iris' in data_set_file_path:
@@ -83,16 +89,45 @@ def __knn_load_instances(instances_file_path):
     return instances_per_class_string_keys
 
 
-# Returns the minimum and maximum value of an attribute on the data set as a tuple (min, max)
-def __knn_range_attribute_value(data, attribute):
-    minimum_attribute_value = data["dataset"][0][attribute]
-    maximum_attribute_value = minimum_attribute_value
-    for entry in data["dataset"]:
-        if entry[attribute] < minimum_attribute_value:
-            minimum_attribute_value = entry[attribute]
-        if entry[attribute] > maximum_attribute_value:
-            maximum_attribute_value = entry[attribute]
-    return minimum_attribute_value, maximum_attribute_value
+# Computes the minimum and maximum value of each attribute in one pass.
+# - 'matrix' is a matrix with one instance (without class label) per row.
+# Returns the scaler: a dictionary with the lists 'minimum' and 'maximum', with one value per attribute.
+def knn_fit_scaler(matrix):
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+    return {'minimum': matrix.min(axis=0).tolist(), 'maximum': matrix.max(axis=0).tolist()}
+
+
+# Normalizes instances with a scaler computed by knn_fit_scaler, rescaling each attribute to [0, 1].
+# Attributes with the same minimum and maximum value are left unchanged.
+# - 'matrix' is a matrix with one instance (without class label) per row.
+# Returns the normalized matrix.
+def knn_apply_scaler(scaler, matrix):
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+    minimum = numpy.array(scaler['minimum'])
+    value_range = numpy.array(scaler['maximum']) - minimum
+    constant = value_range == 0
+    minimum[constant] = 0.0
+    value_range[constant] = 1.0
+    return (matrix - minimum) / value_range
+
+
+# Saves a scaler as a json file.
+def knn_save_scaler(scaler, scaler_file_path):
+    with open(scaler_file_path, 'w') as scaler_file:
+        json.dump(scaler, scaler_file)
+
+
+# Loads the scaler of a data set. If the scaler file doesn't exist, it is computed from the data file saved by
+# __knn_parse_instances (knn_data json) and saved.
+def knn_load_scaler(scaler_file_path, data_file_path):
+    try:
+        with open(scaler_file_path, 'r') as scaler_file:
+            return json.load(scaler_file)
+    except FileNotFoundError:
+        data = __knn_load_instances(data_file_path)
+        scaler = knn_fit_scaler([entry[:-1] for entry in data['dataset']])
+        knn_save_scaler(scaler, scaler_file_path)
+        return scaler
 
 
 # Receives parsed data.
@@ -103,12 +138,15 @@ def __knn_range_attribute_value(data, attribute):
 # 'training_proportion' is the proportion of instances used for training. The remaining are used for validation.
 # Saves the instances for training and validation normalized.
 def __knn_transform_data_set(data, training_proportion):
-    # Normalize the attributes
-    for attribute in range(data["attributes_count"]):
-        (minimum, maximum) = __knn_range_attribute_value(data, attribute)
-        for entry in data["dataset"]:
-            if maximum is not minimum:
-                entry[attribute] = (entry[attribute] - minimum) / (maximum - minimum)
+    # Normalize the attributes, and save the scaler for normalizing new instances
+    attributes = [entry[:-1] for entry in data["dataset"]]
+    scaler = knn_fit_scaler(attributes)
+    for entry, normalized in zip(data["dataset"], knn_apply_scaler(scaler, attributes).tolist()):
+        entry[:-1] = normalized
+    if data['attributes_count'] == 4:
+        knn_save_scaler(scaler, knn_iris_scaler_file_name)
+    else:
+        knn_save_scaler(scaler, knn_covtype_scaler_file_name)
 
     # Save instances for validation
     if data['attributes_count'] == 4:
@@ -132,17 +170,44 @@ def __knn_transform_data_set(data, training_proportion):
         for instance in data['dataset']:
             processed_data_file.write(str(instance) + '\n')
 
+    # Save the index, so it isn't built again on every run
+    if data['attributes_count'] == 4:
+        index_file_name = knn_iris_index_file_name
+    else:
+        index_file_name = knn_covtype_index_file_name
+    index = KNNIndex.knn_index_build([entry[:-1] for entry in data['dataset']],
+                                     [entry[-1] for entry in data['dataset']])
+    KNNIndex.knn_index_save(index, index_file_name)
+
+    # Save the packed training set, built from the processed data just saved
+    if data['attributes_count'] == 4:
+        knn_save_packed(processed_data_file_name, knn_iris_packed_file_name)
+    else:
+        knn_save_packed(processed_data_file_name, knn_covtype_packed_file_name)
+
+
+# Training instance stored in the k-d-tree: a tuple with the attribute values (without class label) that also knows
+# its row number in the processed data, so its class label can be found in the labels array.
+class KNNPoint(tuple):
+    def __new__(cls, attributes, row_id):
+        point = super().__new__(cls, attributes)
+        point.row_id = row_id
+        return point
+
+    def __getnewargs__(self):
+        return tuple(self), self.row_id
 
-# Removes the class label from the list of instances (last index) and returns a pair
-# with the new data set and the hash table (dictionary)
+
+# Removes the class label from the list of instances (last index) and returns a pair with the new data set, as a list
+# of KNNPoint, and an array with the class label of each row.
+# Duplicated instances with different class labels are kept as different points.
 def __knn_remove_class_label(data):
-    dictionary = {}
+    labels = numpy.empty(len(data), dtype=numpy.uint8)
     new_entries = []
-    for entry in data:
-        label = entry.pop(-1)
-        dictionary[tuple(entry)] = label
-        new_entries.append(tuple(entry))
-    return new_entries, dictionary
+    for row_id, entry in enumerate(data):
+        labels[row_id] = entry[-1]
+        new_entries.append(KNNPoint(entry[:-1], row_id))
+    return new_entries, labels
 
 
 def __knn_save_processed_data(dataset_file_path, training_proportion):
@@ -150,28 +215,176 @@ def __knn_save_processed_data(dataset_file_path, training_proportion):
     __knn_transform_data_set(data, training_proportion)
 
 
-def knn_load_processed_data_and_dictionary(processed_data_file_path, validation_file_path):
-    # Convert the lists in the processed_data_file_path to tuples
-    dataset = []
-    with open(processed_data_file_path, 'r') as processed_data_file:
-        processed_data_lines = processed_data_file.readlines()
-    for data_line in processed_data_lines:
-        dataset.append(ast.literal_eval(data_line))
-    classless_dataset, hash_ = __knn_remove_class_label(dataset)
-    # Make the k-d-tree associated with the tuples on the data set
-    tree = kdtree.create(classless_dataset)
-    # Load the validation instances
-    with open(validation_file_path, 'r') as validation_file:
-        validation = []
-        for validation_instance_line in validation_file.readlines():
-            validation.append(ast.literal_eval(validation_instance_line))
+# Loads the validation instances. Returns a dictionary: instance (without class label) -> class label.
+def knn_load_validation_dictionary(validation_file_path):
+    validation = Parser.load_numeric_file(validation_file_path).tolist()
     # Create the validation dictionary
     validation_dictionary = {}
     for validation_instance in validation:
-        validation_dictionary[tuple(validation_instance[:-1])] = validation_instance[-1]
-    return tree, hash_, validation_dictionary
+        validation_dictionary[tuple(validation_instance[:-1])] = int(validation_instance[-1])
+    return validation_dictionary
+
+
+# Reads the validation instances one at a time, without loading the whole file.
+# Yields pairs (instance without class label, class label).
+def knn_iterate_validation_instances(validation_file_path):
+    for validation_instance in Parser.iterate_numeric_file(validation_file_path):
+        yield tuple(validation_instance[:-1]), int(validation_instance[-1])
 
 
+# Loads the processed data for the 'kdtree' engine of KNN.
+# - 'timings', if given, is a dictionary where the seconds spent loading the data ('load_seconds') and building the
+# k-d-tree ('index_build_seconds') are saved.
+# Returns a pair with the k-d-tree of KNNPoint and the array with the class label of each point (indexed by row_id).
+def knn_load_processed_data_tree(processed_data_file_path, timings=None):
+    start_time = time.perf_counter()
+    # Convert the lists in the processed_data_file_path to tuples
+    dataset = Parser.load_numeric_file(processed_data_file_path).tolist()
+    classless_dataset, labels = __knn_remove_class_label(dataset)
+    load_time = time.perf_counter()
+    # Make the k-d-tree associated with the tuples on the data set
+    with Instrumentation.instrumentation_stage('kdtree_create', len(classless_dataset)):
+        tree = kdtree.create(classless_dataset)
+    if timings is not None:
+        timings['load_seconds'] = load_time - start_time
+        timings['index_build_seconds'] = time.perf_counter() - load_time
+    return tree, labels
+
+
+# Loads the processed data for the 'kdtree' engine of KNN, and the validation instances.
+# Returns a tuple with the k-d-tree of KNNPoint, the array with the class label of each point (indexed by row_id) and
+# the validation dictionary.
+def knn_load_processed_data_and_dictionary(processed_data_file_path, validation_file_path):
+    tree, labels = knn_load_processed_data_tree(processed_data_file_path)
+    # Load the validation instances
+    validation_dictionary = knn_load_validation_dictionary(validation_file_path)
+    return tree, labels, validation_dictionary
+
+
+# Loads the processed data. Returns a pair with a matrix with one training instance (without class label) per row
+# and an array with the class label of each row.
+def __knn_load_processed_data_matrix(processed_data_file_path):
+    dataset = Parser.load_numeric_file(processed_data_file_path)
+    return dataset[:, :-1], dataset[:, -1].astype(numpy.int64)
+
+
+# Loads the processed data as used by the 'brute' engine of KNN.
+# Returns a tuple with a matrix with one training instance (without class label) per row, an array with the class
+# label of each row and the validation dictionary.
+def knn_load_processed_data_matrix(processed_data_file_path, validation_file_path):
+    training_matrix, labels = __knn_load_processed_data_matrix(processed_data_file_path)
+    validation_dictionary = knn_load_validation_dictionary(validation_file_path)
+    return training_matrix, labels, validation_dictionary
+
+
+# Loads the validation instances as a matrix with one instance (without class label) per row.
+def knn_load_validation_matrix(validation_file_path):
+    return __knn_load_processed_data_matrix(validation_file_path)[0]
+
+
+# Loads all the instances of a data set, joining the processed data and the validation instances, for instance for
+# cross validation. Returns a pair with a matrix with one instance (without class label) per row and an array with the
+# class label of each row.
+def knn_load_data_set(processed_data_file_path, validation_file_path):
+    training_matrix, labels = __knn_load_processed_data_matrix(processed_data_file_path)
+    validation_matrix, validation_labels = __knn_load_processed_data_matrix(validation_file_path)
+    return numpy.concatenate((training_matrix, validation_matrix)), numpy.concatenate((labels, validation_labels))
+
+
+# Builds the index of KNNIndex from a processed data file and saves it.
+def knn_save_index(processed_data_file_path, index_file_path):
+    training_matrix, labels = __knn_load_processed_data_matrix(processed_data_file_path)
+    KNNIndex.knn_index_save(KNNIndex.knn_index_build(training_matrix, labels), index_file_path)
+
+
+# Opens the index of KNNIndex. If the index file doesn't exist (for instance, if the processed data was generated
+# before indexes were saved) or it was saved with an older version of the index, it is built from the processed data
+# file first.
+# - 'timings', if given, is a dictionary where the seconds spent building the index ('index_build_seconds', zero if
+# it already existed) and opening it ('load_seconds') are saved.
+def knn_load_index(index_file_path, processed_data_file_path, timings=None):
+    start_time = time.perf_counter()
+    if not os.path.exists(index_file_path) or not KNNIndex.knn_index_is_current(index_file_path):
+        with Instrumentation.instrumentation_stage('knn_index_build'):
+            knn_save_index(processed_data_file_path, index_file_path)
+    build_time = time.perf_counter()
+    with Instrumentation.instrumentation_stage('knn_index_load'):
+        index = KNNIndex.knn_index_load(index_file_path)
+    if timings is not None:
+        timings['index_build_seconds'] = build_time - start_time
+        timings['load_seconds'] = time.perf_counter() - build_time
+    return index
+
+
+# Builds the packed training set of KNNPacked from a processed data file and saves it. The binary attributes are the
+# OneHot columns of the schema of the data set.
+def knn_save_packed(processed_data_file_path, packed_file_path):
+    training_matrix, labels = __knn_load_processed_data_matrix(processed_data_file_path)
+    binary_columns = Schema.schema_one_hot_columns(Schema.schema_of_data_set(processed_data_file_path))
+    KNNPacked.knn_packed_save(KNNPacked.knn_packed_build(training_matrix, labels, binary_columns), packed_file_path)
+
+
+# Opens the packed training set of KNNPacked. If the packed file doesn't exist or it was saved with an older version
+# of the packed training set, it is built from the processed data file first.
+# - 'timings' is the same as in knn_load_index.
+def knn_load_packed(packed_file_path, processed_data_file_path, timings=None):
+    start_time = time.perf_counter()
+    if not os.path.exists(packed_file_path) or not KNNPacked.knn_packed_is_current(packed_file_path):
+        with Instrumentation.instrumentation_stage('knn_packed_build'):
+            knn_save_packed(processed_data_file_path, packed_file_path)
+    build_time = time.perf_counter()
+    with Instrumentation.instrumentation_stage('knn_packed_load'):
+        packed = KNNPacked.knn_packed_load(packed_file_path)
+    if timings is not None:
+        timings['index_build_seconds'] = build_time - start_time
+        timings['load_seconds'] = time.perf_counter() - build_time
+    return packed
+
+
+# Selects the prototypes of the training instances of a processed data file with KNNPrototypes, and saves them as
+# another processed data file (with the same format), together with their index and their packed training set.
+# - 'method' is one of KNNPrototypes.knn_prototypes_methods.
+# Returns a pair with the number of training instances and the number of prototypes.
+def knn_save_prototypes(processed_data_file_path, prototypes_file_path, prototypes_index_file_path,
+                        prototypes_packed_file_path, method, seed=KNNPrototypes.knn_prototypes_seed):
+    training_matrix, labels = __knn_load_processed_data_matrix(processed_data_file_path)
+    prototypes = KNNPrototypes.knn_prototypes_select(training_matrix, labels, method, seed)
+    with open(prototypes_file_path, 'w') as prototypes_file:
+        for instance, class_label in zip(training_matrix[prototypes].tolist(), labels[prototypes].tolist()):
+            prototypes_file.write(str(instance + [class_label]) + '\n')
+    KNNIndex.knn_index_save(KNNIndex.knn_index_build(training_matrix[prototypes], labels[prototypes]),
+                            prototypes_index_file_path)
+    knn_save_packed(prototypes_file_path, prototypes_packed_file_path)
+    return len(training_matrix), len(prototypes)
+
+
+uso = """
+Invocar como:
+
+python3 KNNParser.py
+    Procesa los data sets iris y covtype a partir de knn/iris_data.json y knn/covtype_data.json.
+python3 KNNParser.py prototypes [iris|covtype] [cnn|enn|enn+cnn]
+    Selecciona prototipos de las instancias de entrenamiento y los guarda en knn/<dataset>_prototypes.data.
+"""
+
 if __name__ == '__main__':
-    __knn_save_processed_data(knn_iris_data_file_name, 0.8)
-    __knn_save_processed_data(knn_covtype_data_file_name, 0.8)
+    if len(sys.argv) == 1:
+        __knn_save_processed_data(knn_iris_data_file_name, 0.8)
+        __knn_save_processed_data(knn_covtype_data_file_name, 0.8)
+    elif len(sys.argv) == 4 and sys.argv[1] == 'prototypes' and sys.argv[2] in ['iris', 'covtype'] and \
+            sys.argv[3] in KNNPrototypes.knn_prototypes_methods:
+        if sys.argv[2] == 'iris':
+            files = (knn_iris_processed_data_file_name, knn_iris_prototypes_file_name,
+                     knn_iris_prototypes_index_file_name, knn_iris_prototypes_packed_file_name)
+        else:
+            files = (knn_covtype_processed_data_file_name, knn_covtype_prototypes_file_name,
+                     knn_covtype_prototypes_index_file_name, knn_covtype_prototypes_packed_file_name)
+        start_time = time.perf_counter()
+        instances_number, prototypes_number = knn_save_prototypes(*files, sys.argv[3])
+        print('Prototipos ({method}): {prototypes} de {instances} instancias de entrenamiento ({factor:.1f} veces '
+              'menos), en {seconds:.1f} s. Guardados en {file}'.format(
+                  method=sys.argv[3], prototypes=prototypes_number, instances=instances_number,
+                  factor=instances_number / max(1, prototypes_number), seconds=time.perf_counter() - start_time,
+                  file=files[1]))
+    else:
+        print(uso)
@@ -0,0 +1,146 @@
+"""
+This module implements prototype selection for KNN: it reduces the training set to a smaller set of prototypes (a
+subset of the training instances) that classifies the instances almost as well, so the searches are faster and the
+training data takes less memory. The prototypes are saved as an alternate processed data file, with its own index, so
+Main.py can classify with them (see --training) instead of the whole training set.
+
+Three methods are available:
++ 'cnn': Hart's condensed nearest neighbour. It keeps the instances that are misclassified by 1-NN over the
+prototypes kept so far, visiting the instances in random order until every instance is classified correctly. It
+removes the instances far from the borders between classes, so it reduces the training set the most.
++ 'enn': Wilson's edited nearest neighbour. It removes the instances whose class differs from the majority class of
+their k nearest neighbours (without themselves). It removes noise and smooths the borders, but keeps most instances.
++ 'enn+cnn': edits first and then condenses the edited set, so the condensing doesn't keep noisy instances.
+"""
+
+import numpy
+import Instrumentation
+
+
+# Names of the available prototype selection methods.
+knn_prototypes_methods = ['cnn', 'enn', 'enn+cnn']
+
+# Number of neighbours of the instances compared by 'enn'.
+knn_prototypes_enn_k = 3
+
+# Default seed for the order in which 'cnn' visits the instances.
+knn_prototypes_seed = 0
+
+# Maximum number of distances computed at once by 'cnn' (instances in a block times prototypes).
+knn_prototypes_block_elements = 2 ** 22
+
+# Memory budget, in bytes, of the distances computed at once by 'enn' (instances in a block times training instances).
+knn_prototypes_edit_block_bytes = 2 ** 28
+
+# Minimum number of instances in a block of 'enn', so large training sets are still edited with large products of
+# matrices, even if a block takes more memory than knn_prototypes_edit_block_bytes.
+knn_prototypes_edit_min_block_size = 64
+
+
+# Hart's condensed nearest neighbour.
+# - 'features' is a matrix with one training instance (without class label) per row.
+# - 'labels' is an array with the class label of each row.
+# Returns a sorted array with the rows of the prototypes.
+def knn_prototypes_condense(features, labels, seed=knn_prototypes_seed):
+    features = numpy.ascontiguousarray(features, dtype=numpy.float64)
+    labels = numpy.asarray(labels)
+    if len(features) == 0:
+        return numpy.empty(0, dtype=numpy.int64)
+    order = numpy.random.default_rng(seed).permutation(len(features))
+    # The prototypes are kept in the order they are added, with their squared norms for ranking distances.
+    prototype_rows = numpy.empty(len(features), dtype=numpy.int64)
+    prototype_features = numpy.empty_like(features)
+    prototype_norms = numpy.empty(len(features))
+    prototypes_number = 0
+    is_prototype = numpy.zeros(len(features), dtype=bool)
+
+    def add_prototype(row):
+        nonlocal prototypes_number
+        prototype_rows[prototypes_number] = row
+        prototype_features[prototypes_number] = features[row]
+        prototype_norms[prototypes_number] = features[row] @ features[row]
+        prototypes_number += 1
+        is_prototype[row] = True
+
+    add_prototype(order[0])
+    added = True
+    while added:
+        added = False
+        start = 0
+        while start < len(order):
+            # Each block is compared at once with the prototypes kept before it. The instances of the block are then
+            # visited in order, also comparing them with the prototypes added from the same block, so the result is
+            # the same as visiting the instances one at a time.
+            block_size = max(1, knn_prototypes_block_elements // prototypes_number)
+            block = order[start:start + block_size]
+            block = block[~is_prototype[block]]
+            start += block_size
+            if len(block) == 0:
+                continue
+            block_start = prototypes_number
+            queries = features[block]
+            scores = prototype_norms[:block_start] - 2.0 * (queries @ prototype_features[:block_start].T)
+            nearest = numpy.argmin(scores, axis=1)
+            nearest_scores = scores[numpy.arange(len(block)), nearest]
+            for row, query, prototype, score in zip(block, queries, nearest, nearest_scores):
+                if prototypes_number > block_start:
+                    new_scores = prototype_norms[block_start:prototypes_number] - \
+                                 2.0 * (prototype_features[block_start:prototypes_number] @ query)
+                    new_nearest = int(numpy.argmin(new_scores))
+                    if new_scores[new_nearest] < score:
+                        prototype = block_start + new_nearest
+                if labels[prototype_rows[prototype]] != labels[row]:
+                    add_prototype(row)
+                    added = True
+    Instrumentation.instrumentation_count('knn_prototypes_kept', prototypes_number)
+    return numpy.sort(prototype_rows[:prototypes_number])
+
+
+# Wilson's edited nearest neighbour.
+# - 'features' and 'labels' are the same as in knn_prototypes_condense.
+# - 'k' is the number of neighbours of each instance compared with its class.
+# Returns a sorted array with the rows of the instances kept: the ones whose class has the most votes (or is tied)
+# among their k nearest neighbours.
+# The neighbours of blocks of instances are searched at once among all the training instances, as in the 'brute'
+# engine of KNN.
+def knn_prototypes_edit(features, labels, k=knn_prototypes_enn_k):
+    features = numpy.ascontiguousarray(features, dtype=numpy.float64)
+    labels = numpy.asarray(labels, dtype=numpy.int64)
+    if len(features) <= 1:
+        return numpy.arange(len(features), dtype=numpy.int64)
+    k = min(k, len(features) - 1)
+    classes_number = int(labels.max()) + 1
+    squared_norms = numpy.einsum('ij,ij->i', features, features)
+    keep = numpy.empty(len(features), dtype=bool)
+    block_size = max(knn_prototypes_edit_min_block_size,
+                     knn_prototypes_edit_block_bytes // (len(features) * features.itemsize))
+    for start in range(0, len(features), block_size):
+        rows = numpy.arange(start, min(start + block_size, len(features)))
+        # The squared norm of the instance is the same for all the training instances, so it isn't needed for
+        # ranking them.
+        scores = squared_norms - 2.0 * (features[rows] @ features.T)
+        # An instance is not one of its own neighbours.
+        scores[numpy.arange(len(rows)), rows] = numpy.inf
+        neighbours = numpy.argpartition(scores, k - 1, axis=1)[:, :k]
+        votes = numpy.zeros((len(rows), classes_number), dtype=numpy.int64)
+        numpy.add.at(votes, (numpy.arange(len(rows))[:, numpy.newaxis], labels[neighbours]), 1)
+        keep[rows] = votes[numpy.arange(len(rows)), labels[rows]] == votes.max(axis=1)
+    return numpy.flatnonzero(keep)
+
+
+# Selects the prototypes of a training set with one of knn_prototypes_methods.
+# - 'features' and 'labels' are the same as in knn_prototypes_condense.
+# Returns a sorted array with the rows of the prototypes.
+def knn_prototypes_select(features, labels, method, seed=knn_prototypes_seed):
+    features = numpy.asarray(features, dtype=numpy.float64)
+    labels = numpy.asarray(labels)
+    with Instrumentation.instrumentation_stage('knn_prototypes_' + method, len(features)):
+        if method == 'cnn':
+            return knn_prototypes_condense(features, labels, seed)
+        elif method == 'enn':
+            return knn_prototypes_edit(features, labels)
+        elif method == 'enn+cnn':
+            edited = knn_prototypes_edit(features, labels)
+            return edited[knn_prototypes_condense(features[edited], labels[edited], seed)]
+        else:
+            raise Exception('KNNPrototypes.knn_prototypes_select: unknown method ' + str(method))
@@ -4,17 +4,19 @@ Assumes, data has been already preprocessed.
 TODO: data shouldnt be preprocessed if using [trianing] param. should it be removed?
 '''
 
+import os
 import sys
-import KNN
-import NaiveBayes
-import KNNParser
-import NBParser
-import Evaluator
+import time
+import Utils
 
 uso_general = """
 Invocar como:
 
-python3 Main.py [kNN|NB] [iris|covtype] [k]
+python3 Main.py [kNN|NB] [iris|covtype] [k ...] [--engine kdtree|brute|index|balltree|forest|packed] [--trees N]
+      [--distance euclidean|manhattan] [--one-hot-weight W] [--workers N] [--report-every N]
+      [--metrics json|csv|none] [--profile archivo] [--folds N] [--seed S] [--training full|prototypes]
+python3 Main.py bundle [iris|covtype] [--k K] [--output archivo]
+python3 Main.py predict [kNN|NB] bundle entrada [--k K] [--output archivo]
 
 donde:
 
@@ -22,11 +24,188 @@ donde:
 - iris o covtype indica el nombre del dataset que se utilizará.
 - k, indica el valor de k a utilizar en el caso de kNN. Si se usa NB, 
 se puede omitir. Debe ser un entero positivo. En caso de introducir
-un real, se trunca y se toma su parte entera.
+un real, se trunca y se toma su parte entera. Se pueden indicar varios
+valores de k (por ejemplo 1 3 7): los vecinos de cada instancia se buscan
+una única vez y se genera un archivo de resultados por cada valor.
+- --engine indica el motor de búsqueda de vecinos de kNN: kdtree (por
+defecto), brute, que calcula las distancias por bloques con numpy,
+index, que busca en un k-d-tree guardado en knn/<dataset>_index.bin,
+balltree, que busca en un ball tree con la distancia indicada por --distance,
+forest, que busca vecinos aproximados en un bosque de árboles de
+proyecciones aleatorias y muestra su recall respecto a la búsqueda exacta, o
+packed, que calcula las distancias por bloques como brute, con los atributos
+continuos en float32 y los atributos binarios (OneHot) empaquetados en bits.
+- --trees indica la cantidad de árboles del motor forest (16 por defecto).
+Más árboles dan un recall mayor y una búsqueda más lenta.
+- --distance indica la distancia del motor balltree: euclidean (por
+defecto) o manhattan. --one-hot-weight indica el peso de cada atributo
+binario (OneHot) de covtype en la distancia (1 por defecto); el peso de
+los demás atributos es 1.
+- --workers indica la cantidad de procesos que clasifican las instancias
+de validación con kNN. Por defecto se usa un único proceso.
+- --report-every indica que las instancias de validación se lean, clasifiquen
+y evalúen de a partes, sin cargarlas todas en memoria, mostrando las
+métricas parciales cada N instancias. Con kNN, los vecinos se buscan una
+sola vez para el mayor k, y con --workers cada proceso clasifica lotes
+enteros.
+- --metrics indica el formato (json por defecto, csv, o none para no
+guardarlo) del archivo con las métricas y los tiempos de ejecución, que se
+guarda junto al archivo de resultados.
+- --profile indica que se mida cada etapa de la ejecución (tiempo, filas por
+segundo, nodos visitados por consulta de kNN y memoria máxima) y se guarde
+un perfil de cProfile en el archivo indicado, y una tabla resumen en el
+mismo archivo con extensión .txt agregada.
+- --folds indica que, en lugar de usar la partición 80/20 guardada, se
+evalúe con validación cruzada estratificada de N particiones sobre todas
+las instancias (entrenamiento y validación). Las particiones se clasifican
+en paralelo con --workers procesos, y se reporta la media y la desviación
+estándar de cada métrica. --seed indica la semilla con la que se mezclan
+las instancias (0 por defecto).
+- --training indica las instancias de entrenamiento de kNN: full (por
+defecto) usa todas, y prototypes usa los prototipos seleccionados con
+python3 KNNParser.py prototypes (ver README). Los resultados se guardan
+en knn_exp/<dataset><k>_prototypes.data, para compararlos con los de full.
+- bundle guarda en un único archivo (models/<dataset>_bundle.bin por defecto,
+o el indicado por --output) todo lo que necesitan los clasificadores: el
+escalado y el índice de kNN, los priors y el modelo de NB y las etiquetas de
+las clases. --k indica el valor de k por defecto de kNN (7 por defecto).
+- predict clasifica las instancias del archivo entrada (una por línea, con
+los atributos del dataset sin normalizar separados por comas, y opcionalmente
+la clase al final) con el bundle indicado, sin leer los archivos de
+entrenamiento. Escribe una línea por instancia con el número y la etiqueta
+de la clase, en el archivo indicado por --output o en la salida estándar.
+--k indica el valor de k de kNN (por defecto, el guardado en el bundle).
+Solo importa los módulos que necesita, por lo que arranca rápido.
 """
 
+# Saves the bundle of ModelBundle of a data set.
+def __run_bundle(arguments, options):
+    import ModelBundle
+    if len(arguments) != 1 or arguments[0] not in ['iris', 'covtype']:
+        print('#########################')
+        print('Error. Dataset inválido. Debe ser iris o covtype')
+        print('-------------------------')
+        print(uso_general)
+        exit()
+    dataset = arguments[0]
+    k = int(options.get('k', ModelBundle.model_bundle_k))
+    if k <= 0:
+        print('#########################')
+        print('Error. Valor de k negativo, o cero. Debe ser positivo')
+        print('-------------------------')
+        exit()
+    bundle_file_name = options.get('output', ModelBundle.model_bundle_file_name(dataset))
+    ModelBundle.model_bundle_build(dataset, bundle_file_name, k)
+    print('El bundle del dataset ' + dataset + ' está en ' + bundle_file_name)
+
+
+# Classifies the instances of a file with a bundle of ModelBundle, without reading the training files. Only the
+# modules needed for classifying are imported, so short lived processes start fast.
+# Writes one line per instance with the class number and the class label, separated by a comma.
+def __run_predict(arguments, options):
+    import ModelBundle
+    if len(arguments) != 3 or arguments[0] not in ['kNN', 'NB']:
+        print('#########################')
+        print('Error. Cantidad de parametros invalidos')
+        print('-------------------------')
+        print(uso_general)
+        exit()
+    mode, bundle_file_name, instances_file_name = arguments
+    bundle = ModelBundle.model_bundle_load(bundle_file_name)
+    instances = ModelBundle.model_bundle_read_instances(bundle, instances_file_name)
+    if mode == 'kNN':
+        k = int(options.get('k', bundle['k']))
+        if k <= 0:
+            print('#########################')
+            print('Error. Valor de k negativo, o cero. Debe ser positivo')
+            print('-------------------------')
+            exit()
+        predictions = ModelBundle.model_bundle_classify_knn(bundle, instances, k)
+    else:
+        predictions = ModelBundle.model_bundle_classify_naive_bayes(bundle, instances)
+    lines = ''.join('{number},{label}\n'.format(number=number, label=bundle['classes_labels'][number])
+                    for number in predictions.tolist())
+    if 'output' in options:
+        with open(options['output'], 'w') as output_file:
+            output_file.write(lines)
+    else:
+        sys.stdout.write(lines)
+
+
+# Returns the weights of the attributes in the distance of the 'balltree' engine: 'one_hot_weight' for the binary
+# (OneHot) attributes of the data set, and 1 for the other attributes.
+def __ball_tree_weights(dataset, attributes_number, one_hot_weight):
+    one_hot_attributes = Schema.schema_one_hot_columns(Schema.schemas[dataset])
+    return KNNBallTree.knn_ball_tree_weights(attributes_number, one_hot_attributes, one_hot_weight)
+
+
+# Evaluates a classifier with stratified cross validation on all the instances of the data set, and saves a report
+# for each value of k (or one report for NB) with the mean and standard deviation of the metrics over the folds.
+# - 'metrics_file' is the function that returns the path of the machine readable metrics file of a results file.
+def __run_cross_validation(mode, dataset, k_values, folds, seed, engine, trees, distance, one_hot_weight, workers,
+                           metrics_file, timings):
+    start_time = time.perf_counter()
+    if mode == "kNN":
+        classes = [0, 1, 2, 3, 4, 5, 6]
+        if dataset == "iris":
+            features, labels = KNNParser.knn_load_data_set(KNNParser.knn_iris_processed_data_file_name,
+                                                           KNNParser.knn_iris_validation_file_name)
+        else:
+            features, labels = KNNParser.knn_load_data_set(KNNParser.knn_covtype_processed_data_file_name,
+                                                           KNNParser.knn_covtype_validation_file_name)
+        outputfiles = {k: 'knn_exp/{dataset}{k}_cv{folds}.data'.format(dataset=dataset, k=k, folds=folds)
+                       for k in k_values}
+        timings['load_seconds'] = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        weights = __ball_tree_weights(dataset, features.shape[1], one_hot_weight)
+        binary_columns = Schema.schema_one_hot_columns(Schema.schemas[dataset])
+        confusion_matrices = CrossValidation.cross_validation_knn(features, labels, k_values, classes, folds, seed,
+                                                                  engine, workers, trees, distance, weights,
+                                                                  binary_columns)
+    else:
+        classes = NBParser.naive_bayes_classes_labels[dataset]
+        if dataset == "iris":
+            features, labels = NBParser.naive_bayes_load_data_set(NBParser.naive_bayes_iris_data_set_file_name)
+        else:
+            features, labels = NBParser.naive_bayes_load_data_set(NBParser.naive_bayes_covtype_data_set_file_name)
+        k_values = [None]
+        outputfiles = {None: 'naive_bayes_exp/{dataset}_cv{folds}.data'.format(dataset=dataset, folds=folds)}
+        timings['load_seconds'] = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        confusion_matrices = {None: CrossValidation.cross_validation_naive_bayes(features, labels, classes,
+                                                                                 Schema.schemas[dataset], folds, seed,
+                                                                                 workers)}
+    timings['classify_seconds'] = time.perf_counter() - start_time
+    print('Los resultados estaran en ' + ', '.join(outputfiles.values()))
+    for k in k_values:
+        metrics = Evaluator.evaluate_cross_validation(confusion_matrices[k], classes, outputfiles[k],
+                                                      metrics_file(outputfiles[k]), timings)
+        print('{name}Accuracy: {mean:.4f} ± {std:.4f}. F-Measure macro: {f_mean:.4f} ± {f_std:.4f}'.format(
+            name='' if k is None else 'k = {k}. '.format(k=k), mean=metrics['mean']['accuracy'],
+            std=metrics['std']['accuracy'], f_mean=metrics['mean']['macro']['f_measure'],
+            f_std=metrics['std']['macro']['f_measure']))
+
+
 if __name__ == "__main__":
     # checking arguments
+    options = Utils.parse_options(sys.argv)
+    if len(sys.argv) >= 2 and sys.argv[1] == 'predict':
+        __run_predict(sys.argv[2:], options)
+        exit()
+    if len(sys.argv) >= 2 and sys.argv[1] == 'bundle':
+        __run_bundle(sys.argv[2:], options)
+        exit()
+    # The modules of the other modes are imported only here, so predict doesn't pay for importing them.
+    import CrossValidation
+    import Evaluator
+    import Instrumentation
+    import KNN
+    import KNNBallTree
+    import KNNForest
+    import KNNParser
+    import NaiveBayes
+    import NBParser
+    import Schema
     if (len(sys.argv) < 2):
         print('#########################')        
         print('Error. Cantidad de parametros invalidos')
@@ -46,48 +225,213 @@ if __name__ == "__main__":
         print('-------------------------')
         print(uso_general)
         exit()
+    k_values, engine, trees, distance, one_hot_weight, training = None, None, None, None, None, 'full'
     if mode == "kNN":
-        k = int(sys.argv[3])
-        if k < 0:
+        k_values = [int(k) for k in sys.argv[3:]]
+        if len(k_values) == 0 or min(k_values) <= 0:
             print('#########################')
             print('Error. Valor de k negativo, o cero. Debe ser positivo')
             print('-------------------------')
             exit()
-    print("Entrenando el dataset " + dataset + " con una proporción de entrenamiento del 0.8 con el algoritmo " + mode)
-    if mode == "kNN":
-        print("Tomando un valor de k de: " + str(k))
+        engine = options.get('engine', 'kdtree')
+        if engine not in KNN.knn_engines:
+            print('#########################')
+            print('Error. Motor de búsqueda inválido. Debe ser ' + ' o '.join(KNN.knn_engines))
+            print('-------------------------')
+            exit()
+        trees = int(options.get('trees', KNNForest.knn_forest_trees))
+        if trees < 1:
+            print('#########################')
+            print('Error. Cantidad de árboles inválida. Debe ser un entero positivo')
+            print('-------------------------')
+            exit()
+        distance = options.get('distance', 'euclidean')
+        if distance not in KNNBallTree.knn_ball_tree_distances:
+            print('#########################')
+            print('Error. Distancia inválida. Debe ser ' + ' o '.join(KNNBallTree.knn_ball_tree_distances))
+            print('-------------------------')
+            exit()
+        training = options.get('training', 'full')
+        if training not in ['full', 'prototypes']:
+            print('#########################')
+            print('Error. Instancias de entrenamiento inválidas. Debe ser full o prototypes')
+            print('-------------------------')
+            exit()
+        one_hot_weight = float(options.get('one-hot-weight', 1))
+        if one_hot_weight < 0:
+            print('#########################')
+            print('Error. Peso de los atributos binarios inválido. Debe ser un número no negativo')
+            print('-------------------------')
+            exit()
+    workers = int(options.get('workers', 1))
+    if workers < 1:
+        print('#########################')
+        print('Error. Cantidad de procesos inválida. Debe ser un entero positivo')
+        print('-------------------------')
+        exit()
+    report_every = int(options['report-every']) if 'report-every' in options else None
+    if report_every is not None and report_every < 1:
+        print('#########################')
+        print('Error. Cantidad de instancias entre reportes inválida. Debe ser un entero positivo')
+        print('-------------------------')
+        exit()
+    metrics_format = options.get('metrics', 'json')
+    if metrics_format not in ['json', 'csv', 'none']:
+        print('#########################')
+        print('Error. Formato de métricas inválido. Debe ser json, csv o none')
+        print('-------------------------')
+        exit()
+    # Returns the path of the machine readable metrics file for a results file, or None if it isn't saved.
+    def metrics_file(outputfile):
+        return None if metrics_format == 'none' else outputfile[:-len('.data')] + '.' + metrics_format
+    folds = int(options['folds']) if 'folds' in options else None
+    if folds is not None and folds < 2:
+        print('#########################')
+        print('Error. Cantidad de particiones inválida. Debe ser un entero mayor que 1')
+        print('-------------------------')
+        exit()
+    if folds is not None and training == 'prototypes':
+        print('#########################')
+        print('Error. La validación cruzada usa todas las instancias, no los prototipos')
+        print('-------------------------')
+        exit()
+    seed = int(options.get('seed', CrossValidation.cross_validation_seed))
+    profiler = Instrumentation.instrumentation_start_profile() if 'profile' in options else None
+    timings = {}
+    if folds is not None:
+        print("Evaluando el dataset " + dataset + " con validación cruzada estratificada de " + str(folds) +
+              " particiones (semilla " + str(seed) + ") con el algoritmo " + mode)
+        __run_cross_validation(mode, dataset, k_values, folds, seed, engine, trees, distance, one_hot_weight, workers,
+                               metrics_file, timings)
+    elif mode == "kNN":
+        print("Entrenando el dataset " + dataset + " con una proporción de entrenamiento del 0.8 con el algoritmo " + mode)
+        print("Tomando valores de k de: " + ', '.join(str(k) for k in k_values))
         if dataset == "iris":
             processed_data_file_name = KNNParser.knn_iris_processed_data_file_name
             validation_file_name = KNNParser.knn_iris_validation_file_name
-            outputfile = 'knn_exp/iris{k}.data'.format(k=k)
+            index_file_name = KNNParser.knn_iris_index_file_name
+            packed_file_name = KNNParser.knn_iris_packed_file_name
         else: 
             processed_data_file_name = KNNParser.knn_covtype_processed_data_file_name
             validation_file_name = KNNParser.knn_covtype_validation_file_name
-            outputfile = 'knn_exp/covtype{k}.data'.format(k=k)
-        print('Los resultados estaran en ' + outputfile)
-        k_d_tree, hash_, validation_dictionary = KNNParser.knn_load_processed_data_and_dictionary(
-        processed_data_file_name, validation_file_name)
-        classification = KNN.knn_classify_instance_set(validation_dictionary, k, k_d_tree, hash_, [0, 1, 2, 3, 4, 5, 6])
-        print("Evaluando el clasificador sobre el conjunto de validación")
-        Evaluator.evaluate_classifier(classification, [0, 1, 2, 3, 4, 5, 6], outputfile)
+            index_file_name = KNNParser.knn_covtype_index_file_name
+            packed_file_name = KNNParser.knn_covtype_packed_file_name
+        suffix = ''
+        if training == 'prototypes':
+            # The prototypes are another processed data file, with its own index, used as the training instances.
+            if dataset == "iris":
+                processed_data_file_name = KNNParser.knn_iris_prototypes_file_name
+                index_file_name = KNNParser.knn_iris_prototypes_index_file_name
+                packed_file_name = KNNParser.knn_iris_prototypes_packed_file_name
+            else:
+                processed_data_file_name = KNNParser.knn_covtype_prototypes_file_name
+                index_file_name = KNNParser.knn_covtype_prototypes_index_file_name
+                packed_file_name = KNNParser.knn_covtype_prototypes_packed_file_name
+            if not os.path.exists(processed_data_file_name):
+                print('#########################')
+                print('Error. No existe ' + processed_data_file_name + '. Seleccionar los prototipos con '
+                      'python3 KNNParser.py prototypes ' + dataset + ' [cnn|enn|enn+cnn]')
+                print('-------------------------')
+                exit()
+            suffix = '_prototypes'
+        outputfiles = {k: 'knn_exp/{dataset}{k}{suffix}.data'.format(dataset=dataset, k=k, suffix=suffix)
+                       for k in k_values}
+        print('Los resultados estaran en ' + ', '.join(outputfiles.values()))
+        if engine == 'brute' or engine == 'index' or engine == 'balltree' or engine == 'forest':
+            # These engines use the training instances saved in the index
+            index = KNNParser.knn_load_index(index_file_name, processed_data_file_name, timings)
+            k_d_tree = index['features'] if engine == 'brute' else index
+            labels = index['labels']
+            if engine == 'balltree':
+                start_time = time.perf_counter()
+                with Instrumentation.instrumentation_stage('knn_ball_tree_build', len(labels)):
+                    weights = __ball_tree_weights(dataset, index['features'].shape[1], one_hot_weight)
+                    k_d_tree = KNNBallTree.knn_ball_tree_build(index['features'], labels, distance, weights)
+                labels = k_d_tree['labels']
+                timings['index_build_seconds'] += time.perf_counter() - start_time
+            if engine == 'forest':
+                start_time = time.perf_counter()
+                with Instrumentation.instrumentation_stage('knn_forest_build', len(labels)):
+                    k_d_tree = KNNForest.knn_forest_build(index['features'], labels, trees)
+                timings['index_build_seconds'] += time.perf_counter() - start_time
+                recall = KNN.knn_forest_recall(k_d_tree, KNNParser.knn_load_validation_matrix(validation_file_name),
+                                               max(k_values))
+                print('Recall de la búsqueda aproximada con {trees} árboles (k = {k}): {recall:.4f}'.format(
+                    trees=trees, k=max(k_values), recall=recall))
+        elif engine == 'packed':
+            k_d_tree = KNNParser.knn_load_packed(packed_file_name, processed_data_file_name, timings)
+            labels = k_d_tree['labels']
+        else:
+            k_d_tree, labels = KNNParser.knn_load_processed_data_tree(processed_data_file_name, timings)
+        if report_every is None:
+            start_time = time.perf_counter()
+            validation_dictionary = KNNParser.knn_load_validation_dictionary(validation_file_name)
+            timings['load_seconds'] += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            classifications = KNN.knn_classify_instance_set_sweep(validation_dictionary, k_values, k_d_tree, labels,
+                                                                  [0, 1, 2, 3, 4, 5, 6], engine, workers)
+            # With several values of k, all of them share the same search, so the time is the same for all.
+            timings['classify_seconds'] = time.perf_counter() - start_time
+            print("Evaluando el clasificador sobre el conjunto de validación")
+            for k in k_values:
+                metrics = Evaluator.evaluate_classifier(classifications[k], [0, 1, 2, 3, 4, 5, 6], outputfiles[k],
+                                                        metrics_file(outputfiles[k]), timings)
+                # The accuracy with the prototypes can be compared with the one of the whole training set.
+                print('k = {k}. Accuracy con {instances} instancias de entrenamiento: {accuracy:.4f}'.format(
+                    k=k, instances=len(labels), accuracy=metrics['accuracy']))
+        else:
+            print("Evaluando el clasificador sobre el conjunto de validación")
+            instances = KNNParser.knn_iterate_validation_instances(validation_file_name)
+            # The neighbours of each batch are searched once, for the largest k, and the predictions of each k are
+            # evaluated separately.
+            predictions = KNN.knn_classify_instance_stream_sweep(instances, k_values, k_d_tree, labels,
+                                                                 [0, 1, 2, 3, 4, 5, 6], engine, workers=workers)
+
+            def report(instances_number, metrics):
+                for k, k_metrics in zip(k_values, metrics):
+                    print('k = {k}. Instancias evaluadas: {n}. Accuracy: {accuracy:.4f}. F-Measure macro: '
+                          '{f_measure:.4f}'.format(k=k, n=instances_number, accuracy=k_metrics['accuracy'],
+                                                   f_measure=k_metrics['macro']['f_measure']))
+            all_metrics = Evaluator.evaluate_classifiers_stream(
+                predictions, [0, 1, 2, 3, 4, 5, 6], [outputfiles[k] for k in k_values], report_every, report,
+                [metrics_file(outputfiles[k]) for k in k_values], timings)
+            for k, metrics in zip(k_values, all_metrics):
+                print('k = {k}. Accuracy con {instances} instancias de entrenamiento: {accuracy:.4f}'.format(
+                    k=k, instances=len(labels), accuracy=metrics['accuracy']))
     else:
+        print("Entrenando el dataset " + dataset + " con una proporción de entrenamiento del 0.8 con el algoritmo " + mode)
+        start_time = time.perf_counter()
         if dataset == "iris":
-            distributions_dictionary = NBParser.naive_bayes_load_distributions(NBParser.naive_bayes_iris_distributions_file_name)
-            validation_set = NBParser.naive_bayes_load_validation_instances(NBParser.naive_bayes_iris_validation_instances_file_name)
-            classes_labels = ["Iris Setosa", "Iris Versicolour", "Iris Virginica"]
-            classes_distributions = {"Iris Setosa" : 1/3, "Iris Versicolour" : 1/3, "Iris Virginica" : 1/3}
+            with Instrumentation.instrumentation_stage('naive_bayes_load_distributions'):
+                distributions_dictionary = NBParser.naive_bayes_load_distributions(NBParser.naive_bayes_iris_distributions_file_name)
+            validation_file_name = NBParser.naive_bayes_iris_validation_instances_file_name
+            classes_labels = NBParser.naive_bayes_classes_labels['iris']
+            classes_distributions = NBParser.naive_bayes_load_classes_distributions(
+                NBParser.naive_bayes_iris_distributions_file_name)
             outputfile = 'naive_bayes_exp/iris.data'
         else:
-            distributions_dictionary = NBParser.naive_bayes_load_distributions(NBParser.naive_bayes_covtype_distributions_file_name)
-            validation_set = NBParser.naive_bayes_load_validation_instances(NBParser.naive_bayes_covtype_validation_instances_file_name)
-            classes_labels = ["Spruce/Fir", "Lodgepole Pine", "Ponderosa Pine", "Cottonwood/Willow", "Aspen", "Douglas-fir", "Krummholz"]
-            classes_distributions = {"Spruce/Fir" : 211840/581012, "Lodgepole Pine" : 283301/581012,
-                                     "Ponderosa Pine" : 35754/581012, "Cottonwood/Willow" : 2747/581012,
-                                    "Aspen" : 9493/581012, "Douglas-fir" : 17367/581012, "Krummholz" : 20510/581012}
+            with Instrumentation.instrumentation_stage('naive_bayes_load_distributions'):
+                distributions_dictionary = NBParser.naive_bayes_load_distributions(NBParser.naive_bayes_covtype_distributions_file_name)
+            validation_file_name = NBParser.naive_bayes_covtype_validation_instances_file_name
+            classes_labels = NBParser.naive_bayes_classes_labels['covtype']
+            classes_distributions = NBParser.naive_bayes_load_classes_distributions(
+                NBParser.naive_bayes_covtype_distributions_file_name)
             outputfile = 'naive_bayes_exp/covtype.data'            
         print('Los resultados estaran en ' + outputfile)
-        classified_data = NaiveBayes.naive_bayes_classify_dataset(classes_distributions, distributions_dictionary, classes_labels, validation_set)
-        print("Evaluando el clasificador sobre el conjunto de validación")
-        Evaluator.evaluate_classifier(classified_data, classes_labels, outputfile)
-
-        
\ No newline at end of file
+        if report_every is None:
+            validation_set = NBParser.naive_bayes_load_validation_instances(validation_file_name)
+            timings['load_seconds'] = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            classified_data = NaiveBayes.naive_bayes_classify_dataset(classes_distributions, distributions_dictionary, classes_labels, validation_set)
+            timings['classify_seconds'] = time.perf_counter() - start_time
+            print("Evaluando el clasificador sobre el conjunto de validación")
+            Evaluator.evaluate_classifier(classified_data, classes_labels, outputfile, metrics_file(outputfile), timings)
+        else:
+            timings['load_seconds'] = time.perf_counter() - start_time
+            print("Evaluando el clasificador sobre el conjunto de validación")
+            validation_set = NBParser.naive_bayes_iterate_validation_instances(validation_file_name)
+            classified_data = NaiveBayes.naive_bayes_classify_stream(classes_distributions, distributions_dictionary, classes_labels, validation_set)
+            Evaluator.evaluate_classifier_stream(classified_data, classes_labels, outputfile, report_every,
+                                                 metrics_file_path=metrics_file(outputfile), timings=timings)
+    if profiler is not None:
+        Instrumentation.instrumentation_stop_profile(profiler, options['profile'])
@@ -0,0 +1,159 @@
+"""
+Self-contained model bundles, for classifying instances without the training files. The bundle of a data set is a
+single binary file (see Utils.save_arrays) with everything both classifiers need:
++ KNN: the scaler of the attributes and the index of KNNIndex with the normalized training instances.
++ Naive Bayes: the model compiled by NaiveBayes.naive_bayes_compile_model from the distributions and the probability
+of each class.
++ The schema of the data set, the class labels and the default number of neighbours of KNN.
+Bundles are opened with mmap, so loading one takes milliseconds whatever the size of the training set. This module
+only imports the modules needed for classifying: the parsers, needed for building bundles, are imported by
+model_bundle_build.
+"""
+
+import os
+import numpy
+import KNN
+import KNNIndex
+import NaiveBayes
+import Parser
+import Schema
+import Utils
+
+
+# Version of the format of the bundles. It changes when the saved arrays or metadata change.
+model_bundle_version = 1
+
+# Default number of neighbours of KNN saved in the bundles.
+model_bundle_k = 7
+
+model_bundle_directory = 'models/'
+
+# Arrays of the model compiled by NaiveBayes.naive_bayes_compile_model saved in the bundles. The categorical
+# attributes and their log probabilities are saved separately, because they are a list and a list of arrays.
+__naive_bayes_arrays = ['log_priors', 'numeric_attributes', 'means', 'variances', 'log_normalizers',
+                        'inverse_double_variances', 'centers', 'log_density_constants', 'quadratic_coefficients',
+                        'linear_coefficients']
+
+
+# Returns the path of the bundle file of a data set.
+def model_bundle_file_name(data_set_name):
+    return model_bundle_directory + data_set_name + '_bundle.bin'
+
+
+# Builds the bundle of a data set from its processed files (see KNNParser and NBParser) and saves it.
+# - 'k' is the default number of neighbours of KNN.
+def model_bundle_build(data_set_name, bundle_file_path, k=model_bundle_k):
+    # The parsers are only needed for building bundles, so classifying with a bundle doesn't import them.
+    import KNNParser
+    import NBParser
+    if data_set_name == 'iris':
+        scaler = KNNParser.knn_load_scaler(KNNParser.knn_iris_scaler_file_name, KNNParser.knn_iris_data_file_name)
+        index = KNNParser.knn_load_index(KNNParser.knn_iris_index_file_name,
+                                         KNNParser.knn_iris_processed_data_file_name)
+        distributions_file_name = NBParser.naive_bayes_iris_distributions_file_name
+    else:
+        scaler = KNNParser.knn_load_scaler(KNNParser.knn_covtype_scaler_file_name,
+                                           KNNParser.knn_covtype_data_file_name)
+        index = KNNParser.knn_load_index(KNNParser.knn_covtype_index_file_name,
+                                         KNNParser.knn_covtype_processed_data_file_name)
+        distributions_file_name = NBParser.naive_bayes_covtype_distributions_file_name
+    classes_labels = NBParser.naive_bayes_classes_labels[data_set_name]
+    classes_distributions = NBParser.naive_bayes_load_classes_distributions(distributions_file_name)
+    model = NaiveBayes.naive_bayes_compile_model(classes_distributions,
+                                                 NBParser.naive_bayes_load_distributions(distributions_file_name),
+                                                 classes_labels)
+
+    # The scaler is saved as in KNNParser.knn_apply_scaler after replacing the range of the constant attributes, so
+    # normalizing is a subtraction and a division.
+    minimum = numpy.array(scaler['minimum'], dtype=numpy.float64)
+    value_range = numpy.array(scaler['maximum'], dtype=numpy.float64) - minimum
+    constant = value_range == 0
+    minimum[constant] = 0.0
+    value_range[constant] = 1.0
+    arrays = {'scaler_minimum': minimum, 'scaler_range': value_range}
+    arrays.update({'knn_index_' + name: array for name, array in index.items()})
+    arrays.update({'naive_bayes_' + name: model[name] for name in __naive_bayes_arrays})
+    for position, log_probabilities in enumerate(model['categorical_log_probabilities']):
+        arrays['naive_bayes_categorical_log_probabilities_' + str(position)] = log_probabilities
+    metadata = {
+        'version': model_bundle_version,
+        'knn_index_version': KNNIndex.knn_index_version,
+        'data_set_name': data_set_name,
+        'schema': Schema.schemas[data_set_name],
+        'k': k,
+        'classes_labels': classes_labels,
+        'classes_distributions': classes_distributions,
+        'naive_bayes_categorical_attributes': model['categorical_attributes'],
+    }
+    if os.path.dirname(bundle_file_path):
+        os.makedirs(os.path.dirname(bundle_file_path), exist_ok=True)
+    Utils.save_arrays(bundle_file_path, arrays, metadata)
+
+
+# Opens a bundle saved by model_bundle_build. The arrays are memory mapped, as in KNNIndex.knn_index_load.
+# Returns the bundle as a dictionary:
+#       + 'data_set_name', 'schema', 'k', 'classes_labels', 'classes_distributions': as saved by model_bundle_build.
+#       + 'scaler_minimum', 'scaler_range': arrays for normalizing the attributes of KNN.
+#       + 'knn': the index, prepared by KNN.knn_prepare for the 'index' engine.
+#       + 'knn_classes': list with the class numbers of KNN.
+#       + 'naive_bayes': the compiled model of Naive Bayes.
+def model_bundle_load(bundle_file_path):
+    arrays, metadata = Utils.load_arrays(bundle_file_path)
+    if metadata.get('version') != model_bundle_version or \
+            metadata.get('knn_index_version') != KNNIndex.knn_index_version:
+        raise Exception('ModelBundle.model_bundle_load: ' + bundle_file_path + ' has an unsupported bundle version')
+    index = {name[len('knn_index_'):]: array for name, array in arrays.items() if name.startswith('knn_index_')}
+    categorical_attributes = metadata['naive_bayes_categorical_attributes']
+    model = {name: arrays['naive_bayes_' + name] for name in __naive_bayes_arrays}
+    model['categorical_attributes'] = categorical_attributes
+    model['categorical_log_probabilities'] = [arrays['naive_bayes_categorical_log_probabilities_' + str(position)]
+                                              for position in range(len(categorical_attributes))]
+    knn_classes = list(range(metadata['schema']['classes_number']))
+    return {
+        'data_set_name': metadata['data_set_name'],
+        'schema': metadata['schema'],
+        'k': metadata['k'],
+        'classes_labels': metadata['classes_labels'],
+        'classes_distributions': metadata['classes_distributions'],
+        'scaler_minimum': arrays['scaler_minimum'],
+        'scaler_range': arrays['scaler_range'],
+        'knn': KNN.knn_prepare(index, index['labels'], knn_classes, 'index'),
+        'knn_classes': knn_classes,
+        'naive_bayes': model,
+    }
+
+
+# Reads the instances to classify from a text file with one instance per line and the attributes of the data set file
+# separated by commas, without normalizing. The class label column may be present, as in the data set files (with
+# numeric class labels), and it is ignored.
+# Returns a matrix with one instance (without class label) per row.
+def model_bundle_read_instances(bundle, instances_file_path):
+    rows = Parser.parse_numeric_file(instances_file_path)
+    attributes_number = bundle['schema']['attributes_number']
+    if len(rows) == 0:
+        return numpy.empty((0, attributes_number))
+    if rows.shape[1] == attributes_number + 1:
+        return Schema.schema_attributes(bundle['schema'], rows)
+    if rows.shape[1] != attributes_number:
+        raise Exception('ModelBundle.model_bundle_read_instances: the instances of ' + instances_file_path +
+                        ' must have ' + str(attributes_number) + ' attributes')
+    return rows
+
+
+# Classifies the rows of 'matrix' (as returned by model_bundle_read_instances) with KNN.
+# - 'k' is the number of neighbours considered.
+# Returns an array with the class number that classifies each row.
+def model_bundle_classify_knn(bundle, matrix, k):
+    if len(matrix) == 0:
+        return numpy.empty(0, dtype=numpy.intp)
+    normalized = (numpy.asarray(matrix, dtype=numpy.float64) - bundle['scaler_minimum']) / bundle['scaler_range']
+    return numpy.array(KNN.knn_classify_matrix(bundle['knn'], normalized, [k], bundle['knn_classes'])[k])
+
+
+# Classifies the rows of 'matrix' (as returned by model_bundle_read_instances) with Naive Bayes.
+# Returns an array with the class number that classifies each row.
+def model_bundle_classify_naive_bayes(bundle, matrix):
+    if len(matrix) == 0:
+        return numpy.empty(0, dtype=numpy.intp)
+    decoded = Schema.schema_decode_attributes(bundle['schema'], matrix)
+    return NaiveBayes.naive_bayes_classify_matrix(bundle['naive_bayes'], decoded)
@@ -11,10 +11,13 @@ For Naive Bayes:
 + return instances separated by class.
 """
 
-import ast
+import hashlib
 import json
-import random
-import statistics
+import os
+import sys
+import numpy
+import Parser
+import Schema
 import Utils
 
 """
@@ -24,144 +27,313 @@ PRE CONDITION: the iris data set file was already parsed with __parse_iris_class
 
 
 naive_bayes_directory = 'naive_bayes/'
+naive_bayes_iris_data_set_file_name = 'iris/iris.data'
+naive_bayes_covtype_data_set_file_name = 'covtype/covtype.data'
 naive_bayes_iris_distributions_file_name = naive_bayes_directory + 'iris_distributions.json'
 naive_bayes_iris_instances_file_name = naive_bayes_directory + 'iris_instances.json'
 naive_bayes_iris_validation_instances_file_name = naive_bayes_directory + 'iris_validation.data'
 naive_bayes_covtype_distributions_file_name = naive_bayes_directory + 'covtype_distributions.json'
 naive_bayes_covtype_instances_file_name = naive_bayes_directory + 'covtype_instances.json'
 naive_bayes_covtype_validation_instances_file_name = naive_bayes_directory + 'covtype_validation.data'
+naive_bayes_iris_statistics_file_name = naive_bayes_directory + 'iris_statistics.json'
+naive_bayes_covtype_statistics_file_name = naive_bayes_directory + 'covtype_statistics.json'
 
+# Class labels of each data set, in the order of their class numbers.
+naive_bayes_classes_labels = {
+    'iris': ["Iris Setosa", "Iris Versicolour", "Iris Virginica"],
+    'covtype': ["Spruce/Fir", "Lodgepole Pine", "Ponderosa Pine", "Cottonwood/Willow", "Aspen", "Douglas-fir", "Krummholz"],
+}
 
-# Parse the cover type instances, changing the binary attributes for numerical values in cover type data set case.
-# Split the instances in validation set and training set.
-# Create a dictionary: class label -> list of instances of that class, for the training set and the validation set.
-# Save the dictionaries in naive_bayes_instances (json) and return them.
-def __naive_bayes_parse_instances(data_set_file_path, training_proportion):
-    with open(data_set_file_path, 'r') as data_set_file:
-        instances_lines = data_set_file.readlines()
-    # Parse each instance line to a list (without the class label at the end) and create a
-    # dictionary: class label -> list of instances of that class.
-    instances_per_class = {}
-    if 'iris' in data_set_file_path:
-        classes_number = 3
-    elif 'covtype' in data_set_file_path:
-        classes_number = 7
-    else:
-        raise Exception('Parser.naive_bayes_parse_binary_attributes: "iris" or "covtype" not present in data set file' +
-                        ' path')
-    instances_list_with_class = []
-    # Initialize empty dictionary
-    for c in range(classes_number):
-        instances_per_class[c] = []
-    # Split each instance according to it's class
-    for instance_line in instances_lines:
-        instance_tokens = instance_line.split(',')
-        class_label = Utils.num(instance_tokens[-1].rstrip())
-        # Adjust the class label range of cover type from [1,...,7] to [0,...,6]
-        class_label = class_label if 'iris' in data_set_file_path else class_label - 1
-        if 'iris' in data_set_file_path:
-            # Only add attribute values to the instance list
-            instance = [Utils.num(instance_tokens[i]) for i in range(len(instance_tokens)-1)]
-        else:
-            # Only add numeric attribute values to the instance list
-            instance = [Utils.num(instance_tokens[i]) for i in range(10)]
-            # Convert the first four binary attributes to an integer
-            instance.append(instance_tokens[10:14].index('1'))
-            # Convert the last forty binary attributes to an integer
-            instance.append(instance_tokens[14:54].index('1'))
-        instances_list_with_class.append((instance, class_label))
-
-    # Split the instances in training set and validation set
-    random.shuffle(instances_list_with_class)
-    validation_instances_number = int(len(instances_list_with_class) - len(instances_list_with_class) *
-                                      training_proportion)
-    validation_instances_list_with_class = instances_list_with_class[0:validation_instances_number]
-    instances_list_with_class = instances_list_with_class[validation_instances_number:]
-    validation_instances_with_classes = []
-    for validation_instance, class_label in validation_instances_list_with_class:
-        # Add to validation instances list with class label
-        validation_instance.append(class_label)
-        validation_instances_with_classes.append(validation_instance)
-
-    for instance, class_label in instances_list_with_class:
-        instances_per_class[class_label].append(instance)
-
-    # Save the instances dictionary as a json file
-    if 'iris' in data_set_file_path:
-        instances_file_name = naive_bayes_iris_instances_file_name
-    else:
-        instances_file_name = naive_bayes_covtype_instances_file_name
-    with open(instances_file_name, 'w') as naive_bayes_instances_file:
-        json.dump(instances_per_class, naive_bayes_instances_file)
+# Probability of each class label of each data set in the whole data set. It is used for the models whose
+# distributions file doesn't have the probabilities of the classes (see naive_bayes_load_classes_distributions).
+naive_bayes_classes_distributions = {
+    'iris': {"Iris Setosa": 1/3, "Iris Versicolour": 1/3, "Iris Virginica": 1/3},
+    'covtype': {"Spruce/Fir": 211840/581012, "Lodgepole Pine": 283301/581012, "Ponderosa Pine": 35754/581012,
+                "Cottonwood/Willow": 2747/581012, "Aspen": 9493/581012, "Douglas-fir": 17367/581012,
+                "Krummholz": 20510/581012},
+}
 
-    # Save the validation instances dictionary as a json file
-    if 'iris' in data_set_file_path:
-        validation_instances_file_name = naive_bayes_iris_validation_instances_file_name
-    else:
-        validation_instances_file_name = naive_bayes_covtype_validation_instances_file_name
-    with open(validation_instances_file_name, 'w') as naive_bayes_validation_instances_file:
-        for validation_instance in validation_instances_with_classes:
-            naive_bayes_validation_instances_file.write(str(validation_instance) + '\n')
+# Seed of the hash that decides whether each instance is used for training or for validation.
+naive_bayes_split_seed = 0
 
-    return instances_per_class
+# Number of instance lines parsed and decoded together by the streaming parsers.
+naive_bayes_parse_batch_size = 4096
 
 
-# Main parser function.
-# Generate the files with the instances divided by class and the file with the pre computed distributions.
-def __naive_bayes_parser(data_set_file_path, training_proportion):
-    instances_per_class = __naive_bayes_parse_instances(data_set_file_path, training_proportion)
+# Parse a block of instance lines of the data set at once, decoding the groups of binary attributes (as the ones of
+# cover type) with the schema of the data set (see Schema.schema_decode_attributes).
+# Return a pair (matrix with one decoded instance without class label per row, array with the class label of each row).
+def __naive_bayes_parse_instance_lines(instances_lines, schema):
+    rows = numpy.array([[Utils.num(token) for token in instance_line.split(',')] for instance_line in instances_lines],
+                       dtype=numpy.float64).reshape(len(instances_lines), schema['attributes_number'] + 1)
+    return Schema.schema_decode_attributes(schema, rows), Schema.schema_labels(schema, rows)
 
-    if 'iris' in data_set_file_path:
-        attributes_number = 4
-        classes_number = 3
-    else:
-        attributes_number = 12
-        classes_number = 7
-
-    # Dictionary: class number -> distribution dictionary
-    distribution_per_class = {c: {} for c in range(classes_number)}
-
-    for c in range(classes_number):
-        # Dictionary: attribute number -> (distribution type, distribution parameters)
-        # If distribution type == 'normal', distribution parameters == {'mean': m, 'variance': v}
-        # If distribution type == 'uniform', distribution parameters == {v1: f1, ... , vn: fn}, where v1, ... , vn
-        # are all the possible attribute values and f1, ... , fn are the frequencies of those values in the set of
-        # instances with the same class.
-        distribution = {}
 
-        for attribute in range(attributes_number):
-            distribution_type = 'uniform' if Utils.is_categorical(attribute) else 'normal'
-            attribute_values_list = [instance[attribute] for instance in instances_per_class[c]]
-            if distribution_type == 'uniform':
+# Converts a matrix of decoded instances to a list of instances (lists), with int values for the categorical
+# attributes.
+def __naive_bayes_instances_list(matrix, schema):
+    categorical = [Utils.is_categorical(attribute, schema) for attribute in range(matrix.shape[1])]
+    return [[int(value) if is_categorical else value for is_categorical, value in zip(categorical, instance)]
+            for instance in matrix.tolist()]
+
+
+# Decide whether an instance line is used for training, with a hash of the seed, the line number and the line.
+# The decision doesn't depend on the other lines, so the data set doesn't need to be shuffled.
+def __naive_bayes_is_training_line(instance_line, line_number, seed, training_proportion):
+    line_hash = hashlib.blake2b('{seed}:{line_number}:{line}'.format(seed=seed, line_number=line_number,
+                                                                      line=instance_line).encode('utf-8'),
+                                digest_size=8)
+    return int.from_bytes(line_hash.digest(), 'little') < training_proportion * 2 ** 64
+
+
+# Creates the accumulators of the sufficient statistics of each class.
+# Dictionary: class number -> attribute number -> accumulator, where the accumulator is:
+# + [count, mean, sum of squared differences to the mean] for numeric attributes (Welford's algorithm).
+# + a list with the count of each possible value for categorical attributes.
+# The attributes and classes are the ones of the decoded instances of 'schema'.
+def __naive_bayes_new_statistics(schema):
+    statistics_per_class = {}
+    for c in range(schema['classes_number']):
+        statistics_per_class[c] = {}
+        for attribute in range(Schema.schema_decoded_attributes_number(schema)):
+            if Utils.is_categorical(attribute, schema):
+                statistics_per_class[c][attribute] = [0] * Utils.categorical_attribute_values_number(attribute, schema)
+            else:
+                statistics_per_class[c][attribute] = [0, 0.0, 0.0]
+    return statistics_per_class
+
+
+# Adds an instance to the accumulators of its class.
+def __naive_bayes_add_to_statistics(statistics_per_class, instance, class_label, schema):
+    for attribute, attribute_value in enumerate(instance):
+        accumulator = statistics_per_class[class_label][attribute]
+        if Utils.is_categorical(attribute, schema):
+            accumulator[int(attribute_value)] += 1
+        else:
+            accumulator[0] += 1
+            delta = attribute_value - accumulator[1]
+            accumulator[1] += delta / accumulator[0]
+            accumulator[2] += delta * (attribute_value - accumulator[1])
+
+
+# Computes the distributions of each attribute and class from the accumulated statistics.
+# Returns a dictionary: class number -> attribute number -> (distribution type, distribution parameters).
+# If distribution type == 'normal', distribution parameters == {'mean': m, 'variance': v}
+# If distribution type == 'uniform', distribution parameters == {v1: f1, ... , vn: fn}, where v1, ... , vn are all the
+# possible attribute values and f1, ... , fn are the frequencies of those values in the set of instances with the same
+# class (with an m-estimator for the values that don't appear).
+def __naive_bayes_distributions_from_statistics(statistics_per_class, schema):
+    distribution_per_class = {}
+    for c in statistics_per_class:
+        distribution = {}
+        for attribute, accumulator in statistics_per_class[c].items():
+            if Utils.is_categorical(attribute, schema):
+                instances_number = sum(accumulator)
+                if instances_number == 0:
+                    raise Exception('NBParser: no training instances of class ' + str(c))
                 # Dictionary: attribute value -> frequency of value
                 frequency = {}
-                for attribute_value in Utils.categorical_attribute_values(attribute):
-                    attribute_value_frequency = attribute_values_list.count(attribute_value)/len(attribute_values_list)
+                for attribute_value, attribute_value_count in enumerate(accumulator):
                     # Check if we need to use an m-estimator
-                    if attribute_value_frequency == 0:
-                        equivalent_sample_size = len(attribute_values_list)
-                        probability_estimate = 1/Utils.categorical_attribute_values_number(attribute)
+                    if attribute_value_count == 0:
+                        equivalent_sample_size = instances_number
+                        probability_estimate = 1/len(accumulator)
                         frequency[attribute_value] = equivalent_sample_size*probability_estimate/(
-                            equivalent_sample_size + len(attribute_values_list)
+                            equivalent_sample_size + instances_number
                         )
                     # If we don't need an m-estimator, just assign the frequency of the value as the probability.
                     else:
-                        frequency[attribute_value] = attribute_value_frequency
-                distribution[attribute] = (distribution_type, frequency)
+                        frequency[attribute_value] = attribute_value_count/instances_number
+                distribution[attribute] = ('uniform', frequency)
             else:
-                mean = statistics.mean(attribute_values_list)
-                variance = statistics.variance([instance[attribute] for instance in instances_per_class[c]], mean)
-                distribution[attribute] = (distribution_type, {'mean': mean, 'variance': variance})
-
+                instances_number, mean, squared_differences = accumulator
+                if instances_number == 0:
+                    raise Exception('NBParser: no training instances of class ' + str(c))
+                # Sample variance, as statistics.variance
+                variance = squared_differences / (instances_number - 1) if instances_number > 1 else 0.0
+                distribution[attribute] = ('normal', {'mean': mean, 'variance': variance})
         distribution_per_class[c] = distribution
+    return distribution_per_class
+
+
+# Computes the statistics of each class (see __naive_bayes_new_statistics) of the instances of a matrix at once.
+# - 'matrix' is a matrix with one instance (without class label) per row.
+# - 'labels' is an array with the class label (from 0 to the number of classes - 1) of each row.
+# - 'schema' is the schema of the data set, with which the instances were decoded.
+def naive_bayes_statistics_from_matrix(matrix, labels, schema):
+    statistics_per_class = {}
+    for c in range(schema['classes_number']):
+        rows = matrix[labels == c]
+        statistics_per_class[c] = {}
+        for attribute in range(matrix.shape[1]):
+            values = rows[:, attribute]
+            if Utils.is_categorical(attribute, schema):
+                statistics_per_class[c][attribute] = numpy.bincount(
+                    values.astype(numpy.intp),
+                    minlength=Utils.categorical_attribute_values_number(attribute, schema)).tolist()
+            else:
+                mean = float(values.mean()) if len(values) > 0 else 0.0
+                statistics_per_class[c][attribute] = [len(values), mean, float(((values - mean) ** 2).sum())]
+    return statistics_per_class
 
-    # Save the distributions to a json file
-    if 'iris' in data_set_file_path:
+
+# Trains the model with the instances of a matrix, without reading or writing any file.
+# The parameters are the same as in naive_bayes_statistics_from_matrix.
+# Returns the distributions dictionary, with the same format as the one loaded by naive_bayes_load_distributions.
+def naive_bayes_train_matrix(matrix, labels, schema):
+    return __naive_bayes_distributions_from_statistics(naive_bayes_statistics_from_matrix(matrix, labels, schema),
+                                                       schema)
+
+
+# Streaming parser. Generates the distributions file, the statistics file and the validation instances file, reading
+# the data set file only once and without keeping the instances in memory.
+# Each line is used for training or for validation according to a hash of 'seed' and the line, instead of shuffling
+# all the instances. So the proportion of training instances is only approximately 'training_proportion' (with 0.8,
+# iris gives 126 training and 24 validation instances instead of 120 and 30).
+# The training instances are not kept, so no instances file is written. An instances file left by a previous training
+# comes from another split, so it is removed.
+def naive_bayes_train_streaming(data_set_file_path, training_proportion, seed=naive_bayes_split_seed):
+    schema = Schema.schema_of_data_set(data_set_file_path)
+    if schema['name'] == 'iris':
         distributions_file_name = naive_bayes_iris_distributions_file_name
+        instances_file_name = naive_bayes_iris_instances_file_name
+        validation_instances_file_name = naive_bayes_iris_validation_instances_file_name
+        statistics_file_name = naive_bayes_iris_statistics_file_name
     else:
         distributions_file_name = naive_bayes_covtype_distributions_file_name
-    with open(distributions_file_name, 'w') as distributions_file:
-        json.dump(distribution_per_class, distributions_file)
+        instances_file_name = naive_bayes_covtype_instances_file_name
+        validation_instances_file_name = naive_bayes_covtype_validation_instances_file_name
+        statistics_file_name = naive_bayes_covtype_statistics_file_name
+    if os.path.exists(instances_file_name):
+        os.remove(instances_file_name)
+
+    statistics_per_class = __naive_bayes_new_statistics(schema)
+    with open(data_set_file_path, 'r') as data_set_file, \
+            open(validation_instances_file_name, 'w') as naive_bayes_validation_instances_file:
+        # The lines are parsed in blocks, so the binary attributes of each block are decoded at once
+        numbered_lines = ((line_number, instance_line) for line_number, instance_line in enumerate(data_set_file)
+                          if instance_line.strip())
+        for batch in Utils.batches(numbered_lines, naive_bayes_parse_batch_size):
+            batch_lines = [instance_line for _, instance_line in batch]
+            instances, labels = __naive_bayes_parse_instance_lines(batch_lines, schema)
+            for (line_number, instance_line), instance, class_label in zip(
+                    batch, __naive_bayes_instances_list(instances, schema), labels.tolist()):
+                if __naive_bayes_is_training_line(instance_line, line_number, seed, training_proportion):
+                    __naive_bayes_add_to_statistics(statistics_per_class, instance, class_label, schema)
+                else:
+                    naive_bayes_validation_instances_file.write(str(instance + [class_label]) + '\n')
+
+    naive_bayes_save_statistics(statistics_per_class, statistics_file_name)
+    return __naive_bayes_save_distributions(statistics_per_class, schema, distributions_file_name)
+
+
+# Computes the probability of each class from the number of instances of each class in the statistics.
+# Returns a dictionary: class label -> probability.
+def naive_bayes_classes_distributions_from_statistics(statistics_per_class, schema):
+    counts = []
+    for c in range(schema['classes_number']):
+        # The count of any attribute is the number of instances of the class.
+        accumulator = statistics_per_class[c][0]
+        counts.append(sum(accumulator) if Utils.is_categorical(0, schema) else accumulator[0])
+    classes_labels = naive_bayes_classes_labels[schema['name']]
+    return {label: count / sum(counts) for label, count in zip(classes_labels, counts)}
+
+
+# Computes the distributions and the probability of each class from the statistics and saves them as the
+# distributions file. The probabilities of the classes are saved with the key 'classes_distributions'.
+# Returns the distributions dictionary.
+def __naive_bayes_save_distributions(statistics_per_class, schema, distributions_file_path):
+    distribution_per_class = __naive_bayes_distributions_from_statistics(statistics_per_class, schema)
+    with open(distributions_file_path, 'w') as distributions_file:
+        json.dump(dict(distribution_per_class, classes_distributions=naive_bayes_classes_distributions_from_statistics(
+            statistics_per_class, schema)), distributions_file)
+    return distribution_per_class
+
+
+# Functions for updating a trained model with new instances, without reading the whole data set again.
+# The model keeps the accumulated statistics of each class, saved by naive_bayes_train_streaming, from which the
+# distributions are computed again after each update.
+
+# Saves the statistics of each class to a json file.
+def naive_bayes_save_statistics(statistics_per_class, statistics_file_path):
+    with open(statistics_file_path, 'w') as statistics_file:
+        json.dump(statistics_per_class, statistics_file)
+
+
+# Loads the statistics of each class. Returns the dictionary: class number -> attribute number -> accumulator.
+def naive_bayes_load_statistics(statistics_file_path):
+    with open(statistics_file_path, 'r') as statistics_file:
+        # Convert the string keys to int keys, because json.dump saves the keys as strings.
+        statistics_string_keys = json.load(statistics_file)
+    return {int(c): {int(attribute): accumulator for attribute, accumulator in statistics_string_keys[c].items()}
+            for c in statistics_string_keys}
+
+
+# Merges the statistics of two models trained with different instances of the same data set.
+# Returns new statistics, equal to the ones of a model trained with the instances of both.
+# - 'schema' is the schema of the data set.
+def naive_bayes_merge_statistics(first_statistics, second_statistics, schema):
+    merged_statistics = {}
+    for c in first_statistics:
+        merged_statistics[c] = {}
+        for attribute, first in first_statistics[c].items():
+            second = second_statistics[c][attribute]
+            if Utils.is_categorical(attribute, schema):
+                merged_statistics[c][attribute] = [a + b for a, b in zip(first, second)]
+            else:
+                # Combine the means and the sums of squared differences (Chan et al. parallel algorithm).
+                instances_number = first[0] + second[0]
+                if instances_number == 0:
+                    merged_statistics[c][attribute] = [0, 0.0, 0.0]
+                    continue
+                delta = second[1] - first[1]
+                mean = first[1] + delta * second[0] / instances_number
+                squared_differences = first[2] + second[2] + delta * delta * first[0] * second[0] / instances_number
+                merged_statistics[c][attribute] = [instances_number, mean, squared_differences]
+    return merged_statistics
+
+
+# Updates a trained model with new labelled instances.
+# - 'data_set_name' is 'iris' or 'covtype'.
+# - 'instances_lines' is an iterable of instance lines with the same format as the data set file.
+# The statistics and distributions files of the data set are updated. The cost is proportional to the number of new
+# instances. Returns the new distributions dictionary.
+# The statistics file is saved by naive_bayes_train_streaming. Models trained before (as the distributions of covtype
+# in the repository) don't have it, so they must be trained again before updating them.
+def naive_bayes_update(data_set_name, instances_lines):
+    if data_set_name == 'iris':
+        statistics_file_name = naive_bayes_iris_statistics_file_name
+    elif data_set_name == 'covtype':
+        statistics_file_name = naive_bayes_covtype_statistics_file_name
+    else:
+        raise Exception('NBParser.naive_bayes_update: data set should be "iris" or "covtype"')
+    if not os.path.exists(statistics_file_name):
+        raise Exception('NBParser.naive_bayes_update: ' + statistics_file_name + ' does not exist. Train the model '
+                        'with naive_bayes_train_streaming (python3 NBParser.py) before updating it')
+    schema = Schema.schemas[data_set_name]
+    new_statistics = __naive_bayes_new_statistics(schema)
+    non_empty_lines = (instance_line for instance_line in instances_lines if instance_line.strip())
+    for batch in Utils.batches(non_empty_lines, naive_bayes_parse_batch_size):
+        instances, labels = __naive_bayes_parse_instance_lines(batch, schema)
+        for instance, class_label in zip(__naive_bayes_instances_list(instances, schema), labels.tolist()):
+            __naive_bayes_add_to_statistics(new_statistics, instance, class_label, schema)
+    statistics_per_class = naive_bayes_merge_statistics(naive_bayes_load_statistics(statistics_file_name),
+                                                        new_statistics, schema)
+    return naive_bayes_save_model(data_set_name, statistics_per_class)
+
+
+# Saves the statistics and the distributions computed from them as the model of the given data set.
+# Returns the distributions dictionary.
+def naive_bayes_save_model(data_set_name, statistics_per_class):
+    if data_set_name == 'iris':
+        statistics_file_name = naive_bayes_iris_statistics_file_name
+        distributions_file_name = naive_bayes_iris_distributions_file_name
+    else:
+        statistics_file_name = naive_bayes_covtype_statistics_file_name
+        distributions_file_name = naive_bayes_covtype_distributions_file_name
+    naive_bayes_save_statistics(statistics_per_class, statistics_file_name)
+    return __naive_bayes_save_distributions(statistics_per_class, Schema.schemas[data_set_name],
+                                            distributions_file_name)
 
 
 # Functions for loading the instances and distributions files
@@ -172,6 +344,8 @@ def naive_bayes_load_distributions(dictionary_file_path):
         # With json.load, the int keys are loaded as string keys and the tuples are loaded as lists,
         # because json.dump saves the keys as strings and the tuples as list.
         dictionary_string_keys = json.load(distributions_file)
+        # The probabilities of the classes are loaded by naive_bayes_load_classes_distributions.
+        dictionary_string_keys.pop('classes_distributions', None)
         # Convert the string keys to int keys, if possible, and the list to tuples
         dictionary_int_keys = {int(c): {} for c in dictionary_string_keys}
         for c in dictionary_string_keys:   # c is a str
@@ -188,6 +362,17 @@ def naive_bayes_load_distributions(dictionary_file_path):
     return dictionary_int_keys
 
 
+# Loads the probability of each class saved in a distributions file. Distributions files saved before the
+# probabilities of the classes were saved use the ones of the whole data set (naive_bayes_classes_distributions).
+# Returns a dictionary: class label -> probability.
+def naive_bayes_load_classes_distributions(dictionary_file_path):
+    with open(dictionary_file_path, 'r') as distributions_file:
+        classes_distributions = json.load(distributions_file).get('classes_distributions')
+    if classes_distributions is None:
+        return naive_bayes_classes_distributions[Schema.schema_of_data_set(dictionary_file_path)['name']]
+    return classes_distributions
+
+
 # Loads the dictionary of instances per class. Returns the dictionary.
 def naive_bayes_load_instances(instances_file_path):
     with open(instances_file_path, 'r') as instances_file:
@@ -200,17 +385,69 @@ def naive_bayes_load_instances(instances_file_path):
     return instances_per_class
 
 
+# Loads all the instances of a data set from the data set file, for instance for cross validation. The instances are
+# decoded with the schema of the data set, as the ones the model is trained with. They are read from the data set
+# file, and not from the training and validation files, because those files may come from different splits.
+# Returns a pair with a matrix with one instance (without class label) per row and an array with the class label of
+# each row.
+def naive_bayes_load_data_set(data_set_file_path):
+    if not os.path.exists(data_set_file_path):
+        raise Exception('NBParser.naive_bayes_load_data_set: the data set file ' + data_set_file_path +
+                        ' does not exist')
+    schema = Schema.schema_of_data_set(data_set_file_path)
+    rows = Parser.load_numeric_file(data_set_file_path)
+    if rows.shape[1] != schema['attributes_number'] + 1:
+        raise Exception('NBParser.naive_bayes_load_data_set: the instances of ' + data_set_file_path + ' must have ' +
+                        str(schema['attributes_number']) + ' attributes and the class label')
+    return Schema.schema_decode_attributes(schema, rows), Schema.schema_labels(schema, rows)
+
+
+# Converts the categorical attribute values and the class label of a validation instance from float to int.
+def __naive_bayes_integer_columns(instance, schema):
+    for attribute in range(len(instance) - 1):
+        if Utils.is_categorical(attribute, schema):
+            instance[attribute] = int(instance[attribute])
+    instance[-1] = int(instance[-1])
+    return instance
+
+
 # Loads the instances for validation. The instances are lists of attributes with the class label at the end.
+# Categorical attribute values and the class label are int, the other attribute values are float.
 def naive_bayes_load_validation_instances(validation_instances_file_path):
-    with open(validation_instances_file_path, 'r') as validation_instances_file:
-        instances_strings = validation_instances_file.readlines()
-    validation_instances = []
-    # Parse the strings in each line as a list
-    for instance_str in instances_strings:
-        validation_instances.append(ast.literal_eval(instance_str))
-    return validation_instances
+    schema = Schema.schema_of_data_set(validation_instances_file_path)
+    return [__naive_bayes_integer_columns(instance, schema)
+            for instance in Parser.load_numeric_file(validation_instances_file_path).tolist()]
+
+
+# Reads the instances for validation one at a time, without loading the whole file.
+# Yields the instances in the same format as naive_bayes_load_validation_instances.
+def naive_bayes_iterate_validation_instances(validation_instances_file_path):
+    schema = Schema.schema_of_data_set(validation_instances_file_path)
+    for instance in Parser.iterate_numeric_file(validation_instances_file_path):
+        yield __naive_bayes_integer_columns(instance, schema)
 
 
+uso = """
+Invocar como:
+
+python3 NBParser.py
+    Entrena los modelos de iris y covtype a partir de iris/iris.data y covtype/covtype.data.
+python3 NBParser.py update [iris|covtype] archivo
+    Agrega al modelo las instancias etiquetadas de archivo, con el mismo formato que el data set.
+python3 NBParser.py merge [iris|covtype] estadisticas1.json estadisticas2.json
+    Reemplaza el modelo por la combinación de dos modelos entrenados por separado.
+"""
+
 if __name__ == '__main__':
-    __naive_bayes_parser('iris/iris.data', 0.8)  # this is commented because it's not necessary to run it again
-    __naive_bayes_parser('covtype/covtype.data', 0.8) # this is commented because it's not necessary to run it again
+    if len(sys.argv) == 1:
+        naive_bayes_train_streaming(naive_bayes_iris_data_set_file_name, 0.8)
+        naive_bayes_train_streaming(naive_bayes_covtype_data_set_file_name, 0.8)
+    elif len(sys.argv) == 4 and sys.argv[1] == 'update' and sys.argv[2] in ['iris', 'covtype']:
+        with open(sys.argv[3], 'r') as new_instances_file:
+            naive_bayes_update(sys.argv[2], new_instances_file)
+    elif len(sys.argv) == 5 and sys.argv[1] == 'merge' and sys.argv[2] in ['iris', 'covtype']:
+        naive_bayes_save_model(sys.argv[2], naive_bayes_merge_statistics(naive_bayes_load_statistics(sys.argv[3]),
+                                                                         naive_bayes_load_statistics(sys.argv[4]),
+                                                                         Schema.schemas[sys.argv[2]]))
+    else:
+        print(uso)
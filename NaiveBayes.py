@@ -3,40 +3,148 @@ TODO
 This module implement the Naive Bayes algorithm. It assumes that the instances are separated by class and that
 the distributions of each attribute (normal distribution is assumed) are already calculated.
 The classification function of this module returns a class number.
+For classifying a data set, the distributions are first compiled into matrices (see naive_bayes_compile_model), so
+all the instances are scored at once, in log space, with matrix operations.
 """
 
-import Evaluator
-import NBParser
+import math
+import numpy
+import Instrumentation
 import Utils
 
+
+# Number of instances classified together by naive_bayes_classify_stream.
+naive_bayes_stream_batch_size = 4096
+
+# Minimum variance of the normal distributions. Attributes with a smaller variance in a class (for instance, constant
+# attributes) use this variance instead, so their density is finite.
+naive_bayes_variance_floor = 1e-9
+
+# Last model compiled by naive_bayes_classify_instance, with the arguments it was compiled from: (classes
+# distributions, attribute distributions per class, classes labels, compiled model).
+__naive_bayes_compiled_model_cache = [None, None, None, None]
+
 # Implement the Naive Bayes algorithm.
 # - 'attribute_distributions_per_class' is a dict with the distributions for each subclass
 # - 'classes_distributions' is the percentage of that instances with that class in the dataset
 # - 'instance' is the instance to classify
 # - 'classes_labels' is a list with all class labels.
 # Return the class number that classifies x with the K-NN algorithm.
+# The distributions are compiled in the first call, and compiled again only when the call receives other
+# distributions objects (they must not be modified between calls). For classifying many instances at once, compile
+# them with naive_bayes_compile_model and use naive_bayes_classify_matrix.
 def naive_bayes_classify_instance(classes_distributions, attribute_distributions_per_class, classes_labels, instance):
-    max_index = 0
-    max_probability = -1
-    for class_index in range(len(classes_labels)):
-        probability = classes_distributions[classes_labels[class_index]]
+    cache = __naive_bayes_compiled_model_cache
+    if cache[0] is not classes_distributions or cache[1] is not attribute_distributions_per_class or \
+            cache[2] is not classes_labels:
+        # The cache keeps references to the arguments, so their identities can't be reused by other objects.
+        cache[:] = [classes_distributions, attribute_distributions_per_class, classes_labels,
+                    naive_bayes_compile_model(classes_distributions, attribute_distributions_per_class, classes_labels)]
+    model = cache[3]
+    # The class label at the end of the instance is ignored.
+    return int(numpy.argmax(naive_bayes_log_scores(model, [instance])[0]))
+
+
+# Compile the distributions into matrices, for scoring many instances at once in log space.
+# - 'attribute_distributions_per_class' is a dict with the distributions for each subclass
+# - 'classes_distributions' is the percentage of that instances with that class in the dataset
+# - 'classes_labels' is a list with all class labels.
+# Return the compiled model as a dictionary:
+#       + 'log_priors': array with the logarithm of the probability of each class.
+#       + 'numeric_attributes': array with the attribute numbers with normal distribution.
+#       + 'means', 'variances', 'log_normalizers', 'inverse_double_variances': matrices with one row per class and one
+#       column per numeric attribute. The variances are at least naive_bayes_variance_floor. The log normalizer is
+#       -0.5*log(2*pi*variance) and the inverse double variance is 1/(2*variance), so the log density of a value is
+#       log normalizer - (value - mean)^2 * inverse double variance.
+#       + 'centers': array with the mean of 'means' of each numeric attribute.
+#       + 'log_density_constants', 'quadratic_coefficients', 'linear_coefficients': the sum of the log densities of the
+#       numeric attributes of an instance, expanded as a polynomial of its values minus 'centers' (centered, so the
+#       terms of the polynomial don't cancel each other with large values): log density constant of the class +
+#       (centered * centered) @ quadratic coefficients + centered @ linear coefficients. The constants are an array
+#       with one value per class, and the coefficients are matrices with one row per numeric attribute and one column
+#       per class.
+#       + 'categorical_attributes': list with the attribute numbers with uniform distribution.
+#       + 'categorical_log_probabilities': list with a matrix for each categorical attribute, with one row per class
+#       and one column per attribute value seen in training (the logarithm of the frequency of the value in the class).
+#       Values out of the columns have probability 0 (see naive_bayes_log_scores).
+def naive_bayes_compile_model(classes_distributions, attribute_distributions_per_class, classes_labels):
+    first_distributions = attribute_distributions_per_class[0]
+    attributes = sorted(first_distributions)
+    numeric_attributes = [attribute for attribute in attributes if first_distributions[attribute][0] == 'normal']
+    categorical_attributes = [attribute for attribute in attributes if first_distributions[attribute][0] == 'uniform']
+    classes_number = len(classes_labels)
+
+    means = numpy.empty((classes_number, len(numeric_attributes)))
+    variances = numpy.empty((classes_number, len(numeric_attributes)))
+    categorical_log_probabilities = []
+    for attribute in categorical_attributes:
+        values_number = 1 + max(max(attribute_distributions_per_class[class_index][attribute][1])
+                                for class_index in range(classes_number))
+        # Values never seen in a class have probability 0.
+        categorical_log_probabilities.append(numpy.full((classes_number, values_number), -numpy.inf))
+    for class_index in range(classes_number):
         distributions = attribute_distributions_per_class[class_index]
-        for index in range(len(instance)-1): # -1 to not use the label
-            # Dictionary: attribute number -> (distribution type, distribution parameters)
-            (distr_type, distr_parameters) = distributions[index]
-            attr_value = instance[index]
-            if distr_type == "normal": # If distribution type == 'normal', distribution parameters == {'mean': m, 'variance': v}
-                probability *= Utils.gaussian(distr_parameters["mean"], distr_parameters["variance"], attr_value)
-            elif distr_type == "uniform": # If distribution type == 'uniform', distribution parameters == {v1: f1, ... , vn: fn}, where v1, ... , vn
-            # are all the possible attribute values and f1, ... , fn are the frequencies of those values in the set
-                probability *= distr_parameters[attr_value]
-            else:
+        for column, attribute in enumerate(numeric_attributes):
+            (distr_type, distr_parameters) = distributions[attribute]
+            if distr_type != 'normal':
+                raise Exception("Distribution type error")
+            means[class_index, column] = distr_parameters['mean']
+            variances[class_index, column] = max(distr_parameters['variance'], naive_bayes_variance_floor)
+        for log_probabilities, attribute in zip(categorical_log_probabilities, categorical_attributes):
+            (distr_type, distr_parameters) = distributions[attribute]
+            if distr_type != 'uniform':
                 raise Exception("Distribution type error")
-        if probability > max_probability:
-            max_probability = probability
-            max_index = class_index
-    # pass from label to index
-    return max_index
+            for attr_value, frequency in distr_parameters.items():
+                log_probabilities[class_index, attr_value] = math.log(frequency) if frequency > 0 else -numpy.inf
+
+    inverse_double_variances = 1.0 / (2.0 * variances)
+    log_normalizers = -0.5 * numpy.log(2 * math.pi * variances)
+    centers = means.mean(axis=0)
+    centered_means = means - centers
+    log_density_constants = (log_normalizers - centered_means * centered_means * inverse_double_variances).sum(axis=1)
+    return {
+        'log_priors': numpy.log([classes_distributions[label] for label in classes_labels]),
+        'numeric_attributes': numpy.array(numeric_attributes, dtype=numpy.intp),
+        'means': means,
+        'variances': variances,
+        'log_normalizers': log_normalizers,
+        'inverse_double_variances': inverse_double_variances,
+        'centers': centers,
+        'log_density_constants': log_density_constants,
+        'quadratic_coefficients': numpy.ascontiguousarray(-inverse_double_variances.T),
+        'linear_coefficients': numpy.ascontiguousarray((2.0 * centered_means * inverse_double_variances).T),
+        'categorical_attributes': categorical_attributes,
+        'categorical_log_probabilities': categorical_log_probabilities,
+    }
+
+
+# Compute the logarithm of the (unnormalized) probability of each class for each instance.
+# - 'model' is a model compiled with naive_bayes_compile_model.
+# - 'matrix' is a matrix with one instance per row. Extra columns (as the class label) are ignored. A value of a
+# categorical attribute never seen in training (out of the columns of its matrix of log probabilities) has
+# probability 0 in every class.
+# Return a matrix with one row per instance and one column per class.
+def naive_bayes_log_scores(model, matrix):
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+    scores = numpy.tile(model['log_priors'], (len(matrix), 1))
+    if len(model['numeric_attributes']) > 0:
+        # Sum of the log densities of all the numeric attributes, as two matrix products (see naive_bayes_compile_model)
+        centered = matrix[:, model['numeric_attributes']] - model['centers']
+        scores += model['log_density_constants']
+        scores += (centered * centered) @ model['quadratic_coefficients']
+        scores += centered @ model['linear_coefficients']
+    for attribute, log_probabilities in zip(model['categorical_attributes'], model['categorical_log_probabilities']):
+        values = matrix[:, attribute].astype(numpy.intp)
+        seen = (values >= 0) & (values < log_probabilities.shape[1])
+        scores += numpy.where(seen[:, None], log_probabilities[:, numpy.where(seen, values, 0)].T, -numpy.inf)
+    return scores
+
+
+# Classify each row of 'matrix' with a model compiled with naive_bayes_compile_model.
+# Return an array with the class index that classifies each row. In case of tie, the first class is preferred.
+def naive_bayes_classify_matrix(model, matrix):
+    with Instrumentation.instrumentation_stage('naive_bayes_classify', len(matrix)):
+        return numpy.argmax(naive_bayes_log_scores(model, matrix), axis=1)
 
 
 # Classify using Naive Bayes
@@ -46,28 +154,45 @@ def naive_bayes_classify_instance(classes_distributions, attribute_distributions
 # - 'classes_labels' is a list with all class labels.
 # Return the classified elements as a list of tuples (label, guess)
 def naive_bayes_classify_dataset(classes_distributions, attribute_distributions_per_class, classes_labels, dataset):
+    model = naive_bayes_compile_model(classes_distributions, attribute_distributions_per_class, classes_labels)
+    matrix = numpy.array(dataset, dtype=numpy.float64).reshape(len(dataset), -1)
+    guesses = naive_bayes_classify_matrix(model, matrix)
     result = []
-    for instance in dataset:
-        guess = naive_bayes_classify_instance(classes_distributions, attribute_distributions_per_class, classes_labels, instance)
+    for instance, guess in zip(dataset, guesses):
         label = instance[-1]
         result.append([classes_labels[label], classes_labels[guess]])
     return result
 
+# Classify a stream of instances using Naive Bayes, yielding each classification as soon as the batch of instances
+# that contains it is classified. Only one batch of instances is kept in memory.
+# - 'dataset' is an iterable of instances, for instance the ones read by
+# NBParser.naive_bayes_iterate_validation_instances.
+# The other parameters are the same as in naive_bayes_classify_dataset.
+# Yields the classified elements as lists (label, guess), in the same order as 'dataset'.
+def naive_bayes_classify_stream(classes_distributions, attribute_distributions_per_class, classes_labels, dataset,
+                                batch_size=naive_bayes_stream_batch_size):
+    model = naive_bayes_compile_model(classes_distributions, attribute_distributions_per_class, classes_labels)
+    for batch in Utils.batches(dataset, batch_size):
+        guesses = naive_bayes_classify_matrix(model, numpy.array(batch, dtype=numpy.float64))
+        for instance, guess in zip(batch, guesses):
+            yield [classes_labels[instance[-1]], classes_labels[guess]]
+
+
 if __name__ == '__main__':
+    import Evaluator
+    import NBParser
     #iris
     distributions_dictionary = NBParser.naive_bayes_load_distributions(NBParser.naive_bayes_iris_distributions_file_name)
     validation_set = NBParser.naive_bayes_load_validation_instances(NBParser.naive_bayes_iris_validation_instances_file_name)
     classes_labels = ["Iris Setosa", "Iris Versicolour", "Iris Virginica"]
-    classes_distributions = {"Iris Setosa" : 1/3, "Iris Versicolour" : 1/3, "Iris Virginica" : 1/3}
+    classes_distributions = NBParser.naive_bayes_load_classes_distributions(NBParser.naive_bayes_iris_distributions_file_name)
     classified_data = naive_bayes_classify_dataset(classes_distributions, distributions_dictionary, classes_labels, validation_set)
     Evaluator.evaluate_classifier(classified_data, classes_labels, 'naive_bayes_exp/iris.data')
     #covtype
     distributions_dictionary = NBParser.naive_bayes_load_distributions(NBParser.naive_bayes_covtype_distributions_file_name)
     validation_set = NBParser.naive_bayes_load_validation_instances(NBParser.naive_bayes_covtype_validation_instances_file_name)
     classes_labels = ["Spruce/Fir", "Lodgepole Pine", "Ponderosa Pine", "Cottonwood/Willow", "Aspen", "Douglas-fir", "Krummholz"]
-    classes_distributions = {"Spruce/Fir" : 211840/581012, "Lodgepole Pine" : 283301/581012,
-                             "Ponderosa Pine" : 35754/581012, "Cottonwood/Willow" : 2747/581012,
-                            "Aspen" : 9493/581012, "Douglas-fir" : 17367/581012, "Krummholz" : 20510/581012}
+    classes_distributions = NBParser.naive_bayes_load_classes_distributions(NBParser.naive_bayes_covtype_distributions_file_name)
     classified_data = naive_bayes_classify_dataset(classes_distributions, distributions_dictionary, classes_labels, validation_set)
     Evaluator.evaluate_classifier(classified_data, classes_labels, 'naive_bayes_exp/covtype.data')
 
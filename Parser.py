@@ -3,12 +3,23 @@ Read the data sets Iris and Cover type and process the instances, so that it can
 
 For both Naive Bayes and K-NN:
 + convert Iris class from str to int. The mapping is Iris-setosa <-> 0, Iris-versicolor <-> 1 and Iris-virginica <-> 2.
++ read numeric files (the data sets, and the processed and validation files) as matrices, keeping a binary cache of
+each file, so later loads don't parse the text again.
 """
 
+import hashlib
+import os
+import numpy
+import Instrumentation
+import Utils
+
 """
 Parser for both algorithms. It is run only once.
 """
 
+# Extension of the binary cache saved next to each numeric file read with load_numeric_file.
+numeric_cache_extension = '.cache'
+
 
 # Parse the iris data set and change the class label from string to integer.
 # It saves the modified data set in a file with the same name
@@ -35,3 +46,67 @@ def __parse_iris_class_label(data_set_file_path):
     with open(data_set_file_path, 'w') as data_set_file:
         # Write the numbers (attributes and class) in the file with the same format
         data_set_file.writelines(new_lines)
+
+
+# Reads a text file with one instance per line and the numbers separated by commas, as the data set files or the
+# files with lines written by str(list). Returns a matrix with one row per line.
+def parse_numeric_file(file_path):
+    with open(file_path, 'r') as numeric_file:
+        text = numeric_file.read()
+    lines = [line for line in text.translate({ord('['): ' ', ord(']'): ' '}).splitlines() if line.strip()]
+    if len(lines) == 0:
+        return numpy.empty((0, 0))
+    columns_number = lines[0].count(',') + 1
+    # numpy converts all the tokens at once, which is much faster than parsing each of them in Python.
+    tokens = ','.join(lines).split(',')
+    return numpy.array(tokens, dtype=numpy.float64).reshape(len(lines), columns_number)
+
+
+# Reads a numeric file (see parse_numeric_file) one line at a time. Yields a list of floats for each line.
+def iterate_numeric_file(file_path):
+    with open(file_path, 'r') as numeric_file:
+        for line in numeric_file:
+            line = line.strip().strip('[]')
+            if line:
+                yield [float(token) for token in line.split(',')]
+
+
+# Returns a hash of the contents of a file.
+def __file_hash(file_path):
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as hashed_file:
+        for block in iter(lambda: hashed_file.read(1 << 20), b''):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+
+# Reads a numeric file (see parse_numeric_file) as a matrix. The first time, the matrix is saved in a binary cache
+# next to the file, together with the size, the modification time and a hash of the contents of the file. Later calls
+# read the matrix from the cache (with mmap) while the size and the modification time of the file don't change, so
+# they don't read the file. If they changed, the file is hashed, and the cache is still used if the contents are the
+# same (for instance, if the file was copied).
+def load_numeric_file(file_path):
+    cache_file_path = file_path + numeric_cache_extension
+    file_status = os.stat(file_path)
+    content_hash = None
+    if os.path.exists(cache_file_path):
+        with Instrumentation.instrumentation_stage('load_numeric_cache'):
+            arrays, metadata = Utils.load_arrays(cache_file_path)
+        if metadata.get('size') == file_status.st_size and metadata.get('mtime_ns') == file_status.st_mtime_ns:
+            return arrays['data']
+        content_hash = __file_hash(file_path)
+        if metadata.get('hash') == content_hash:
+            # Save the new modification time, so the next calls don't hash the file again.
+            matrix = numpy.array(arrays['data'])
+            Utils.save_arrays(cache_file_path, {'data': matrix}, {'hash': content_hash, 'size': file_status.st_size,
+                                                                  'mtime_ns': file_status.st_mtime_ns,
+                                                                  'source': file_path})
+            return matrix
+    if content_hash is None:
+        content_hash = __file_hash(file_path)
+    with Instrumentation.instrumentation_stage('parse_numeric_file'):
+        matrix = parse_numeric_file(file_path)
+    Instrumentation.instrumentation_count('parsed_rows', len(matrix))
+    Utils.save_arrays(cache_file_path, {'data': matrix}, {'hash': content_hash, 'size': file_status.st_size,
+                                                          'mtime_ns': file_status.st_mtime_ns, 'source': file_path})
+    return matrix
@@ -0,0 +1,108 @@
+"""
+Declarative schemas of the data sets. The schema of a data set describes the columns of its file, so the parsers of
+KNN and Naive Bayes don't need code written for each data set:
++ 'name': name of the data set, which is also part of the paths of its files.
++ 'attributes_number': number of attributes of the data set file (without the class label).
++ 'numeric_attributes': columns of the file with numeric attributes.
++ 'one_hot_groups': list of pairs (name, columns), one for each group of binary columns of the file where exactly one
+column is 1 (OneHot encoding of a categorical attribute).
++ 'label_column': column of the file with the class label.
++ 'label_offset': value of the first class label in the file, subtracted from the class labels so they start at 0.
++ 'classes_number': number of classes.
+
+Naive Bayes uses the decoded instances (see schema_decode_attributes): the numeric attributes, in the order of
+'numeric_attributes', followed by one categorical attribute for each one-hot group, whose value is the position of
+the 1 in the group. KNN uses the columns of the file as they are.
+"""
+
+import numpy
+
+
+schema_iris = {
+    'name': 'iris',
+    'attributes_number': 4,
+    'numeric_attributes': [0, 1, 2, 3],
+    'one_hot_groups': [],
+    'label_column': 4,
+    'label_offset': 0,
+    'classes_number': 3,
+}
+
+schema_covtype = {
+    'name': 'covtype',
+    'attributes_number': 54,
+    'numeric_attributes': list(range(10)),
+    'one_hot_groups': [('wilderness_area', list(range(10, 14))), ('soil_type', list(range(14, 54)))],
+    'label_column': 54,
+    'label_offset': 1,
+    'classes_number': 7,
+}
+
+# Dictionary: data set name -> schema.
+schemas = {schema['name']: schema for schema in [schema_iris, schema_covtype]}
+
+
+# Returns the schema of a data set.
+# - 'data_set' is the name of the data set, or the path of one of its files (which contains the name).
+def schema_of_data_set(data_set):
+    for name, schema in schemas.items():
+        if name in data_set:
+            return schema
+    raise Exception('Schema.schema_of_data_set: no data set name (' + ', '.join(schemas) + ') present in ' +
+                    str(data_set))
+
+
+# Returns the columns of the file that belong to a one-hot group.
+def schema_one_hot_columns(schema):
+    return [column for _, columns in schema['one_hot_groups'] for column in columns]
+
+
+# Returns the number of attributes of the decoded instances.
+def schema_decoded_attributes_number(schema):
+    return len(schema['numeric_attributes']) + len(schema['one_hot_groups'])
+
+
+# Returns true iff the attribute of the decoded instances is categorical (it comes from a one-hot group).
+# 'attribute' is the number of the attribute.
+def schema_is_categorical(schema, attribute):
+    return len(schema['numeric_attributes']) <= attribute < schema_decoded_attributes_number(schema)
+
+
+# Returns the number of possible values of a categorical attribute of the decoded instances.
+def schema_categorical_values_number(schema, attribute):
+    if not schema_is_categorical(schema, attribute):
+        raise Exception('Schema.schema_categorical_values_number: attribute ' + str(attribute) +
+                        ' must be categorical')
+    return len(schema['one_hot_groups'][attribute - len(schema['numeric_attributes'])][1])
+
+
+# Decodes a block of instances at once: keeps the numeric attributes and replaces each one-hot group by the position
+# of its 1.
+# - 'rows' is a matrix with one instance per row, with the columns of the data set file. The class label column may
+# be present or not.
+# Returns a matrix with one decoded instance per row.
+def schema_decode_attributes(schema, rows):
+    rows = numpy.asarray(rows, dtype=numpy.float64)
+    decoded = numpy.empty((len(rows), schema_decoded_attributes_number(schema)))
+    numeric_number = len(schema['numeric_attributes'])
+    decoded[:, :numeric_number] = rows[:, schema['numeric_attributes']]
+    for position, (name, columns) in enumerate(schema['one_hot_groups']):
+        group = rows[:, columns]
+        invalid = numpy.flatnonzero((group != 0).sum(axis=1) != 1)
+        if len(invalid) > 0:
+            raise Exception('Schema.schema_decode_attributes: the ' + name + ' columns of row ' + str(invalid[0]) +
+                            ' must have exactly one value different from 0')
+        decoded[:, numeric_number + position] = numpy.argmax(group, axis=1)
+    return decoded
+
+
+# Returns the class labels of a block of instances with the columns of the data set file (including the class label
+# column), starting at 0.
+def schema_labels(schema, rows):
+    return numpy.asarray(rows)[:, schema['label_column']].astype(numpy.int64) - schema['label_offset']
+
+
+# Returns the columns of the data set file without the class label, as used by KNN.
+def schema_attributes(schema, rows):
+    rows = numpy.asarray(rows, dtype=numpy.float64)
+    return numpy.delete(rows, schema['label_column'], axis=1)
@@ -0,0 +1,309 @@
+"""
+Prediction server. It loads the models of a data set once (the scaler and the training data of KNN, and the compiled
+model of Naive Bayes) and classifies the instances received by HTTP, so a prediction doesn't pay the start up of
+Main.py: importing the modules, parsing the training data and building the tree.
+
+Endpoints:
++ POST /knn?k=K classifies with KNN (k is optional, see server_k).
++ POST /nb classifies with Naive Bayes.
++ GET /health returns the data set and engine being served.
+The body of a POST has the instances with the attributes of the data set file, without class label and without
+normalizing (the server normalizes them with the saved scaler for KNN, and converts the binary attributes of Cover
+type for Naive Bayes). It is either json ({"instances": [[attribute values], ...]}, a list of instances or a single
+instance), or, with Content-Type application/octet-stream, the attribute values of the instances one after another as
+little endian float64. The response is json: {"predictions": [class number, ...], "labels": [class label, ...]}.
+
+The server runs with asyncio in a single process. The instances of the requests that arrive while a batch is being
+classified are queued, and then classified together (micro-batching) with a single call to the vectorized scorer of
+each model. The classification runs in a thread, so the event loop keeps receiving requests meanwhile.
+"""
+
+import asyncio
+import functools
+import json
+import sys
+import urllib.parse
+import numpy
+import KNN
+import KNNBallTree
+import KNNForest
+import KNNParser
+import NaiveBayes
+import NBParser
+import Schema
+import Utils
+
+
+# Default address of the server.
+server_host = '127.0.0.1'
+server_port = 8000
+
+# Default number of neighbours of KNN, when the request doesn't have k.
+server_k = 7
+
+# Default search engine of KNN. 'index' opens the saved index with mmap, so the server starts in milliseconds.
+server_engine = 'index'
+
+# Maximum number of instances classified together. A request with more instances is classified alone.
+server_batch_size = 4096
+
+# Seconds that a batch waits for more requests after the first one. With 0, only the requests that arrived while the
+# previous batch was being classified are joined.
+server_batch_wait = 0.0
+
+uso_servidor = """
+Invocar como:
+
+python3 Server.py [iris|covtype] [--host H] [--port P] [--unix ruta]
+      [--engine kdtree|brute|index|balltree|forest|packed] [--k K] [--batch-size N] [--batch-wait ms]
+
+donde:
+
+- iris o covtype indica el dataset cuyos modelos se cargan.
+- --host y --port indican la dirección del servidor HTTP (127.0.0.1:8000 por
+defecto). --unix indica que se escuche en un socket Unix en la ruta dada.
+- --engine indica el motor de búsqueda de vecinos de kNN (index por defecto).
+- --k indica el valor de k usado cuando el pedido no lo indica (7 por defecto).
+- --batch-size indica la cantidad máxima de instancias clasificadas juntas
+(4096 por defecto).
+- --batch-wait indica los milisegundos que se esperan más pedidos antes de
+clasificar un lote (0 por defecto).
+"""
+
+
+# Loads the models of a data set.
+# - 'data_set_name' is 'iris' or 'covtype'.
+# - 'engine' is the search engine of KNN, one of KNN.knn_engines.
+# Returns a dictionary with the KNN scaler and training data (prepared with KNN.knn_prepare), the compiled Naive
+# Bayes model, the class labels and the number of attributes of the instances.
+def server_load_models(data_set_name, engine=server_engine):
+    if data_set_name == 'iris':
+        processed_data_file_name = KNNParser.knn_iris_processed_data_file_name
+        index_file_name = KNNParser.knn_iris_index_file_name
+        packed_file_name = KNNParser.knn_iris_packed_file_name
+        scaler = KNNParser.knn_load_scaler(KNNParser.knn_iris_scaler_file_name, KNNParser.knn_iris_data_file_name)
+        distributions_file_name = NBParser.naive_bayes_iris_distributions_file_name
+    else:
+        processed_data_file_name = KNNParser.knn_covtype_processed_data_file_name
+        index_file_name = KNNParser.knn_covtype_index_file_name
+        packed_file_name = KNNParser.knn_covtype_packed_file_name
+        scaler = KNNParser.knn_load_scaler(KNNParser.knn_covtype_scaler_file_name,
+                                           KNNParser.knn_covtype_data_file_name)
+        distributions_file_name = NBParser.naive_bayes_covtype_distributions_file_name
+    classes = [0, 1, 2, 3, 4, 5, 6]
+    if engine == 'kdtree':
+        k_d_tree, labels = KNNParser.knn_load_processed_data_tree(processed_data_file_name)
+    elif engine == 'packed':
+        k_d_tree = KNNParser.knn_load_packed(packed_file_name, processed_data_file_name)
+        labels = k_d_tree['labels']
+    else:
+        index = KNNParser.knn_load_index(index_file_name, processed_data_file_name)
+        k_d_tree, labels = (index['features'] if engine == 'brute' else index), index['labels']
+        if engine == 'balltree':
+            k_d_tree = KNNBallTree.knn_ball_tree_build(index['features'], labels)
+            labels = k_d_tree['labels']
+        elif engine == 'forest':
+            k_d_tree = KNNForest.knn_forest_build(index['features'], labels)
+    classes_labels = NBParser.naive_bayes_classes_labels[data_set_name]
+    distributions = NBParser.naive_bayes_load_distributions(distributions_file_name)
+    return {
+        'data_set_name': data_set_name,
+        'engine': engine,
+        'attributes_number': len(scaler['minimum']),
+        'scaler': scaler,
+        'knn': KNN.knn_prepare(k_d_tree, labels, classes, engine),
+        'knn_classes': classes,
+        'naive_bayes': NaiveBayes.naive_bayes_compile_model(
+            NBParser.naive_bayes_load_classes_distributions(distributions_file_name), distributions, classes_labels),
+        'classes_labels': classes_labels,
+    }
+
+
+# Classifies the instances of a batch with KNN. Returns a dictionary: k -> list with the class number of each row.
+def __server_classify_knn(models, matrix, k_values):
+    normalized = KNNParser.knn_apply_scaler(models['scaler'], matrix)
+    return KNN.knn_classify_matrix(models['knn'], normalized, k_values, models['knn_classes'])
+
+
+# Classifies the instances of a batch with Naive Bayes. Returns a dictionary: None -> array with the class number of
+# each row.
+def __server_classify_naive_bayes(models, matrix, _):
+    converted = Schema.schema_decode_attributes(Schema.schemas[models['data_set_name']], matrix)
+    return {None: NaiveBayes.naive_bayes_classify_matrix(models['naive_bayes'], converted)}
+
+
+# Classifies the requests of a queue in batches, forever.
+# - 'queue' has tuples (matrix, parameter, future) with the instances of a request, the parameter of the classifier
+# (k for KNN) and the future where the classes of the instances are set.
+# - 'classify' is a function (matrix, list of parameters) -> dictionary: parameter -> classes of the rows.
+async def __server_batcher(queue, classify, batch_size, batch_wait):
+    loop = asyncio.get_running_loop()
+    while True:
+        requests = [await queue.get()]
+        if batch_wait > 0:
+            await asyncio.sleep(batch_wait)
+        rows_number = len(requests[0][0])
+        while rows_number < batch_size and not queue.empty():
+            requests.append(queue.get_nowait())
+            rows_number += len(requests[-1][0])
+        matrix = numpy.concatenate([matrix for matrix, _, _ in requests])
+        parameters = list(dict.fromkeys(parameter for _, parameter, _ in requests))
+        try:
+            classified = await loop.run_in_executor(None, classify, matrix, parameters)
+        except Exception as error:
+            for _, _, future in requests:
+                if not future.done():
+                    future.set_exception(error)
+            continue
+        start = 0
+        for request_matrix, parameter, future in requests:
+            if not future.done():
+                future.set_result(classified[parameter][start:start + len(request_matrix)])
+            start += len(request_matrix)
+
+
+# Reads the instances of the body of a request. Returns a matrix with one instance per row.
+def __server_parse_instances(body, content_type, attributes_number):
+    if content_type.startswith('application/octet-stream'):
+        if len(body) % (8 * attributes_number) != 0:
+            raise ValueError('el cuerpo debe tener ' + str(attributes_number) + ' valores float64 por instancia')
+        return numpy.frombuffer(body, dtype='<f8').reshape(-1, attributes_number)
+    instances = json.loads(body)
+    if isinstance(instances, dict):
+        instances = instances['instances']
+    matrix = numpy.array(instances, dtype=numpy.float64)
+    if matrix.size == 0:
+        return numpy.empty((0, attributes_number))
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    if matrix.ndim != 2 or matrix.shape[1] != attributes_number:
+        raise ValueError('cada instancia debe tener ' + str(attributes_number) + ' atributos')
+    return matrix
+
+
+# Answers a request. Returns a pair (HTTP status, json response).
+async def __server_respond(method, target, headers, body, models, queues, k):
+    url = urllib.parse.urlsplit(target)
+    if method == 'GET' and url.path == '/health':
+        return '200 OK', {'status': 'ok', 'dataset': models['data_set_name'], 'engine': models['engine']}
+    if method != 'POST' or url.path not in queues:
+        return '404 Not Found', {'error': 'Ruta inválida. Debe ser POST /knn, POST /nb o GET /health'}
+    try:
+        matrix = __server_parse_instances(body, headers.get('content-type', ''), models['attributes_number'])
+        parameter = None
+        if url.path == '/knn':
+            parameter = int(urllib.parse.parse_qs(url.query).get('k', [k])[0])
+            if parameter <= 0:
+                raise ValueError('k debe ser un entero positivo')
+    except (ValueError, KeyError, TypeError) as error:
+        return '400 Bad Request', {'error': 'Pedido inválido: ' + str(error)}
+    classified = []
+    if len(matrix) > 0:
+        future = asyncio.get_running_loop().create_future()
+        queues[url.path].put_nowait((matrix, parameter, future))
+        classified = [int(class_number) for class_number in await future]
+    return '200 OK', {'predictions': classified,
+                      'labels': [models['classes_labels'][class_number] for class_number in classified]}
+
+
+# Serves the requests of a connection, until the client closes it (HTTP/1.1 keep alive).
+async def __server_handle_connection(reader, writer, models, queues, k):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, target, _ = request_line.decode('latin-1').split()
+            headers = {}
+            while True:
+                header_line = await reader.readline()
+                if not header_line.strip():
+                    break
+                name, value = header_line.decode('latin-1').split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            try:
+                status, response = await __server_respond(method, target, headers, body, models, queues, k)
+            except Exception as error:
+                status, response = '500 Internal Server Error', {'error': str(error)}
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            payload = json.dumps(response).encode('utf-8')
+            writer.write(('HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {length}\r\n'
+                          'Connection: {connection}\r\n\r\n').format(
+                status=status, length=len(payload), connection='keep-alive' if keep_alive else 'close'
+            ).encode('latin-1') + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        # The client closed the connection or sent a malformed request.
+        pass
+    finally:
+        writer.close()
+
+
+# Runs the server until it is interrupted.
+# - 'models' are the models loaded by server_load_models.
+# - 'unix_socket_path', if given, is the path of the Unix socket where the server listens instead of host:port.
+async def server_run(models, host=server_host, port=server_port, unix_socket_path=None, k=server_k,
+                     batch_size=server_batch_size, batch_wait=server_batch_wait):
+    queues = {'/knn': asyncio.Queue(), '/nb': asyncio.Queue()}
+    batchers = [
+        asyncio.create_task(__server_batcher(queues['/knn'], functools.partial(__server_classify_knn, models),
+                                             batch_size, batch_wait)),
+        asyncio.create_task(__server_batcher(queues['/nb'], functools.partial(__server_classify_naive_bayes, models),
+                                             batch_size, batch_wait)),
+    ]
+
+    def handle_connection(reader, writer):
+        return __server_handle_connection(reader, writer, models, queues, k)
+
+    if unix_socket_path is not None:
+        server = await asyncio.start_unix_server(handle_connection, unix_socket_path)
+        print('Servidor escuchando en el socket ' + unix_socket_path)
+    else:
+        server = await asyncio.start_server(handle_connection, host, port)
+        print('Servidor escuchando en http://{host}:{port}'.format(host=host, port=port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for batcher in batchers:
+            batcher.cancel()
+
+
+if __name__ == '__main__':
+    options = Utils.parse_options(sys.argv)
+    if len(sys.argv) < 2 or sys.argv[1] not in ['iris', 'covtype']:
+        print('#########################')
+        print('Error. Dataset inválido. Debe ser iris o covtype')
+        print('-------------------------')
+        print(uso_servidor)
+        exit()
+    engine = options.get('engine', server_engine)
+    if engine not in KNN.knn_engines:
+        print('#########################')
+        print('Error. Motor de búsqueda inválido. Debe ser ' + ' o '.join(KNN.knn_engines))
+        print('-------------------------')
+        exit()
+    k = int(options.get('k', server_k))
+    batch_size = int(options.get('batch-size', server_batch_size))
+    if k < 1 or batch_size < 1:
+        print('#########################')
+        print('Error. k y la cantidad de instancias por lote deben ser enteros positivos')
+        print('-------------------------')
+        exit()
+    batch_wait = float(options.get('batch-wait', server_batch_wait * 1000)) / 1000
+    print('Cargando los modelos del dataset ' + sys.argv[1])
+    models = server_load_models(sys.argv[1], engine)
+    # Classify one instance with each model, so the first request doesn't pay the first access to the data. The
+    # instance has the first column of each one-hot group set, so Naive Bayes can decode it.
+    warm_up = numpy.zeros((1, models['attributes_number']))
+    warm_up[0, [columns[0] for _, columns in Schema.schemas[models['data_set_name']]['one_hot_groups']]] = 1
+    __server_classify_knn(models, warm_up, [k])
+    __server_classify_naive_bayes(models, warm_up, None)
+    try:
+        asyncio.run(server_run(models, options.get('host', server_host), int(options.get('port', server_port)),
+                               options.get('unix'), k, batch_size, batch_wait))
+    except KeyboardInterrupt:
+        pass
@@ -3,13 +3,58 @@ This module has a collection of utility funcions that may be used across multipl
 """
 
 import ast
+import json
 import math
+import mmap
+import os
+import numpy
+import Schema
+
+
+# Binary files with arrays, written by save_arrays, start with this string, followed by the length of a json header
+# (8 bytes, little endian) and the json header. The raw arrays follow the header, each one aligned to
+# arrays_alignment bytes, so they can be used directly from a memory map.
+arrays_file_magic = b'AA2019ARRAYS'
+arrays_alignment = 64
 
 
 # Receive a number as a string. Returns that number as an int or as a float, depending on the case.
 # For instance, num(2) = 2 and num(1.0) = 1.0
+# int and float are tried before ast.literal_eval, because they are much faster.
 def num(s):
-    return ast.literal_eval(s)
+    try:
+        return int(s)
+    except ValueError:
+        try:
+            return float(s)
+        except ValueError:
+            return ast.literal_eval(s)
+
+
+# Splits an iterable in lists of 'batch_size' consecutive elements (the last one may be shorter).
+# The iterable is consumed lazily, so only one batch is kept in memory at a time.
+def batches(iterable, batch_size):
+    batch = []
+    for element in iterable:
+        batch.append(element)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Removes the options '--name value' from the list of arguments and returns them as a dictionary: name -> value.
+def parse_options(arguments):
+    options = {}
+    index = 0
+    while index < len(arguments):
+        if arguments[index].startswith('--') and index + 1 < len(arguments):
+            options[arguments[index][2:]] = arguments[index + 1]
+            del arguments[index:index + 2]
+        else:
+            index += 1
+    return options
 
 
 # Computes the density function of the normal distribution at x,
@@ -19,34 +64,70 @@ def gaussian(mean, variance, x):
 
 
 # Returns true iff the attribute is categorical.
-# 'attribute' is the number of the attribute.
-def is_categorical(attribute):
-    return attribute == 10 or attribute == 11
+# 'attribute' is the number of the attribute in the instances of Naive Bayes (decoded with 'schema').
+def is_categorical(attribute, schema=Schema.schema_covtype):
+    return Schema.schema_is_categorical(schema, attribute)
 
 
 # Returns the list of possible values of a given categorical attribute.
-def categorical_attribute_values(attribute):
-    if is_categorical(attribute):
-        if attribute == 10:
-            return list(range(4))
-        elif attribute == 11:
-            return list(range(40))
-        else:
-            raise Exception('Utils.categorical_attribute_values: categorical attribute should be attribute 10 and 11')
+def categorical_attribute_values(attribute, schema=Schema.schema_covtype):
+    if is_categorical(attribute, schema):
+        return list(range(Schema.schema_categorical_values_number(schema, attribute)))
     else:
         raise Exception('Utils.categorical_attribute_values: attribute must be categorical')
 
 
 # Returns the number of possible values of a given categorical attribute.
-def categorical_attribute_values_number(attribute):
-    if is_categorical(attribute):
-        if attribute == 10:
-            return 4
-        elif attribute == 11:
-            return 40
-        else:
-            raise Exception('Utils.categorical_attribute_values_number: categorical attribute should be' +
-                            'attribute 10 and 11')
+def categorical_attribute_values_number(attribute, schema=Schema.schema_covtype):
+    if is_categorical(attribute, schema):
+        return Schema.schema_categorical_values_number(schema, attribute)
     else:
         raise Exception('Utils.categorical_attribute_values_number: attribute must be categorical')
 
+
+# Saves a dictionary of numpy arrays to a binary file that can be opened with load_arrays.
+# - 'arrays' is a dictionary: array name -> numpy array.
+# - 'metadata' is a dictionary that can be saved as json, stored in the header of the file.
+def save_arrays(file_path, arrays, metadata=None):
+    arrays = {name: numpy.ascontiguousarray(array) for name, array in arrays.items()}
+    # Offsets are relative to the start of the data, which is aligned after the header.
+    descriptions = {}
+    offset = 0
+    for name, array in arrays.items():
+        descriptions[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // arrays_alignment) * arrays_alignment
+    header = json.dumps({'metadata': metadata or {}, 'arrays': descriptions}).encode('utf-8')
+    data_start = len(arrays_file_magic) + 8 + len(header)
+    data_start = -(-data_start // arrays_alignment) * arrays_alignment
+    # Write to a temporary file first, so a process reading the file never sees it half written.
+    temporary_file_path = file_path + '.tmp'
+    with open(temporary_file_path, 'wb') as arrays_file:
+        arrays_file.write(arrays_file_magic)
+        arrays_file.write(len(header).to_bytes(8, 'little'))
+        arrays_file.write(header)
+        for name, array in arrays.items():
+            arrays_file.seek(data_start + descriptions[name]['offset'])
+            arrays_file.write(array.tobytes())
+        arrays_file.truncate(data_start + offset)
+    os.replace(temporary_file_path, file_path)
+
+
+# Opens a binary file written by save_arrays with mmap. The arrays are read only and are loaded lazily by the
+# operating system, which also shares their memory between the processes that open the same file.
+# Returns a pair (dictionary: array name -> numpy array, metadata dictionary).
+def load_arrays(file_path):
+    with open(file_path, 'rb') as arrays_file:
+        memory_map = mmap.mmap(arrays_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if memory_map[:len(arrays_file_magic)] != arrays_file_magic:
+        raise Exception('Utils.load_arrays: ' + file_path + ' is not an arrays file')
+    header_start = len(arrays_file_magic) + 8
+    header_length = int.from_bytes(memory_map[len(arrays_file_magic):header_start], 'little')
+    header = json.loads(memory_map[header_start:header_start + header_length].decode('utf-8'))
+    data_start = -(-(header_start + header_length) // arrays_alignment) * arrays_alignment
+    arrays = {}
+    for name, description in header['arrays'].items():
+        dtype = numpy.dtype(description['dtype'])
+        count = int(numpy.prod(description['shape'], dtype=numpy.int64))
+        array = numpy.frombuffer(memory_map, dtype, count, data_start + description['offset'])
+        arrays[name] = array.reshape(description['shape'])
+    return arrays, header['metadata']
@@ -0,0 +1,379 @@
+"""
+Benchmarks of the hot paths of KNN and Naive Bayes.
+
+Each stage is timed on the iris and covtype data sets (if their processed files exist) and on synthetic data sets of
+configurable size and dimensionality:
++ parsing: Utils.num, KNNParser.knn_load_processed_data_and_dictionary and NBParser.naive_bayes_load_distributions.
++ index build: the k-d-tree of the 'kdtree' engine, the index of KNNIndex, the ball tree of KNNBallTree and the packed
+training set of KNNPacked.
++ query latency: percentiles of the time KNN spends classifying one instance.
++ batch search: the time KNNIndex.knn_index_search_batch and KNNBallTree.knn_ball_tree_search_batch spend searching
+the neighbours of all the queries in one call, against searching them one at a time.
++ block search: the time the 'brute' and 'packed' engines spend searching the neighbours of the queries at once, and
+the memory of their training sets.
++ batch throughput of NaiveBayes.naive_bayes_classify_dataset.
++ evaluation: confusion matrix and metrics of Evaluator.
+
+The input files are copied to a temporary directory, so the first load of each file is always done without the cache
+of Parser.load_numeric_file. The results are saved as json, by default in benchmarks/results/<commit>.json, so they
+can be compared across commits.
+"""
+
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy
+
+# The modules of the project are in the parent directory, and the data files are relative to it.
+benchmarks_root_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, benchmarks_root_directory)
+
+import Evaluator
+import KNN
+import KNNBallTree
+import KNNIndex
+import KNNPacked
+import KNNParser
+import NBParser
+import NaiveBayes
+import Parser
+import Utils
+
+
+benchmarks_results_directory = os.path.join(benchmarks_root_directory, 'benchmarks', 'results')
+
+# Input files of each real data set: (KNN processed data, KNN validation, NB distributions, NB validation).
+benchmarks_data_sets = {
+    'iris': (KNNParser.knn_iris_processed_data_file_name, KNNParser.knn_iris_validation_file_name,
+             NBParser.naive_bayes_iris_distributions_file_name,
+             NBParser.naive_bayes_iris_validation_instances_file_name),
+    'covtype': (KNNParser.knn_covtype_processed_data_file_name, KNNParser.knn_covtype_validation_file_name,
+                NBParser.naive_bayes_covtype_distributions_file_name,
+                NBParser.naive_bayes_covtype_validation_instances_file_name),
+}
+
+# Default parameters, which may be changed with the options of the command line.
+benchmarks_default_options = {
+    'datasets': 'iris,covtype,synthetic',
+    'rows': '1000,10000',
+    'dimensions': '8',
+    'classes': '7',
+    'queries': '1000',
+    'k': '7',
+    'repeat': '3',
+    'seed': '0',
+}
+
+
+# Runs 'function' 'repeat' times. Returns a dictionary with the seconds of the first run, the minimum and the median.
+def __benchmark_time(function, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start_time)
+    return {'first_seconds': seconds[0], 'min_seconds': min(seconds), 'median_seconds': float(numpy.median(seconds)),
+            'repeat': repeat}
+
+
+# Returns a dictionary with the percentiles, in microseconds, of a list of latencies in seconds.
+def __benchmark_percentiles(latencies):
+    microseconds = numpy.array(latencies) * 1e6
+    return {'queries': len(latencies), 'mean_us': float(microseconds.mean()),
+            'p50_us': float(numpy.percentile(microseconds, 50)), 'p90_us': float(numpy.percentile(microseconds, 90)),
+            'p99_us': float(numpy.percentile(microseconds, 99)), 'max_us': float(microseconds.max())}
+
+
+# Times Utils.num on every number written in a file of instances.
+def __benchmark_num(file_path, repeat):
+    with open(file_path, 'r') as numbers_file:
+        strings = numbers_file.read().replace('[', ' ').replace(']', ' ').replace(',', ' ').split()
+    result = __benchmark_time(lambda: [Utils.num(s) for s in strings], repeat)
+    result['calls'] = len(strings)
+    result['calls_per_second'] = len(strings) / result['min_seconds']
+    return result
+
+
+# Times the KNN stages on a processed data file and a validation file.
+def __benchmark_knn(processed_data_file_path, validation_file_path, k, queries, repeat):
+    results = {}
+    loaded = []
+    results['knn_load_processed_data_and_dictionary'] = __benchmark_time(
+        lambda: loaded.append(KNNParser.knn_load_processed_data_and_dictionary(processed_data_file_path,
+                                                                               validation_file_path)), repeat)
+    tree, labels, validation_dictionary = loaded[-1]
+    results['training_instances'] = len(labels)
+    results['validation_instances'] = len(validation_dictionary)
+
+    timings = {}
+    KNNParser.knn_load_processed_data_tree(processed_data_file_path, timings)
+    dataset = Parser.load_numeric_file(processed_data_file_path)
+    features, features_labels = dataset[:, :-1], dataset[:, -1]
+    results['index_build'] = {
+        'kdtree_seconds': timings['index_build_seconds'],
+        'knn_index': __benchmark_time(lambda: KNNIndex.knn_index_build(features, features_labels), repeat),
+        'knn_ball_tree': __benchmark_time(lambda: KNNBallTree.knn_ball_tree_build(features, features_labels), repeat),
+        'knn_packed': __benchmark_time(lambda: KNNPacked.knn_packed_build(features, features_labels), repeat),
+    }
+
+    classes = sorted(set(int(label) for label in labels) | set(validation_dictionary.values()))
+    pairs = list(validation_dictionary.items())[:queries]
+    latencies = []
+    for instance, true_class in pairs:
+        start_time = time.perf_counter()
+        KNN.__knn_classify_instance(instance, true_class, [k], tree, labels, classes)
+        latencies.append(time.perf_counter() - start_time)
+    results['knn_query_latency'] = __benchmark_percentiles(latencies)
+    results['knn_query_latency']['k'] = k
+
+    index = KNNIndex.knn_index_build(features, features_labels)
+    latencies = []
+    for instance, _ in pairs:
+        start_time = time.perf_counter()
+        KNNIndex.knn_index_search(index, instance, k)
+        latencies.append(time.perf_counter() - start_time)
+    results['knn_index_search_latency'] = __benchmark_percentiles(latencies)
+    results['knn_index_search_latency']['k'] = k
+    query_matrix = numpy.array([instance for instance, _ in pairs], dtype=numpy.float64).reshape(len(pairs), -1)
+    results['knn_index_batch_search'] = {
+        'queries': len(pairs),
+        'k': k,
+        'one_at_a_time': __benchmark_time(lambda: [KNNIndex.knn_index_search(index, query, k)
+                                                   for query in query_matrix], repeat),
+        'batch': __benchmark_time(lambda: KNNIndex.knn_index_search_batch(index, query_matrix, k), repeat),
+    }
+
+    ball_tree = KNNBallTree.knn_ball_tree_build(features, features_labels)
+    latencies = []
+    for instance, _ in pairs:
+        start_time = time.perf_counter()
+        KNNBallTree.knn_ball_tree_search(ball_tree, instance, k)
+        latencies.append(time.perf_counter() - start_time)
+    results['knn_ball_tree_search_latency'] = __benchmark_percentiles(latencies)
+    results['knn_ball_tree_search_latency']['k'] = k
+    results['knn_ball_tree_batch_search'] = {
+        'queries': len(pairs),
+        'k': k,
+        'one_at_a_time': __benchmark_time(lambda: [KNNBallTree.knn_ball_tree_search(ball_tree, query, k)
+                                                   for query in query_matrix], repeat),
+        'batch': __benchmark_time(lambda: KNNBallTree.knn_ball_tree_search_batch(ball_tree, query_matrix, k), repeat),
+    }
+
+    # The binary attributes are the columns with only 0 and 1 in the training and the validation instances.
+    binary_columns = [column for column in range(features.shape[1]) if numpy.isin(features[:, column], [0, 1]).all()
+                      and numpy.isin(query_matrix[:, column], [0, 1]).all()]
+    packed = KNNPacked.knn_packed_build(features, features_labels, binary_columns)
+    squared_norms = numpy.einsum('ij,ij->i', features, features)
+    results['knn_block_search'] = {
+        'queries': len(pairs),
+        'k': k,
+        'binary_attributes': len(binary_columns),
+        'brute': __benchmark_time(lambda: KNN.__knn_search_block(query_matrix, k, features, squared_norms), repeat),
+        'packed': __benchmark_time(lambda: KNNPacked.knn_packed_search_block(packed, query_matrix, k), repeat),
+        'brute_bytes': features.nbytes + features_labels.nbytes,
+        'packed_bytes': KNNPacked.knn_packed_bytes(packed),
+    }
+    return results
+
+
+# Times the Naive Bayes stages on a distributions file and a validation set.
+# - 'load_validation' is a function that loads the validation instances.
+def __benchmark_naive_bayes(distributions_file_path, load_validation, repeat):
+    results = {}
+    loaded = []
+    results['naive_bayes_load_distributions'] = __benchmark_time(
+        lambda: loaded.append(NBParser.naive_bayes_load_distributions(distributions_file_path)), repeat)
+    distributions = loaded[-1]
+    validation_set = load_validation()
+    # The prior probabilities don't change the time of the classification.
+    classes_labels = list(range(len(distributions)))
+    classes_distributions = {label: 1 / len(classes_labels) for label in classes_labels}
+
+    classified = []
+    result = __benchmark_time(lambda: classified.append(NaiveBayes.naive_bayes_classify_dataset(
+        classes_distributions, distributions, classes_labels, validation_set)), repeat)
+    result['instances'] = len(validation_set)
+    result['rows_per_second'] = len(validation_set) / result['min_seconds']
+    results['naive_bayes_classify_dataset'] = result
+
+    classification = classified[-1]
+    result = __benchmark_time(lambda: Evaluator.evaluate_metrics(
+        Evaluator.evaluate_confusion_matrix(classification, classes_labels)), repeat)
+    result['instances'] = len(classification)
+    result['rows_per_second'] = len(classification) / result['min_seconds']
+    results['evaluation'] = result
+    return results
+
+
+# Runs all the stages on a real data set, skipping the ones whose files don't exist.
+def __benchmark_data_set(data_set_name, directory, options):
+    results = {}
+    knn_processed, knn_validation, naive_bayes_distributions, naive_bayes_validation = [
+        os.path.join(benchmarks_root_directory, file_name) for file_name in benchmarks_data_sets[data_set_name]]
+
+    missing = [file_path for file_path in [knn_processed, knn_validation] if not os.path.exists(file_path)]
+    if missing:
+        results['knn'] = {'skipped': 'missing ' + ', '.join(missing)}
+    else:
+        knn_processed = shutil.copy(knn_processed, directory)
+        knn_validation = shutil.copy(knn_validation, os.path.join(directory, 'knn_validation.data'))
+        results['num'] = __benchmark_num(knn_processed, options['repeat'])
+        results['knn'] = __benchmark_knn(knn_processed, knn_validation, options['k'], options['queries'],
+                                         options['repeat'])
+
+    missing = [file_path for file_path in [naive_bayes_distributions, naive_bayes_validation]
+               if not os.path.exists(file_path)]
+    if missing:
+        results['naive_bayes'] = {'skipped': 'missing ' + ', '.join(missing)}
+    else:
+        naive_bayes_validation = shutil.copy(naive_bayes_validation,
+                                             os.path.join(directory, 'naive_bayes_validation.data'))
+        results['naive_bayes'] = __benchmark_naive_bayes(
+            naive_bayes_distributions,
+            lambda: NBParser.naive_bayes_load_validation_instances(naive_bayes_validation), options['repeat'])
+    return results
+
+
+# Writes a file of instances in the format of the processed data and validation files.
+def __benchmark_write_instances(file_path, matrix, labels):
+    with open(file_path, 'w') as instances_file:
+        for row, label in zip(matrix.tolist(), labels.tolist()):
+            instances_file.write(str(row + [label]) + '\n')
+
+
+# Generates a synthetic data set with 'rows' training instances and 'queries' validation instances of 'dimensions'
+# attributes in [0, 1], around a random center for each class, and runs all the stages on it.
+def __benchmark_synthetic(rows, directory, options):
+    generator = numpy.random.default_rng(options['seed'])
+    dimensions, classes_number = options['dimensions'], options['classes']
+    centers = generator.random((classes_number, dimensions))
+    labels = generator.integers(0, classes_number, rows + options['queries'])
+    matrix = numpy.clip(centers[labels] + generator.normal(0, 0.1, (len(labels), dimensions)), 0, 1)
+    training, validation = matrix[:rows], matrix[rows:]
+    training_labels, validation_labels = labels[:rows], labels[rows:]
+
+    processed_data_file_path = os.path.join(directory, 'processed_data.data')
+    validation_file_path = os.path.join(directory, 'validation.data')
+    __benchmark_write_instances(processed_data_file_path, training, training_labels)
+    __benchmark_write_instances(validation_file_path, validation, validation_labels)
+
+    # Normal distribution of each attribute and class, in the format of the distributions files of NBParser.
+    distributions = {}
+    for c in range(classes_number):
+        class_rows = training[training_labels == c]
+        distributions[c] = {attribute: ('normal', {'mean': float(class_rows[:, attribute].mean()),
+                                                   'variance': float(class_rows[:, attribute].var(ddof=1))})
+                            for attribute in range(dimensions)}
+    distributions_file_path = os.path.join(directory, 'distributions.json')
+    with open(distributions_file_path, 'w') as distributions_file:
+        json.dump(distributions, distributions_file)
+    validation_set = [row + [label] for row, label in zip(validation.tolist(), validation_labels.tolist())]
+
+    return {
+        'rows': rows,
+        'dimensions': dimensions,
+        'classes': classes_number,
+        'num': __benchmark_num(processed_data_file_path, options['repeat']),
+        'knn': __benchmark_knn(processed_data_file_path, validation_file_path, options['k'], options['queries'],
+                               options['repeat']),
+        'naive_bayes': __benchmark_naive_bayes(distributions_file_path, lambda: validation_set, options['repeat']),
+    }
+
+
+# Returns the short hash of the current commit, or 'unknown' if it isn't a git repository.
+def __benchmark_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=benchmarks_root_directory,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# Runs the benchmarks. 'options' is a dictionary with the same keys as benchmarks_default_options, with the values
+# already converted. Returns the results as a dictionary.
+def benchmark_run(options):
+    results = {
+        'commit': __benchmark_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'machine': platform.machine(),
+        'options': options,
+        'data_sets': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for data_set_name in options['datasets']:
+            if data_set_name == 'synthetic':
+                for rows in options['rows']:
+                    name = 'synthetic_' + str(rows) + 'x' + str(options['dimensions'])
+                    print('Midiendo ' + name)
+                    os.mkdir(os.path.join(directory, name))
+                    results['data_sets'][name] = __benchmark_synthetic(rows, os.path.join(directory, name), options)
+            else:
+                print('Midiendo ' + data_set_name)
+                os.mkdir(os.path.join(directory, data_set_name))
+                results['data_sets'][data_set_name] = __benchmark_data_set(
+                    data_set_name, os.path.join(directory, data_set_name), options)
+    return results
+
+
+uso = """
+Invocar como:
+
+python3 benchmarks/Benchmarks.py [--datasets iris,covtype,synthetic] [--rows 1000,10000] [--dimensions 8]
+      [--classes 7] [--queries 1000] [--k 7] [--repeat 3] [--seed 0] [--output archivo.json]
+
+donde:
+
+- --datasets indica los data sets a medir, separados por comas. Los data sets
+reales cuyos archivos procesados no existen se omiten.
+- --rows indica las cantidades de instancias de entrenamiento de los data sets
+sintéticos, separadas por comas, y --dimensions y --classes su cantidad de
+atributos y de clases.
+- --queries indica la cantidad de instancias de validación de los data sets
+sintéticos, y la cantidad máxima de instancias usadas para medir la latencia.
+- --repeat indica cuántas veces se repite cada medición.
+- --output indica el archivo de resultados. Por defecto es
+benchmarks/results/<commit>.json.
+"""
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    options = dict(benchmarks_default_options)
+    output_file_path = None
+    while arguments:
+        if len(arguments) < 2 or not arguments[0].startswith('--') or \
+                arguments[0][2:] not in list(benchmarks_default_options) + ['output']:
+            print(uso)
+            exit()
+        if arguments[0] == '--output':
+            output_file_path = arguments[1]
+        else:
+            options[arguments[0][2:]] = arguments[1]
+        del arguments[:2]
+    try:
+        options['datasets'] = options['datasets'].split(',')
+        options['rows'] = [int(rows) for rows in options['rows'].split(',')]
+        for name in ['dimensions', 'classes', 'queries', 'k', 'repeat', 'seed']:
+            options[name] = int(options[name])
+    except ValueError:
+        print(uso)
+        exit()
+    if any(name not in list(benchmarks_data_sets) + ['synthetic'] for name in options['datasets']):
+        print(uso)
+        exit()
+
+    os.chdir(benchmarks_root_directory)
+    results = benchmark_run(options)
+    if output_file_path is None:
+        os.makedirs(benchmarks_results_directory, exist_ok=True)
+        output_file_path = os.path.join(benchmarks_results_directory, results['commit'] + '.json')
+    with open(output_file_path, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print('Los resultados estan en ' + output_file_path)